@@ -0,0 +1,361 @@
+"""
+Shared pieces for the benchmark and load-generation tools: synthetic inputs and model
+artifacts, offline stand-ins for Azure AI Search and Azure OpenAI, latency statistics,
+and an in-process API server wired to those stand-ins.
+"""
+import io
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import pickle
+import hashlib
+import platform
+import threading
+import subprocess
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+import numpy as np
+
+# Add project root to path so the API package can be imported
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(PROJECT_ROOT))
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+NEIGHBOURHOODS = [
+    "JARDIM DA PENHA", "MARIA ORTIZ", "RESISTÊNCIA", "JARDIM CAMBURI", "CENTRO",
+    "ITARARÉ", "TABUAZEIRO", "SANTA MARTHA", "JESUS DE NAZARETH", "BONFIM",
+]
+
+CHAT_QUESTIONS = [
+    "What is the first-line antibiotic for community-acquired pneumonia?",
+    "How is CURB-65 used to decide on hospital admission?",
+    "When should a chest X-ray be repeated after pneumonia treatment?",
+    "What are the signs of a tension pneumothorax?",
+    "How is pleural effusion managed in heart failure?",
+    "What oxygen saturation target is recommended for COPD patients?",
+    "Which findings suggest cardiomegaly on a chest radiograph?",
+    "What is the recommended follow-up for a solitary pulmonary nodule?",
+]
+
+_TOPICS = ["pneumonia", "pneumothorax", "pleural effusion", "cardiomegaly", "pulmonary nodule",
+           "COPD exacerbation", "atelectasis", "pulmonary edema", "emphysema", "sepsis"]
+_ACTIONS = ["Assess severity with CURB-65", "Obtain a chest radiograph", "Start empirical antibiotics",
+            "Monitor oxygen saturation", "Arrange follow-up imaging in six weeks", "Consider CT if unresolved",
+            "Check blood cultures before antibiotics", "Escalate to critical care if hypotensive"]
+
+FEATURE_COLUMNS = [
+    'gender', 'age', 'neighbourhood', 'scholarship', 'hipertension',
+    'diabetes', 'alcoholism', 'handcap', 'sms_received',
+    'scheduled_year', 'scheduled_month', 'scheduled_day', 'scheduled_weekday', 'lead_days'
+]
+
+
+# Synthetic inputs
+
+def synthetic_xray(rng: np.random.Generator, size: int = 512) -> bytes:
+    """A grayscale PNG shaped roughly like a chest film: bright mediastinum, darker lung fields, noise."""
+    from PIL import Image
+
+    y, x = np.mgrid[0:size, 0:size] / size
+    lungs = np.exp(-((x - 0.3) ** 2 + (y - 0.5) ** 2) / 0.03) + np.exp(-((x - 0.7) ** 2 + (y - 0.5) ** 2) / 0.03)
+    image = 200 - 120 * lungs + 40 * np.exp(-((x - 0.5) ** 2) / 0.005) + rng.normal(0, 12, (size, size))
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(image, 0, 255).astype(np.uint8), mode="L").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def synthetic_patient(rng: np.random.Generator) -> dict:
+    """A PatientData payload (see src/api/main.py) with realistic value ranges."""
+    scheduled = date(2025, 1, 1) + timedelta(days=int(rng.integers(0, 300)))
+    lead_days = 0 if rng.random() < 0.35 else int(rng.integers(1, 60))
+    return {
+        "gender": "F" if rng.random() < 0.65 else "M",
+        "age": int(rng.integers(0, 95)),
+        "neighbourhood": NEIGHBOURHOODS[int(rng.integers(0, len(NEIGHBOURHOODS)))],
+        "scholarship": int(rng.random() < 0.1),
+        "hipertension": int(rng.random() < 0.2),
+        "diabetes": int(rng.random() < 0.07),
+        "alcoholism": int(rng.random() < 0.03),
+        "handcap": int(rng.random() < 0.02),
+        "sms_received": int(rng.random() < 0.32),
+        "scheduledday": scheduled.isoformat(),
+        "appointmentday": (scheduled + timedelta(days=lead_days)).isoformat(),
+    }
+
+
+def synthetic_question(rng: np.random.Generator) -> str:
+    return CHAT_QUESTIONS[int(rng.integers(0, len(CHAT_QUESTIONS)))]
+
+
+def synthetic_corpus(rng: np.random.Generator, n_chunks: int = 500) -> list:
+    """Guideline-like text chunks for the search stand-in."""
+    chunks = []
+    for i in range(n_chunks):
+        topic = _TOPICS[i % len(_TOPICS)]
+        steps = rng.choice(_ACTIONS, size=4, replace=False)
+        chunks.append(
+            f"Guideline {i} on {topic}. " + ". ".join(steps) + f". Document findings related to {topic} "
+            f"and review the patient within {int(rng.integers(1, 14))} days."
+        )
+    return chunks
+
+
+# Synthetic model artifacts
+
+def write_synthetic_models(models_dir: Path, seed: int = 0) -> Path:
+    """
+    Writes stand-in artifacts with the production layout to `models_dir`: randomly
+    initialized ResNet50 weights, two small LightGBM boosters and a feature schema.
+    Latency is representative (same architecture and tree sizes); predictions are not.
+    """
+    import torch
+    import lightgbm as lgb
+    from src.api.core.vision_precision import build_resnet50
+
+    models_dir = Path(models_dir)
+    models_dir.mkdir(parents=True, exist_ok=True)
+
+    vision_path = models_dir / "vision_model.pth"
+    if not vision_path.exists():
+        torch.manual_seed(seed)
+        torch.save(build_resnet50(num_labels=15).state_dict(), vision_path)
+
+    model_path = models_dir / "no_show_model.pkl"
+    if not model_path.exists():
+        rng = np.random.default_rng(seed)
+        X = rng.integers(0, 60, size=(4000, len(FEATURE_COLUMNS))).astype(np.float64)
+        y = (rng.random(4000) < 0.2).astype(int)
+        params = {"objective": "binary", "num_leaves": 31, "learning_rate": 0.05, "verbose": -1}
+        boosters = {
+            name: lgb.train(params, lgb.Dataset(X, y), num_boost_round=50)
+            for name in ("same_day_model", "future_model")
+        }
+        with open(model_path, "wb") as f:
+            pickle.dump(boosters, f)
+
+    schema = {
+        "schema_version": 1,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "features": FEATURE_COLUMNS,
+        "categorical_mappings": {"neighbourhood": {name: code for code, name in enumerate(NEIGHBOURHOODS)}},
+        "lead_day_split": {"feature": "lead_days", "same_day_max_lead_days": 0,
+                           "same_day_model": "same_day_model", "future_model": "future_model"},
+    }
+    (models_dir / "no_show_feature_schema.json").write_text(json.dumps(schema, indent=2))
+    return models_dir
+
+
+# Offline stand-ins for the external services
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic bag-of-words embeddings (hashed into `dimensions`); no model download."""
+
+    def __init__(self, dimensions: int = 384):
+        self.dimensions = dimensions
+
+    def _embed(self, text: str) -> list:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in text.lower().split():
+            digest = hashlib.md5(word.strip(".,?").encode()).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.dimensions] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: list) -> list:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list:
+        return self._embed(text)
+
+
+class InMemorySearch:
+    """
+    Stand-in for Azure AI Search: brute-force cosine search over an in-memory corpus,
+    plus a simulated network round trip (`latency_ms`) on every query.
+    """
+
+    def __init__(self, texts: list, embeddings: Embeddings, latency_ms: float = 30.0):
+        self.embeddings = embeddings
+        self.latency = latency_ms / 1000.0
+        self.documents = [Document(page_content=text, metadata={"source": f"synthetic-{i}"})
+                          for i, text in enumerate(texts)]
+        self.vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+
+    def refresh(self) -> str:
+        return f"synthetic:{len(self.documents)}"
+
+    def _top(self, embedding, k: int) -> list:
+        scores = self.vectors @ np.asarray(embedding, dtype=np.float32)
+        top = np.argsort(-scores)[:k]
+        return [self.documents[i] for i in top]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4) -> list:
+        time.sleep(self.latency)
+        return self._top(embedding, k)
+
+    def similarity_search(self, query: str, k: int = 4) -> list:
+        return self.similarity_search_by_vector(self.embeddings.embed_query(query), k)
+
+    async def asimilarity_search_by_vector(self, embedding, k: int = 4) -> list:
+        await asyncio.sleep(self.latency)
+        return self._top(embedding, k)
+
+    async def asimilarity_search(self, query: str, k: int = 4) -> list:
+        return await self.asimilarity_search_by_vector(self.embeddings.embed_query(query), k)
+
+
+class FakeChatModel:
+    """
+    Stand-in for AzureChatOpenAI with the invoke/ainvoke/stream/astream surface RAGService
+    uses. Latency is modelled as time-to-first-token plus a fixed time per output token.
+    """
+
+    def __init__(self, first_token_ms: float = 300.0, per_token_ms: float = 20.0, tokens: int = 60):
+        self.first_token = first_token_ms / 1000.0
+        self.per_token = per_token_ms / 1000.0
+        self.tokens = tokens
+
+    def _pieces(self, messages) -> list:
+        question = messages[-1].content.rsplit("Question:", 1)[-1].strip()
+        words = (f"Based on the provided guidelines regarding {question} " * self.tokens).split()[:self.tokens]
+        return [word + " " for word in words]
+
+    def invoke(self, messages):
+        time.sleep(self.first_token + self.per_token * self.tokens)
+        return AIMessage(content="".join(self._pieces(messages)))
+
+    async def ainvoke(self, messages):
+        await asyncio.sleep(self.first_token + self.per_token * self.tokens)
+        return AIMessage(content="".join(self._pieces(messages)))
+
+    def stream(self, messages):
+        time.sleep(self.first_token)
+        for piece in self._pieces(messages):
+            time.sleep(self.per_token)
+            yield AIMessageChunk(content=piece)
+
+    async def astream(self, messages):
+        await asyncio.sleep(self.first_token)
+        for piece in self._pieces(messages):
+            await asyncio.sleep(self.per_token)
+            yield AIMessageChunk(content=piece)
+
+
+def build_offline_rag_service(executor=None, corpus_size: int = 500, search_latency_ms: float = 30.0,
+                              llm_first_token_ms: float = 300.0, llm_per_token_ms: float = 20.0, seed: int = 0):
+    """RAGService wired to the hashing embeddings, search stand-in and fake LLM."""
+    from src.api.services.rag_service import RAGService
+
+    embeddings = HashingEmbeddings()
+    store = InMemorySearch(synthetic_corpus(np.random.default_rng(seed), corpus_size), embeddings, search_latency_ms)
+    llm = FakeChatModel(llm_first_token_ms, llm_per_token_ms)
+    return RAGService(executor=executor, embeddings=embeddings, vector_store=store, llm=llm)
+
+
+def configure_offline_environment(models_dir: Path, disable_caches: bool = True):
+    """Environment for services built from synthetic artifacts with no Azure access."""
+    os.environ["MODELS_DIR"] = str(models_dir)
+    # No SAS token: AzureModelLoader skips the download
+    os.environ["SAS_TOKEN"] = ""
+    os.environ.setdefault("RAG_RETRIEVAL_MODE", "dense")
+    if disable_caches:
+        # Measure the inference paths themselves, not cache hits
+        os.environ["VISION_CACHE_SIZE"] = "0"
+        os.environ["RAG_CACHE_SIZE"] = "0"
+
+
+# Statistics
+
+def percentile(sorted_values: list, q: float) -> float:
+    """Linear-interpolated percentile of an already sorted list (q in 0-100)."""
+    if not sorted_values:
+        return float("nan")
+    position = (len(sorted_values) - 1) * q / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(latencies: list, errors: int, wall_seconds: float, items_per_call: int = 1) -> dict:
+    """Latency percentiles (ms), error count and throughput for one measured run."""
+    values = sorted(latencies)
+    calls = len(values) + errors
+    return {
+        "calls": calls,
+        "errors": errors,
+        "error_rate": errors / calls if calls else 0.0,
+        "throughput_per_s": len(values) * items_per_call / wall_seconds if wall_seconds > 0 else 0.0,
+        "mean_ms": float(np.mean(values) * 1000) if values else float("nan"),
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "max_ms": values[-1] * 1000 if values else float("nan"),
+    }
+
+
+def environment_info() -> dict:
+    """Where a result came from, so runs on different machines are not compared blindly."""
+    import torch
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                                capture_output=True, text=True, timeout=5).stdout.strip()
+    except Exception:
+        commit = None
+    return {
+        "git_commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+    }
+
+
+# In-process API server
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LocalAPIServer:
+    """
+    Runs src/api/main.py under uvicorn in a background thread. The RAG service is built
+    with the offline stand-ins; vision and operations load whatever MODELS_DIR holds.
+    """
+
+    def __init__(self, rag_options: dict = None, port: int = None):
+        self.rag_options = rag_options or {}
+        self.port = port or free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self._server = None
+        self._thread = None
+
+    def __enter__(self):
+        import uvicorn
+        import src.api.main as api
+
+        options = self.rag_options
+        api.RAGService = lambda executor=None: build_offline_rag_service(executor=executor, **options)
+        config = uvicorn.Config(api.app, host="127.0.0.1", port=self.port, log_level="warning")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, name="benchmark-api", daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + 300
+        while not self._server.started:
+            if not self._thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError("The API server did not start.")
+            time.sleep(0.1)
+        return self
+
+    def __exit__(self, *exc):
+        self._server.should_exit = True
+        self._thread.join(timeout=30)
@@ -0,0 +1,320 @@
+import json
+import math
+import time
+import asyncio
+import argparse
+import tempfile
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+import numpy as np
+import httpx
+
+from common import (
+    PROJECT_ROOT, LocalAPIServer, configure_offline_environment, environment_info, summarize,
+    synthetic_patient, synthetic_question, synthetic_xray, write_synthetic_models,
+)
+
+# Request kinds, built on the contracts in src/api/main.py
+ENDPOINTS = {
+    "vision": "/predict/vision",
+    "no-show": "/predict/no-show",
+    "no-show-batch": "/predict/no-show/batch",
+    "chat": "/predict/chat",
+}
+DEFAULT_MIX = "vision=1,no-show=6,no-show-batch=0.5,chat=2"
+# Distinct payloads generated up front per kind, so generation cost stays out of the send loop
+PAYLOAD_POOL_SIZE = 200
+ROSTER_SIZE = 50
+
+
+def parse_weights(text: str, names) -> dict:
+    """"vision=1,chat=2" -> {"vision": 1.0, "chat": 2.0}; names must be known."""
+    weights = {}
+    for item in filter(None, text.split(",")):
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if name not in names:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint '{name}'. Choose from {', '.join(names)}.")
+        weights[name] = float(value)
+    return weights
+
+
+class Payloads:
+    """Pre-generated request bodies per kind, handed out round-robin."""
+
+    def __init__(self, kinds, rng: np.random.Generator, image_size: int = 512):
+        self._pools = {}
+        self._next = Counter()
+        if "vision" in kinds:
+            self._pools["vision"] = [
+                {"files": {"file": ("xray.png", synthetic_xray(rng, image_size), "image/png")}}
+                for _ in range(PAYLOAD_POOL_SIZE)
+            ]
+        if "no-show" in kinds:
+            self._pools["no-show"] = [{"json": synthetic_patient(rng)} for _ in range(PAYLOAD_POOL_SIZE)]
+        if "no-show-batch" in kinds:
+            self._pools["no-show-batch"] = [
+                {"json": {"patients": [synthetic_patient(rng) for _ in range(ROSTER_SIZE)]}}
+                for _ in range(PAYLOAD_POOL_SIZE // 10)
+            ]
+        if "chat" in kinds:
+            self._pools["chat"] = [{"json": {"message": synthetic_question(rng)}} for _ in range(PAYLOAD_POOL_SIZE)]
+
+    def next(self, kind: str) -> dict:
+        pool = self._pools[kind]
+        index = self._next[kind] % len(pool)
+        self._next[kind] += 1
+        return pool[index]
+
+
+async def send(client: httpx.AsyncClient, kind: str, payloads: Payloads, records: list):
+    """One request; records (kind, latency seconds, outcome) where outcome is a status code or error name."""
+    start = time.perf_counter()
+    try:
+        response = await client.post(ENDPOINTS[kind], **payloads.next(kind))
+        outcome = response.status_code
+    except httpx.TimeoutException:
+        outcome = "timeout"
+    except httpx.HTTPError as e:
+        outcome = type(e).__name__
+    records.append((kind, time.perf_counter() - start, outcome))
+
+
+async def run_open_stage(client, rate: float, duration: float, mix: dict, payloads: Payloads,
+                         rng: np.random.Generator, arrival: str, max_in_flight: int) -> list:
+    """
+    Open loop: requests start on an arrival schedule (Poisson or evenly spaced) whether or
+    not earlier ones finished, so a slow server builds a queue instead of slowing the load.
+    Arrivals beyond `max_in_flight` outstanding requests are counted as "dropped".
+    """
+    kinds = list(mix)
+    probabilities = np.array([mix[kind] for kind in kinds]) / sum(mix.values())
+    loop = asyncio.get_running_loop()
+    records, tasks = [], set()
+    start = loop.time()
+    next_at = start
+    while True:
+        next_at += rng.exponential(1.0 / rate) if arrival == "poisson" else 1.0 / rate
+        if next_at - start >= duration:
+            break
+        await asyncio.sleep(max(0.0, next_at - loop.time()))
+        kind = kinds[rng.choice(len(kinds), p=probabilities)]
+        if len(tasks) >= max_in_flight:
+            records.append((kind, 0.0, "dropped"))
+            continue
+        task = asyncio.create_task(send(client, kind, payloads, records))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+    return records
+
+
+async def run_closed_stage(client, users: int, duration: float, mix: dict, payloads: Payloads,
+                           rng: np.random.Generator) -> list:
+    """Closed loop: `users` virtual clients, each sending its next request when the last one returns."""
+    kinds = list(mix)
+    probabilities = np.array([mix[kind] for kind in kinds]) / sum(mix.values())
+    loop = asyncio.get_running_loop()
+    end = loop.time() + duration
+    records = []
+
+    async def user():
+        while loop.time() < end:
+            await send(client, kinds[rng.choice(len(kinds), p=probabilities)], payloads, records)
+
+    await asyncio.gather(*(user() for _ in range(users)))
+    return records
+
+
+def report_stage(records: list, wall_seconds: float) -> dict:
+    """Overall and per-endpoint latency, throughput and error breakdown for one stage."""
+    def section(rows):
+        ok = [latency for _, latency, outcome in rows if outcome == 200]
+        errors = Counter(str(outcome) for _, _, outcome in rows if outcome != 200)
+        summary = summarize(ok, sum(errors.values()), wall_seconds)
+        summary["errors_by_type"] = dict(errors)
+        return summary
+
+    endpoints = {}
+    for kind in sorted({kind for kind, _, _ in records}):
+        endpoints[kind] = section([row for row in records if row[0] == kind])
+    return {"overall": section(records), "endpoints": endpoints}
+
+
+def is_healthy(stage: dict, offered_rate: float, args) -> tuple:
+    """
+    (healthy, reasons): error rate, p95 SLO and, for open loop, keeping up with the offered rate.
+    Served throughput includes the drain after the last arrival, so stages should last
+    well beyond the slowest endpoint's latency (the 30 s default does for the offline mocks).
+    """
+    overall = stage["overall"]
+    reasons = []
+    if overall["error_rate"] > args.max_error_rate:
+        reasons.append(f"error rate {overall['error_rate']:.1%}")
+    if overall["p95_ms"] > args.slo_p95_ms:
+        reasons.append(f"p95 {overall['p95_ms']:.0f} ms > {args.slo_p95_ms:.0f} ms")
+    if offered_rate and overall["throughput_per_s"] < 0.9 * offered_rate:
+        reasons.append(f"served {overall['throughput_per_s']:.1f}/s of {offered_rate:.1f}/s offered")
+    return not reasons, reasons
+
+
+def print_stage(label: str, stage: dict, healthy: bool, reasons: list):
+    overall = stage["overall"]
+    status = "ok" if healthy else "SATURATED (" + "; ".join(reasons) + ")"
+    print(f"\n{label}: {overall['throughput_per_s']:.1f} req/s served, p95 {overall['p95_ms']:.0f} ms, "
+          f"errors {overall['error_rate']:.1%} -> {status}")
+    for kind, summary in stage["endpoints"].items():
+        print(f"  {kind:<14} {summary['calls']:>6} calls  p50 {summary['p50_ms']:>8.1f} ms  "
+              f"p95 {summary['p95_ms']:>8.1f} ms  p99 {summary['p99_ms']:>8.1f} ms  "
+              f"errors {summary['error_rate']:.1%} {summary['errors_by_type'] or ''}")
+
+
+async def run(args, base_url: str) -> dict:
+    mix = parse_weights(args.mix, ENDPOINTS)
+    rng = np.random.default_rng(args.seed)
+    payloads = Payloads(mix, rng, args.image_size)
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    stages = []
+    # Highest healthy stage before the first unhealthy one; `saturated` is False if none broke
+    saturation = None
+    saturated = False
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        if args.mode == "open":
+            if args.rates:
+                rates = [float(rate) for rate in args.rates.split(",")]
+            else:
+                # Geometric search from --start-rate
+                rate = args.start_rate
+                while rate <= args.max_rate:
+                    rates.append(rate)
+                    rate *= args.growth
+            for rate in rates:
+                started = time.perf_counter()
+                records = await run_open_stage(client, rate, args.stage_seconds, mix, payloads, rng,
+                                               args.arrival, args.max_in_flight)
+                stage = report_stage(records, time.perf_counter() - started)
+                # Poisson arrivals scatter around the nominal rate; judge against what was actually sent
+                arrival_rate = len(records) / args.stage_seconds
+                healthy, reasons = is_healthy(stage, arrival_rate, args)
+                stages.append({"offered_rate": rate, "arrival_rate": arrival_rate, "healthy": healthy,
+                               "reasons": reasons, **stage})
+                print_stage(f"{rate:.1f} req/s offered", stage, healthy, reasons)
+                if not healthy:
+                    saturated = True
+                    break
+                saturation = {"offered_rate": rate, "served_rate": stage["overall"]["throughput_per_s"]}
+        else:
+            previous = 0.0
+            for users in [int(users) for users in args.concurrency.split(",")]:
+                started = time.perf_counter()
+                records = await run_closed_stage(client, users, args.stage_seconds, mix, payloads, rng)
+                stage = report_stage(records, time.perf_counter() - started)
+                healthy, reasons = is_healthy(stage, 0.0, args)
+                served = stage["overall"]["throughput_per_s"]
+                # Past the knee, more users only add queueing: throughput stops growing
+                if healthy and previous and served < previous * 1.05:
+                    healthy, reasons = False, [f"throughput flat ({served:.1f}/s vs {previous:.1f}/s)"]
+                stages.append({"users": users, "healthy": healthy, "reasons": reasons, **stage})
+                print_stage(f"{users} users", stage, healthy, reasons)
+                if not healthy:
+                    saturated = True
+                    break
+                saturation = {"users": users, "served_rate": served}
+                previous = served
+
+    return {"mix": mix, "stages": stages, "saturation": saturation, "saturated": saturated}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replays a mix of vision, no-show and chat requests against the API, stage by stage, "
+                    "and reports per-endpoint latency and errors plus the highest sustainable load."
+    )
+    parser.add_argument("--base-url", help="API to load (default: start one in-process on offline mocks).")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Endpoint weights (default: {DEFAULT_MIX}).")
+    parser.add_argument("--mode", choices=["open", "closed"], default="open",
+                        help="open: fixed arrival rates; closed: ramping concurrent users.")
+    parser.add_argument("--rates", help="Comma-separated open-loop rates in req/s (default: search for saturation).")
+    parser.add_argument("--start-rate", type=float, default=2.0)
+    parser.add_argument("--growth", type=float, default=1.5, help="Rate multiplier between search stages.")
+    parser.add_argument("--max-rate", type=float, default=500.0)
+    parser.add_argument("--arrival", choices=["poisson", "constant"], default="poisson")
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32", help="Closed-loop user counts to ramp through.")
+    parser.add_argument("--stage-seconds", type=float, default=30.0)
+    parser.add_argument("--max-in-flight", type=int, default=512, help="Outstanding requests before arrivals are dropped.")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--slo-p95-ms", type=float, default=2000.0, help="Overall p95 latency a healthy stage must meet.")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--clinic-rps", type=float, help="Expected peak load; prints the replicas needed to serve it.")
+    parser.add_argument("--headroom", type=float, default=0.7, help="Fraction of saturation each replica is planned at.")
+    parser.add_argument("--image-size", type=int, default=512)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--models-dir", help="Model artifacts for the in-process API (default: synthetic).")
+    parser.add_argument("--keep-caches", action="store_true", help="Leave the in-process API's answer caches enabled.")
+    parser.add_argument("--search-latency-ms", type=float, default=30.0, help="Simulated Azure AI Search round trip.")
+    parser.add_argument("--llm-first-token-ms", type=float, default=300.0)
+    parser.add_argument("--llm-per-token-ms", type=float, default=20.0)
+    parser.add_argument("--output", help="Report JSON (default: benchmarks/results/load_<timestamp>.json).")
+    args = parser.parse_args()
+
+    server = None
+    if not args.base_url:
+        models_dir = Path(args.models_dir) if args.models_dir else Path(tempfile.mkdtemp(prefix="load-models-"))
+        if not args.models_dir:
+            print(f"Writing synthetic model artifacts to {models_dir}")
+            write_synthetic_models(models_dir, seed=args.seed)
+        configure_offline_environment(models_dir, disable_caches=not args.keep_caches)
+        server = LocalAPIServer({
+            "search_latency_ms": args.search_latency_ms,
+            "llm_first_token_ms": args.llm_first_token_ms,
+            "llm_per_token_ms": args.llm_per_token_ms,
+            "seed": args.seed,
+        }).__enter__()
+        print(f"Started offline API at {server.base_url}")
+
+    try:
+        result = asyncio.run(run(args, args.base_url or server.base_url))
+    finally:
+        if server is not None:
+            server.__exit__(None, None, None)
+
+    saturation = result["saturation"]
+    print()
+    if saturation is None:
+        print("Even the first stage was unhealthy; lower --start-rate / --concurrency or relax the SLO.")
+    else:
+        stage = (f"{saturation['offered_rate']:.1f} req/s offered" if "offered_rate" in saturation
+                 else f"{saturation['users']} users")
+        if not result["saturated"]:
+            # Capacity is only known to be at least this much, so a replica count would overestimate it
+            print(f"No saturation reached: every stage was healthy up to {stage} "
+                  f"({saturation['served_rate']:.1f} req/s served, a lower bound on per-replica capacity).")
+            if args.clinic_rps:
+                print("Skipping the replica estimate; raise --max-rate, --rates or --concurrency until a stage saturates.")
+        else:
+            print(f"Highest healthy stage: {stage}, {saturation['served_rate']:.1f} req/s served per replica.")
+            if args.clinic_rps:
+                replicas = math.ceil(args.clinic_rps / (saturation["served_rate"] * args.headroom))
+                result["replicas_needed"] = replicas
+                print(f"{args.clinic_rps:.1f} req/s at {args.headroom:.0%} headroom needs {replicas} replica(s).")
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "environment": environment_info(),
+        "target": args.base_url or "in-process offline API",
+        "config": vars(args),
+        **result,
+    }
+    output = Path(args.output) if args.output else (
+        PROJECT_ROOT / "benchmarks" / "results" / f"load_{datetime.now().strftime('%Y%m%dT%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Report written to {output}")
+
+
+if __name__ == "__main__":
+    main()
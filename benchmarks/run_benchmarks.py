@@ -0,0 +1,235 @@
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+import numpy as np
+
+from common import (
+    PROJECT_ROOT, LocalAPIServer, build_offline_rag_service, configure_offline_environment,
+    environment_info, summarize, synthetic_patient, synthetic_question, synthetic_xray, write_synthetic_models,
+)
+
+SUITES = ("vision", "operations", "rag")
+MODES = ("inprocess", "http")
+# Patients per call in the batch scoring cases
+ROSTER_SIZE = 100
+# Relative p95 increase (or throughput drop) against --baseline counted as a regression
+DEFAULT_MAX_REGRESSION = 0.20
+
+
+def measure(call, payloads: list, concurrency: int, warmup: int, items_per_call: int = 1) -> dict:
+    """Runs `call` over `payloads` from `concurrency` threads (closed loop) and summarizes latency."""
+    for payload in payloads[:warmup]:
+        try:
+            call(payload)
+        except Exception:
+            pass
+
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def timed(payload):
+        start = time.perf_counter()
+        try:
+            call(payload)
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+            return
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, payloads[warmup:]))
+    wall = time.perf_counter() - start
+
+    result = summarize(latencies, len(errors), wall, items_per_call)
+    if errors:
+        result["first_error"] = errors[0][:300]
+    return result
+
+
+class HTTPClient:
+    """One requests.Session per worker thread; non-2xx responses raise."""
+
+    def __init__(self, base_url: str, timeout: float = 120.0):
+        import requests
+
+        self._requests = requests
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def post(self, path: str, **kwargs):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = self._requests.Session()
+        response = session.post(f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+        return response
+
+
+def build_cases(suites: list, args, rng: np.random.Generator) -> list:
+    """(suite, name, in-process call factory, HTTP call factory, payloads, items per call) for each case."""
+    n = args.requests + args.warmup
+    cases = []
+    if "vision" in suites:
+        # Distinct images, so nothing is served from a cache
+        images = [synthetic_xray(rng, args.image_size) for _ in range(n)]
+        cases.append(("vision", "vision.predict",
+                      lambda services: services["vision"].predict,
+                      lambda client: lambda image: client.post(
+                          "/predict/vision", files={"file": ("xray.png", image, "image/png")}),
+                      images, 1))
+    if "operations" in suites:
+        patients = [synthetic_patient(rng) for _ in range(n)]
+        rosters = [[synthetic_patient(rng) for _ in range(ROSTER_SIZE)] for _ in range(max(n // 10, args.warmup + 5))]
+        cases.append(("operations", "operations.predict",
+                      lambda services: services["operations"].predict,
+                      lambda client: lambda patient: client.post("/predict/no-show", json=patient),
+                      patients, 1))
+        cases.append(("operations", "operations.predict_batch",
+                      lambda services: services["operations"].predict_batch,
+                      lambda client: lambda roster: client.post("/predict/no-show/batch", json={"patients": roster}),
+                      rosters, ROSTER_SIZE))
+    if "rag" in suites:
+        questions = [synthetic_question(rng) for _ in range(n)]
+        cases.append(("rag", "rag.retrieve",
+                      lambda services: services["rag"].retrieve,
+                      None,
+                      questions, 1))
+        cases.append(("rag", "rag.process_query",
+                      lambda services: services["rag"].process_query,
+                      lambda client: lambda question: client.post("/predict/chat", json={"message": question}),
+                      questions, 1))
+    return cases
+
+
+def build_services(suites: list, rag_options: dict) -> dict:
+    """Services constructed exactly as the API does, from MODELS_DIR and the environment."""
+    services = {}
+    if "vision" in suites:
+        from src.api.services.vision_service import VisionService
+        services["vision"] = VisionService()
+    if "operations" in suites:
+        from src.api.services.operations_service import OperationsService
+        services["operations"] = OperationsService()
+    if "rag" in suites:
+        services["rag"] = build_offline_rag_service(**rag_options)
+    return services
+
+
+def compare(results: list, baseline_path: Path, max_regression: float) -> list:
+    """Cases whose p95 latency grew, or throughput fell, by more than `max_regression`."""
+    baseline = {(r["name"], r["mode"]): r for r in json.loads(baseline_path.read_text())["results"]}
+    regressions = []
+    print(f"\nComparison with {baseline_path}")
+    for result in results:
+        previous = baseline.get((result["name"], result["mode"]))
+        if previous is None:
+            continue
+        p95_change = result["p95_ms"] / previous["p95_ms"] - 1 if previous["p95_ms"] else 0.0
+        throughput_change = (result["throughput_per_s"] / previous["throughput_per_s"] - 1
+                             if previous["throughput_per_s"] else 0.0)
+        flag = p95_change > max_regression or throughput_change < -max_regression
+        print(f"  {result['name']:<26} {result['mode']:<10} p95 {p95_change:+.1%}  "
+              f"throughput {throughput_change:+.1%}{'  REGRESSION' if flag else ''}")
+        if flag:
+            regressions.append(f"{result['name']} ({result['mode']})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Throughput and p50/p95/p99 latency for the vision, operations and RAG paths, "
+                    "in-process and through the HTTP API. Runs offline on synthetic data by default."
+    )
+    parser.add_argument("--suites", nargs="+", default=list(SUITES), choices=SUITES)
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    parser.add_argument("--requests", type=int, default=200, help="Measured calls per case.")
+    parser.add_argument("--warmup", type=int, default=10, help="Unmeasured calls before each case.")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--image-size", type=int, default=512, help="Side of the synthetic X-rays in pixels.")
+    parser.add_argument("--models-dir", help="Real model artifacts to load (default: synthetic ones in a temp dir).")
+    parser.add_argument("--keep-caches", action="store_true", help="Leave the vision and RAG answer caches enabled.")
+    parser.add_argument("--base-url", help="Benchmark an already running API instead of starting one in-process.")
+    parser.add_argument("--search-latency-ms", type=float, default=30.0, help="Simulated Azure AI Search round trip.")
+    parser.add_argument("--llm-first-token-ms", type=float, default=300.0)
+    parser.add_argument("--llm-per-token-ms", type=float, default=20.0)
+    parser.add_argument("--output", help="Result JSON (default: benchmarks/results/<timestamp>.json).")
+    parser.add_argument("--baseline", help="Earlier result JSON to compare against; exits 1 on regressions.")
+    parser.add_argument("--max-regression", type=float, default=DEFAULT_MAX_REGRESSION)
+    args = parser.parse_args()
+
+    models_dir = Path(args.models_dir) if args.models_dir else Path(tempfile.mkdtemp(prefix="benchmark-models-"))
+    if not args.models_dir and ({"vision", "operations"} & set(args.suites)):
+        print(f"Writing synthetic model artifacts to {models_dir}")
+        write_synthetic_models(models_dir, seed=args.seed)
+    configure_offline_environment(models_dir, disable_caches=not args.keep_caches)
+
+    rag_options = {
+        "search_latency_ms": args.search_latency_ms,
+        "llm_first_token_ms": args.llm_first_token_ms,
+        "llm_per_token_ms": args.llm_per_token_ms,
+        "seed": args.seed,
+    }
+    rng = np.random.default_rng(args.seed)
+    cases = build_cases(args.suites, args, rng)
+    results = []
+
+    def record(name: str, mode: str, summary: dict):
+        results.append({"name": name, "mode": mode, **summary})
+        print(f"  {name:<26} {mode:<10} {summary['throughput_per_s']:>9.1f}/s  "
+              f"p50 {summary['p50_ms']:>8.2f} ms  p95 {summary['p95_ms']:>8.2f} ms  "
+              f"p99 {summary['p99_ms']:>8.2f} ms  errors {summary['errors']}")
+
+    if "inprocess" in args.modes:
+        print("\nIn-process")
+        services = build_services(args.suites, rag_options)
+        for suite, name, inprocess_call, _, payloads, items in cases:
+            record(name, "inprocess", measure(inprocess_call(services), payloads, args.concurrency, args.warmup, items))
+
+    if "http" in args.modes:
+        print(f"\nHTTP ({args.base_url or 'in-process server'})")
+        server = None
+        if not args.base_url:
+            server = LocalAPIServer(rag_options).__enter__()
+        try:
+            client = HTTPClient(args.base_url or server.base_url)
+            for suite, name, _, http_call, payloads, items in cases:
+                if http_call is not None:
+                    record(name, "http", measure(http_call(client), payloads, args.concurrency, args.warmup, items))
+        finally:
+            if server is not None:
+                server.__exit__(None, None, None)
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "environment": environment_info(),
+        "config": {**vars(args), "models": "real" if args.models_dir else "synthetic"},
+        "results": results,
+    }
+    output = Path(args.output) if args.output else (
+        PROJECT_ROOT / "benchmarks" / "results" / f"{datetime.now().strftime('%Y%m%dT%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nResults written to {output}")
+
+    if args.baseline:
+        regressions = compare(results, Path(args.baseline), args.max_regression)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import os
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+import torch
+
+# Add project root to path so the API package can be imported
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(PROJECT_ROOT))
+
+from src.api.core.vision_precision import PRECISION_MODES
+from src.api.services.vision_service import VisionService, CALIBRATION_EXTENSIONS
+
+# Probability above which a finding counts as positive when comparing decisions
+DECISION_THRESHOLD = 0.5
+
+
+def load_images(folder: Path, limit: int):
+    paths = sorted(p for p in folder.iterdir() if p.suffix.lower() in CALIBRATION_EXTENSIONS)[:limit]
+    if not paths:
+        print(f"Error: No PNG/JPEG images found in {folder}")
+        sys.exit(1)
+    return paths
+
+
+def build_service(precision: str, calibration_dir: Path) -> VisionService:
+    """Builds a VisionService exactly as the API would for the given precision."""
+    os.environ["VISION_PRECISION"] = precision
+    os.environ["VISION_CALIBRATION_DIR"] = str(calibration_dir)
+    return VisionService()
+
+
+def run_mode(service: VisionService, batches, repeats: int):
+    """Returns (probabilities for every image, median seconds per image)."""
+    # Warm-up pass so one-time kernel selection does not count against the mode
+    service._forward(batches[0])
+
+    probs = torch.cat([service._forward(batch) for batch in batches])
+
+    timings = []
+    n_images = sum(len(batch) for batch in batches)
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for batch in batches:
+            service._forward(batch)
+        timings.append((time.perf_counter() - start) / n_images)
+    timings.sort()
+    return probs, timings[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare vision precision modes against FP32 on sample X-rays.")
+    parser.add_argument("--images", required=True, help="Folder of sample chest X-rays (PNG/JPEG).")
+    parser.add_argument("--calibration-dir", help="Folder used to calibrate int8_static (defaults to --images).")
+    parser.add_argument("--modes", nargs="+", default=list(PRECISION_MODES), choices=PRECISION_MODES)
+    parser.add_argument("--max-images", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", default="vision_precision_report.json")
+    args = parser.parse_args()
+
+    image_dir = Path(args.images)
+    calibration_dir = Path(args.calibration_dir or args.images)
+    paths = load_images(image_dir, args.max_images)
+    print(f"Evaluating {len(args.modes)} modes on {len(paths)} images from {image_dir}")
+
+    reference = build_service("fp32", calibration_dir)
+    if reference.model is None:
+        print("Error: Vision model weights not found. Download them before running this report.")
+        sys.exit(1)
+
+    # Identical preprocessed inputs for every mode
+    tensors = [reference._preprocess(p.read_bytes()) for p in paths]
+    batches = [torch.stack(tensors[i:i + args.batch_size]) for i in range(0, len(tensors), args.batch_size)]
+
+    ref_probs, ref_latency = run_mode(reference, batches, args.repeats)
+    print(f"  fp32: {ref_latency * 1000:.2f} ms/image")
+
+    report = {
+        "images": len(paths),
+        "batch_size": args.batch_size,
+        "torch_version": torch.__version__,
+        "threads": torch.get_num_threads(),
+        "decision_threshold": DECISION_THRESHOLD,
+        "modes": {"fp32": {"ms_per_image": ref_latency * 1000, "speedup": 1.0}},
+    }
+
+    for mode in args.modes:
+        if mode == "fp32":
+            continue
+        service = build_service(mode, calibration_dir)
+        if service.precision != mode:
+            # The service downgraded the mode (no bf16 support, no calibration images, ...)
+            print(f"  {mode}: unavailable on this machine (fell back to {service.precision}), skipped")
+            report["modes"][mode] = {"available": False, "fell_back_to": service.precision}
+            continue
+
+        probs, latency = run_mode(service, batches, args.repeats)
+        delta = (probs - ref_probs).abs()
+        flips = ((probs > DECISION_THRESHOLD) != (ref_probs > DECISION_THRESHOLD)).sum(dim=0)
+
+        per_label = {
+            label: {
+                "mean_abs_delta": float(delta[:, i].mean()),
+                "max_abs_delta": float(delta[:, i].max()),
+                "decision_flips": int(flips[i]),
+            }
+            for i, label in enumerate(reference.labels)
+        }
+        report["modes"][mode] = {
+            "available": True,
+            "ms_per_image": latency * 1000,
+            "speedup": ref_latency / latency,
+            "mean_abs_delta": float(delta.mean()),
+            "max_abs_delta": float(delta.max()),
+            "decision_flips": int(flips.sum()),
+            "per_label": per_label,
+        }
+        print(
+            f"  {mode}: {latency * 1000:.2f} ms/image ({ref_latency / latency:.2f}x), "
+            f"mean |dp|={delta.mean():.4f}, max |dp|={delta.max():.4f}, flips={int(flips.sum())}"
+        )
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
 import os
+import json
+from datetime import datetime, timezone
 import pandas as pd
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
@@ -10,6 +12,12 @@ import sys
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_PATH = os.path.join(BASE_DIR, 'data', '1_predictive_data', 'structured', 'PatientNoShowKaggleMay2016.csv')
 MODEL_OUTPUT_PATH = os.path.join(BASE_DIR, 'notebooks', 'no_show_model.pkl')
+FEATURE_SCHEMA_OUTPUT_PATH = os.path.join(BASE_DIR, 'notebooks', 'no_show_feature_schema.json')
+
+# Bump when the layout of the feature schema artifact changes
+FEATURE_SCHEMA_VERSION = 1
+# Appointments with lead_days <= this value are scored by the Same-Day model
+SAME_DAY_MAX_LEAD_DAYS = 0
 
 print(f"Loading data from: {DATA_PATH}")
 
@@ -40,14 +48,17 @@ try:
     df['lead_days'] = (df['appointmentday'].dt.normalize() - df['scheduledday'].dt.normalize()).dt.days
     df['lead_days'] = df['lead_days'].apply(lambda x: max(0, x))
     
+    # Keep the fitted encoders so the API can reproduce the exact integer codes
     categorical_features = ['neighbourhood']
+    encoders = {}
     for col in categorical_features:
-        df[col] = LabelEncoder().fit_transform(df[col])
+        encoders[col] = LabelEncoder()
+        df[col] = encoders[col].fit_transform(df[col])
         
     # Split Data
     print("Splitting data into Same-Day and Future sets...")
-    df_same_day = df[df['lead_days'] == 0]
-    df_future = df[df['lead_days'] > 0]
+    df_same_day = df[df['lead_days'] <= SAME_DAY_MAX_LEAD_DAYS]
+    df_future = df[df['lead_days'] > SAME_DAY_MAX_LEAD_DAYS]
     
     print(f"Same-Day Records: {len(df_same_day)}")
     print(f"Future Records: {len(df_future)}")
@@ -95,6 +106,27 @@ try:
     print(f"\nSaving models to {MODEL_OUTPUT_PATH}...")
     with open(MODEL_OUTPUT_PATH, 'wb') as f:
         pickle.dump(model_artifacts, f)
+
+    # Everything the API needs to rebuild the feature vector, as a plain lookup table
+    feature_schema = {
+        "schema_version": FEATURE_SCHEMA_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "features": features,
+        "categorical_mappings": {
+            col: {str(label): int(code) for code, label in enumerate(encoder.classes_)}
+            for col, encoder in encoders.items()
+        },
+        "lead_day_split": {
+            "feature": "lead_days",
+            "same_day_max_lead_days": SAME_DAY_MAX_LEAD_DAYS,
+            "same_day_model": "same_day_model",
+            "future_model": "future_model"
+        }
+    }
+
+    print(f"Saving feature schema to {FEATURE_SCHEMA_OUTPUT_PATH}...")
+    with open(FEATURE_SCHEMA_OUTPUT_PATH, 'w') as f:
+        json.dump(feature_schema, f, indent=2)
         
     print("✅ Successfully trained and saved Dual-Model.")
 
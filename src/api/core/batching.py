@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _fail(batch: list):
+    """Fails the still-pending futures of (item, future) pairs with a stop error."""
+    for _, future in batch:
+        if not future.done():
+            future.set_exception(RuntimeError("Micro-batcher was stopped."))
+
+
+class MicroBatcher:
+    """
+    Collects concurrent requests into micro-batches for a batched inference function.
+
+    `process_batch` receives a list of items and must return a list of results of the
+    same length. A result that is an Exception instance is raised to that caller only,
+    so one bad input does not fail the whole batch.
+    """
+
+    def __init__(self, process_batch, max_batch_size: int = 8, max_wait_ms: float = 10.0, executor=None):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1.")
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.executor = executor
+        self._queue = None
+        self._worker = None
+
+    async def start(self):
+        """Starts the background batching loop on the running event loop."""
+        if self._worker is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+        logger.info(
+            f"Micro-batcher started (max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={self.max_wait * 1000:.1f})."
+        )
+
+    async def stop(self):
+        """Stops the batching loop and fails any requests still waiting in the queue."""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+        while not self._queue.empty():
+            _fail([self._queue.get_nowait()])
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, item):
+        """Queues a single item and waits for its individual result."""
+        if self._worker is None:
+            raise RuntimeError("Micro-batcher is not running.")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self):
+        """Blocks for the first item, then gathers more until the batch is full or the wait expires."""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        try:
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+        except asyncio.CancelledError:
+            # Items already taken off the queue are invisible to stop(); fail them here
+            _fail(batch)
+            raise
+
+        # Drain anything that arrived in the meantime without waiting further
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Callers that disconnected while queued don't need inference
+            batch = [(item, future) for item, future in batch if not future.cancelled()]
+            if not batch:
+                continue
+
+            items = [item for item, _ in batch]
+            try:
+                results = await loop.run_in_executor(self.executor, self.process_batch, items)
+                if len(results) != len(items):
+                    raise RuntimeError(
+                        f"Batch function returned {len(results)} results for {len(items)} inputs."
+                    )
+            except asyncio.CancelledError:
+                _fail(batch)
+                raise
+            except Exception as e:
+                logger.error(f"Micro-batch of {len(items)} failed: {e}")
+                results = [e] * len(items)
+
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
@@ -0,0 +1,144 @@
+import re
+import math
+import logging
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+from .rank_fusion import content_key
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Encoding used by gpt-4o; older deployments use cl100k_base
+DEFAULT_ENCODING = "o200k_base"
+# Rough characters-per-token for English prose, used when tiktoken is unavailable
+APPROX_CHARS_PER_TOKEN = 4.0
+# Shortest shared prefix/suffix treated as splitter overlap rather than coincidence
+MIN_OVERLAP_CHARS = 50
+# Tokens between chunks ("\n\n")
+SEPARATOR_TOKENS = 1
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+class PackedContext(NamedTuple):
+    chunks: list
+    tokens: int
+    truncated: bool
+    dropped: int
+
+
+class ContextPacker:
+    """
+    Fits retrieved chunks into a prompt token budget, in retrieval order.
+
+    - Token counts are computed once per distinct chunk text and cached (LRU).
+    - Chunks contained in an earlier chunk are dropped, and text shared with an earlier
+      chunk through the splitter's overlap is cut, so overlapping neighbours cost nothing extra.
+    - The chunk that crosses the budget keeps as many whole sentences as fit; later chunks are dropped.
+    """
+
+    def __init__(self, token_budget: int = 1500, encoding: str = DEFAULT_ENCODING, cache_size: int = 4096):
+        self.token_budget = token_budget
+        self.cache_size = cache_size
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+        self._encoder = None
+        if tiktoken is not None:
+            try:
+                self._encoder = tiktoken.get_encoding(encoding)
+            except Exception as e:
+                logger.warning(f"tiktoken encoding '{encoding}' unavailable ({e}). Approximating token counts.")
+
+    @property
+    def exact(self) -> bool:
+        return self._encoder is not None
+
+    def _count(self, text: str) -> int:
+        if self._encoder is not None:
+            return len(self._encoder.encode(text, disallowed_special=()))
+        return math.ceil(len(text) / APPROX_CHARS_PER_TOKEN)
+
+    def count_tokens(self, text: str) -> int:
+        """Token count of `text`, cached by content hash."""
+        key = content_key(text)
+        with self._lock:
+            count = self._counts.get(key)
+            if count is not None:
+                self._counts.move_to_end(key)
+                return count
+        count = self._count(text)
+        with self._lock:
+            self._counts[key] = count
+            while len(self._counts) > self.cache_size:
+                self._counts.popitem(last=False)
+        return count
+
+    @staticmethod
+    def _remove_overlap(text: str, selected: list) -> str:
+        """Strips text already present in selected chunks; returns '' if nothing new is left."""
+        for previous in selected:
+            if text in previous:
+                return ""
+            probe = text[:MIN_OVERLAP_CHARS]
+            # previous ends with the start of text
+            position = previous.find(probe) if len(probe) == MIN_OVERLAP_CHARS else -1
+            while position != -1:
+                if text.startswith(previous[position:]):
+                    text = text[len(previous) - position:].lstrip()
+                    break
+                position = previous.find(probe, position + 1)
+            probe = previous[:MIN_OVERLAP_CHARS]
+            # text ends with the start of previous
+            position = text.find(probe) if len(probe) == MIN_OVERLAP_CHARS else -1
+            while position != -1:
+                if previous.startswith(text[position:]):
+                    text = text[:position].rstrip()
+                    break
+                position = text.find(probe, position + 1)
+        return text
+
+    def _truncate_to_sentences(self, text: str, budget: int) -> str:
+        kept = []
+        used = 0
+        for sentence in _SENTENCE_END_RE.split(text):
+            tokens = self.count_tokens(sentence) + (1 if kept else 0)
+            if used + tokens > budget:
+                break
+            kept.append(sentence)
+            used += tokens
+        return " ".join(kept)
+
+    def pack(self, chunks: list, token_budget: int = None) -> PackedContext:
+        budget = self.token_budget if token_budget is None else token_budget
+        selected = []
+        used = 0
+        truncated = False
+        for index, chunk in enumerate(chunks):
+            text = self._remove_overlap(chunk, selected)
+            if not text:
+                continue
+            separator = SEPARATOR_TOKENS if selected else 0
+            tokens = self.count_tokens(text)
+            if used + separator + tokens <= budget:
+                selected.append(text)
+                used += separator + tokens
+                continue
+
+            # Over budget: keep the whole sentences that fit, then stop
+            remaining = budget - used - separator
+            partial = self._truncate_to_sentences(text, remaining) if remaining > 0 else ""
+            if not partial and not selected and remaining > 0:
+                # A single over-long first sentence would leave no context at all; cut it by words
+                words = text.split()
+                partial = " ".join(words[:max(1, int(remaining * APPROX_CHARS_PER_TOKEN / 6))])
+            if partial:
+                selected.append(partial)
+                used += separator + self.count_tokens(partial)
+            truncated = True
+            return PackedContext(selected, used, truncated, len(chunks) - index - (1 if partial else 0))
+        return PackedContext(selected, used, truncated, 0)
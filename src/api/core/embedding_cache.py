@@ -0,0 +1,140 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from .metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# SQLite caps the number of bound parameters per statement
+_SQLITE_LOOKUP_BATCH = 500
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that caches vectors by (model name, kind, SHA-256 of the text).
+
+    An in-memory LRU sits in front of an optional SQLite store, so unchanged chunks and
+    repeated questions skip the transformer forward pass across restarts. Documents and
+    queries are cached separately because some models encode them differently.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str, cache_path=None, max_memory_entries: int = 4096):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_memory_entries = max_memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self._db = None
+        if cache_path:
+            cache_path = Path(cache_path)
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(cache_path), check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, text_hash))"
+            )
+            self._db.commit()
+
+    def _key(self, kind: str, text: str) -> str:
+        return hashlib.sha256(f"{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys: list) -> dict:
+        """Vectors for the cached keys, from memory first and then from SQLite."""
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+
+            missing = [key for key in keys if key not in found]
+            if self._db is not None and missing:
+                for start in range(0, len(missing), _SQLITE_LOOKUP_BATCH):
+                    batch = missing[start:start + _SQLITE_LOOKUP_BATCH]
+                    rows = self._db.execute(
+                        f"SELECT text_hash, vector FROM embeddings WHERE model = ? "
+                        f"AND text_hash IN ({','.join('?' * len(batch))})",
+                        [self.model_name, *batch],
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32).tolist()
+                        found[key] = vector
+                        self._remember(key, vector)
+        return found
+
+    def _remember(self, key: str, vector: list):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _store(self, computed: dict):
+        with self._lock:
+            for key, vector in computed.items():
+                self._remember(key, vector)
+            if self._db is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                    [(self.model_name, key, np.asarray(vector, dtype=np.float32).tobytes())
+                     for key, vector in computed.items()],
+                )
+                self._db.commit()
+
+    def embed_documents(self, texts: list) -> list:
+        keys = [self._key("document", text) for text in texts]
+        found = self._lookup(keys)
+
+        # Embed each distinct missing text once, in a single batch
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing, vectors))
+            self._store(computed)
+            found.update(computed)
+
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> list:
+        key = self._key("query", text)
+        found = self._lookup([key])
+        if key in found:
+            with self._lock:
+                self.hits += 1
+            CACHE_REQUESTS.inc(cache="embedding", result="hit")
+            return found[key]
+
+        vector = self.embeddings.embed_query(text)
+        self._store({key: vector})
+        with self._lock:
+            self.misses += 1
+        CACHE_REQUESTS.inc(cache="embedding", result="miss")
+        return vector
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "max_memory_entries": self.max_memory_entries,
+                "persistent": self._db is not None,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,124 @@
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+
+logger = logging.getLogger(__name__)
+
+
+class WorkloadSaturated(Exception):
+    """Raised when an endpoint's concurrency limit stays full for longer than its queue timeout."""
+
+
+def configure_torch_threads(intra_op_threads: int = None, inter_op_threads: int = None):
+    """
+    Sets torch's intra-op (per-operator) and inter-op thread pools.
+    Must run before the first forward pass; the inter-op pool can only be sized once per process.
+    """
+    import torch
+
+    if intra_op_threads:
+        torch.set_num_threads(intra_op_threads)
+    if inter_op_threads:
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError as e:
+            logger.warning(f"Could not set torch inter-op threads: {e}")
+    logger.info(f"Torch threads: intra-op={torch.get_num_threads()}, inter-op={torch.get_num_interop_threads()}.")
+
+
+class Workload:
+    """
+    A dedicated thread pool plus an in-flight request limit for one kind of endpoint.
+
+    `run` executes blocking work on the pool, so the event loop stays free and a slow
+    workload queues behind its own threads instead of everyone else's. `slot` caps
+    concurrent requests; callers that wait longer than `queue_timeout` are rejected.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_concurrency: int, queue_timeout: float = 30.0):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.rejected = 0
+
+    async def acquire(self):
+        """Waits for a free request slot; raises WorkloadSaturated after `queue_timeout`."""
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise WorkloadSaturated(f"{self.name} is at its limit of {self.max_concurrency} concurrent requests.")
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def run(self, func, *args, **kwargs):
+        """Runs a blocking call on this workload's thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def create_workloads() -> dict:
+    """
+    Builds the per-endpoint workloads from the environment ({name: Workload}).
+
+    - vision: one worker, since the micro-batcher already feeds it whole batches and the
+      forward pass is parallelized by torch's intra-op threads.
+    - operations: LightGBM scoring; each call is short, a couple of workers suffice.
+    - rag: embedding, local retrieval, re-ranking and context packing (network I/O is async).
+    """
+    queue_timeout = float(os.getenv("WORKLOAD_QUEUE_TIMEOUT_SECONDS", "30"))
+    workloads = {
+        "vision": Workload(
+            "vision",
+            max_workers=int(os.getenv("VISION_WORKERS", "1")),
+            max_concurrency=int(os.getenv("VISION_MAX_CONCURRENCY", "32")),
+            queue_timeout=queue_timeout,
+        ),
+        "operations": Workload(
+            "operations",
+            max_workers=int(os.getenv("OPERATIONS_WORKERS", "2")),
+            max_concurrency=int(os.getenv("OPERATIONS_MAX_CONCURRENCY", "16")),
+            queue_timeout=queue_timeout,
+        ),
+        "rag": Workload(
+            "rag",
+            max_workers=int(os.getenv("RAG_WORKERS", "4")),
+            max_concurrency=int(os.getenv("RAG_MAX_CONCURRENCY", "8")),
+            queue_timeout=queue_timeout,
+        ),
+    }
+    for workload in workloads.values():
+        logger.info(
+            f"Workload '{workload.name}': {workload.max_workers} workers, "
+            f"{workload.max_concurrency} concurrent requests."
+        )
+    return workloads
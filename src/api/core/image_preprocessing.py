@@ -0,0 +1,100 @@
+import io
+import math
+import numpy as np
+import torch
+from PIL import Image
+
+# ImageNet statistics the ResNet50 was fine-tuned with
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+class FusedPreprocessor:
+    """
+    Single-pass replacement for Resize(256) -> CenterCrop(224) -> ToTensor -> Normalize.
+
+    - JPEGs are decoded in draft mode, letting libjpeg downscale by 1/2, 1/4 or 1/8 while
+      keeping at least the resize resolution.
+    - Resize and crop are one PIL resize over the crop box, straight to 224x224.
+    - Grayscale X-rays stay single-channel; the channel is broadcast into the three
+      normalized planes by one fused multiply-add (`addcmul`) that writes directly into a
+      preallocated batch buffer (pinned when inference runs on a GPU).
+
+    The output matches the torchvision pipeline up to resampling differences (a single
+    antialiased resize instead of resize-then-crop, and DCT downscaling for large JPEGs).
+    The batch buffer is shared, so callers must serialize `fill`/`batch` with inference.
+    """
+
+    def __init__(self, max_batch_size: int, resize_size: int = 256, crop_size: int = 224,
+                 pin_memory: bool = False, channels_last: bool = True):
+        self.resize_size = resize_size
+        self.crop_size = crop_size
+        mean = torch.tensor(IMAGENET_MEAN).view(3, 1, 1)
+        std = torch.tensor(IMAGENET_STD).view(3, 1, 1)
+        # (x / 255 - mean) / std == x * scale + bias
+        self.scale = 1.0 / (255.0 * std)
+        self.bias = -mean / std
+
+        buffer = torch.empty((max_batch_size, 3, crop_size, crop_size), dtype=torch.float32)
+        if channels_last:
+            buffer = buffer.contiguous(memory_format=torch.channels_last)
+        if pin_memory:
+            buffer = buffer.pin_memory()
+        self.buffer = buffer
+
+    @property
+    def max_batch_size(self) -> int:
+        return self.buffer.shape[0]
+
+    def _decode(self, image_bytes) -> np.ndarray:
+        """Decodes and resizes to a (crop, crop) uint8 array (grayscale) or (crop, crop, 3) (color)."""
+        image = Image.open(io.BytesIO(image_bytes))
+        width, height = image.size
+        short = min(width, height)
+
+        if image.format == "JPEG" and short > self.resize_size:
+            mode = "L" if image.mode == "L" else "RGB"
+            target = (math.ceil(width * self.resize_size / short), math.ceil(height * self.resize_size / short))
+            image.draft(mode, target)
+            width, height = image.size
+            short = min(width, height)
+
+        if image.mode not in ("L", "RGB"):
+            # Same conversion rules as the torchvision path for palette/alpha/16-bit inputs
+            image = image.convert("RGB")
+
+        # Size of the image Resize(resize_size) would produce, then the CenterCrop box mapped back
+        resized_w = self.resize_size if width == short else int(self.resize_size * width / short)
+        resized_h = self.resize_size if height == short else int(self.resize_size * height / short)
+        sx, sy = width / resized_w, height / resized_h
+        left = round((resized_w - self.crop_size) / 2.0) * sx
+        top = round((resized_h - self.crop_size) / 2.0) * sy
+        box = (left, top, left + self.crop_size * sx, top + self.crop_size * sy)
+
+        image = image.resize((self.crop_size, self.crop_size), Image.BILINEAR, box=box)
+        # Writable uint8 array so torch can wrap it without a warning (224x224, so the copy is tiny)
+        return np.array(image)
+
+    def _normalize_into(self, pixels: np.ndarray, out: torch.Tensor):
+        """Writes normalized channels into `out` (3, H, W) without intermediate float images."""
+        source = torch.from_numpy(pixels)
+        if source.ndim == 2:
+            # Broadcast view: no copy of the gray plane is made
+            source = source.unsqueeze(0).expand(3, -1, -1)
+        else:
+            source = source.permute(2, 0, 1)
+        torch.addcmul(self.bias, source, self.scale, out=out)
+
+    def fill(self, slot: int, image_bytes):
+        """Decodes one image into batch slot `slot`. Raises on undecodable input."""
+        self._normalize_into(self._decode(image_bytes), self.buffer[slot])
+
+    def batch(self, size: int) -> torch.Tensor:
+        """View of the first `size` filled slots."""
+        return self.buffer[:size]
+
+    def to_tensor(self, image_bytes) -> torch.Tensor:
+        """Preprocesses one image into a fresh (3, crop, crop) tensor, outside the shared buffer."""
+        out = torch.empty((3, self.crop_size, self.crop_size), dtype=torch.float32)
+        self._normalize_into(self._decode(image_bytes), out)
+        return out
@@ -0,0 +1,244 @@
+import os
+import re
+import json
+import time
+import hashlib
+import shutil
+import logging
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import NamedTuple
+import numpy as np
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+POSTINGS_FILE = "postings.npz"
+VOCABULARY_FILE = "vocabulary.json"
+CHUNKS_FILE = "chunks.jsonl"
+MANIFEST_FILE = "manifest.json"
+FORMAT_VERSION = 1
+# Each build's data files live in `v-<version>/`; the manifest names the current one
+_VERSION_DIR_PREFIX = "v-"
+
+# Standard Okapi BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> list:
+    """Lower-cased alphanumeric terms; "Ventilator-Associated" -> ["ventilator", "associated"]."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _atomic_write(path: Path, write):
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _data_dir(index_dir: Path, manifest: dict) -> Path:
+    """Directory holding the files of the version a manifest describes."""
+    # Indexes written before versioned directories keep their files next to the manifest
+    return index_dir / manifest["data_dir"] if manifest.get("data_dir") else index_dir
+
+
+def _remove_old_versions(output_dir: Path, keep: set):
+    """Deletes version directories other than `keep` (the new one and its predecessor)."""
+    for path in output_dir.glob(f"{_VERSION_DIR_PREFIX}*"):
+        if path.is_dir() and path.name not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+    # Unversioned files from before the switch are stale once the predecessor is versioned too
+    if None not in keep:
+        for name in (POSTINGS_FILE, VOCABULARY_FILE, CHUNKS_FILE):
+            (output_dir / name).unlink(missing_ok=True)
+
+
+def read_lexical_chunks(index_dir) -> list:
+    """Chunks of an existing lexical index ([] if there is none), for incremental rebuilds."""
+    index_dir = Path(index_dir)
+    if not (index_dir / MANIFEST_FILE).exists():
+        return []
+    data_dir = _data_dir(index_dir, json.loads((index_dir / MANIFEST_FILE).read_text()))
+    with open(data_dir / CHUNKS_FILE, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def write_lexical_index(output_dir, chunks: list) -> dict:
+    """
+    Builds a BM25 inverted index over chunk content and writes it as CSR-style postings
+    (per-term slices of chunk rows and term frequencies), a vocabulary, the chunks
+    ({"id", "content", "metadata"}) into a directory named after the index version, then
+    replaces the manifest that points at it, so readers switch versions in one step.
+    """
+    term_ids = {}
+    doc_term_counts = []
+    doc_lengths = np.zeros(len(chunks), dtype=np.float32)
+    for row, chunk in enumerate(chunks):
+        counts = Counter(tokenize(chunk["content"]))
+        doc_lengths[row] = sum(counts.values())
+        doc_term_counts.append({term_ids.setdefault(term, len(term_ids)): tf for term, tf in counts.items()})
+
+    # Group postings by term: rows sorted by (term, row)
+    n_postings = sum(len(counts) for counts in doc_term_counts)
+    posting_terms = np.empty(n_postings, dtype=np.int64)
+    posting_rows = np.empty(n_postings, dtype=np.int32)
+    posting_freqs = np.empty(n_postings, dtype=np.float32)
+    position = 0
+    for row, counts in enumerate(doc_term_counts):
+        size = len(counts)
+        posting_terms[position:position + size] = list(counts.keys())
+        posting_rows[position:position + size] = row
+        posting_freqs[position:position + size] = list(counts.values())
+        position += size
+    order = np.lexsort((posting_rows, posting_terms))
+    term_offsets = np.zeros(len(term_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(posting_terms, minlength=len(term_ids)), out=term_offsets[1:])
+
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk["id"].encode("utf-8"))
+    version = digest.hexdigest()[:16]
+
+    output_dir = Path(output_dir)
+    previous = {}
+    if (output_dir / MANIFEST_FILE).exists():
+        previous = json.loads((output_dir / MANIFEST_FILE).read_text())
+    data_dir_name = f"{_VERSION_DIR_PREFIX}{version}"
+    data_dir = output_dir / data_dir_name
+    data_dir.mkdir(parents=True, exist_ok=True)
+
+    def write_postings(path):
+        with open(path, "wb") as f:
+            np.savez(f, term_offsets=term_offsets, rows=posting_rows[order],
+                     term_freqs=posting_freqs[order], doc_lengths=doc_lengths)
+
+    def write_chunks(path):
+        with open(path, "w", encoding="utf-8") as f:
+            for chunk in chunks:
+                f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+
+    vocabulary = sorted(term_ids, key=term_ids.get)
+    _atomic_write(data_dir / POSTINGS_FILE, write_postings)
+    _atomic_write(data_dir / VOCABULARY_FILE, lambda path: path.write_text(json.dumps(vocabulary)))
+    _atomic_write(data_dir / CHUNKS_FILE, write_chunks)
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "version": version,
+        "data_dir": data_dir_name,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "count": len(chunks),
+        "terms": len(vocabulary),
+        "average_length": float(doc_lengths.mean()) if len(chunks) else 0.0,
+    }
+    _atomic_write(output_dir / MANIFEST_FILE, lambda path: path.write_text(json.dumps(manifest, indent=2)))
+    _remove_old_versions(output_dir, {data_dir_name, previous.get("data_dir")})
+    return manifest
+
+
+class _IndexState(NamedTuple):
+    manifest: dict
+    term_ids: dict
+    term_offsets: np.ndarray
+    rows: np.ndarray
+    term_freqs: np.ndarray
+    length_norm: np.ndarray
+    idf: np.ndarray
+    chunks: list
+
+
+class LexicalIndex:
+    """
+    In-process BM25 retriever over the chunks written by build_vector_index.py.
+
+    Scoring touches only the postings of the query terms, so it costs microseconds even
+    with a large k. `refresh` reloads the files when the manifest version changes.
+    """
+
+    def __init__(self, index_dir, k1: float = BM25_K1, b: float = BM25_B):
+        self.index_dir = Path(index_dir)
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._load()
+
+    def _read_manifest(self) -> dict:
+        manifest_path = self.index_dir / MANIFEST_FILE
+        if not manifest_path.exists():
+            raise FileNotFoundError(f"No lexical index at {self.index_dir} (missing {MANIFEST_FILE}).")
+        manifest = json.loads(manifest_path.read_text())
+        if manifest.get("format_version") != FORMAT_VERSION:
+            raise RuntimeError(f"Unsupported lexical index format version {manifest.get('format_version')}.")
+        return manifest
+
+    def _load(self):
+        manifest = self._read_manifest()
+        data_dir = _data_dir(self.index_dir, manifest)
+        with np.load(data_dir / POSTINGS_FILE) as postings:
+            term_offsets = postings["term_offsets"]
+            rows = postings["rows"]
+            term_freqs = postings["term_freqs"]
+            doc_lengths = postings["doc_lengths"]
+        vocabulary = json.loads((data_dir / VOCABULARY_FILE).read_text())
+        with open(data_dir / CHUNKS_FILE, "r", encoding="utf-8") as f:
+            chunks = [json.loads(line) for line in f if line.strip()]
+        if not len(chunks) == len(doc_lengths) == manifest["count"]:
+            raise RuntimeError(f"Lexical index is inconsistent: {len(doc_lengths)} indexed, {len(chunks)} chunks, "
+                               f"{manifest['count']} in the manifest.")
+
+        # Precompute the per-chunk length normalization and per-term IDF once
+        n_docs = len(chunks)
+        average_length = float(doc_lengths.mean()) if n_docs else 1.0
+        length_norm = self.k1 * (1.0 - self.b + self.b * doc_lengths / max(average_length, 1e-9))
+        doc_freqs = np.diff(term_offsets).astype(np.float32)
+        idf = np.log1p((n_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+
+        term_ids = {term: term_id for term_id, term in enumerate(vocabulary)}
+        self._state = _IndexState(manifest, term_ids, term_offsets, rows, term_freqs,
+                                  length_norm.astype(np.float32), idf, chunks)
+        logger.info(f"Loaded lexical index {manifest['version']} ({n_docs} chunks, {len(vocabulary)} terms).")
+
+    @property
+    def version(self) -> str:
+        return self._state.manifest["version"]
+
+    def refresh(self) -> str:
+        """Reloads the index if it was rebuilt on disk and returns the current version."""
+        version = self._read_manifest()["version"]
+        if version != self.version:
+            with self._lock:
+                if version != self.version:
+                    self._load()
+        return self.version
+
+    def search(self, query: str, k: int = 10) -> list:
+        """Returns [(chunk, BM25 score)] for the top-k chunks that match at least one query term."""
+        state = self._state
+        scores = np.zeros(len(state.chunks), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = state.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = state.term_offsets[term_id], state.term_offsets[term_id + 1]
+            rows = state.rows[start:end]
+            tf = state.term_freqs[start:end]
+            # Rows are unique within a term's postings, so fancy-index accumulation is safe
+            scores[rows] += state.idf[term_id] * tf * (self.k1 + 1.0) / (tf + state.length_norm[rows])
+
+        matched = np.flatnonzero(scores)
+        if len(matched) == 0:
+            return []
+        if k < len(matched):
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched])]
+        return [(state.chunks[row], float(scores[row])) for row in matched]
+
+    def similarity_search(self, query: str, k: int = 10) -> list:
+        return [
+            Document(page_content=chunk["content"], metadata=chunk.get("metadata", {}), id=chunk["id"])
+            for chunk, _ in self.search(query, k)
+        ]
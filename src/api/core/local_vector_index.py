@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import hashlib
+import shutil
+import logging
+import threading
+from pathlib import Path
+from typing import NamedTuple
+import numpy as np
+from langchain_core.documents import Document
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+logger = logging.getLogger(__name__)
+
+VECTORS_FILE = "vectors.npy"
+CHUNKS_FILE = "chunks.jsonl"
+MANIFEST_FILE = "manifest.json"
+HNSW_FILE = "hnsw.bin"
+FORMAT_VERSION = 1
+# Each build's data files live in `v-<version>/`; the manifest names the current one
+_VERSION_DIR_PREFIX = "v-"
+SUPPORTED_DTYPES = ("float32", "float16")
+
+# Rows scored per block when vectors are stored as float16 (upcast block by block)
+_SCORE_BLOCK_ROWS = 8192
+
+
+def _atomic_write(path: Path, write):
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _data_dir(index_dir: Path, manifest: dict) -> Path:
+    """Directory holding the files of the version a manifest describes."""
+    # Indexes written before versioned directories keep their files next to the manifest
+    return index_dir / manifest["data_dir"] if manifest.get("data_dir") else index_dir
+
+
+def _remove_old_versions(output_dir: Path, keep: set):
+    """Deletes version directories other than `keep` (the new one and its predecessor)."""
+    for path in output_dir.glob(f"{_VERSION_DIR_PREFIX}*"):
+        if path.is_dir() and path.name not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+    # Unversioned files from before the switch are stale once the predecessor is versioned too
+    if None not in keep:
+        for name in (VECTORS_FILE, CHUNKS_FILE, HNSW_FILE):
+            (output_dir / name).unlink(missing_ok=True)
+
+
+def write_local_index(output_dir, vectors, chunks: list, embedding_model: str,
+                      dtype: str = "float32", build_hnsw: bool = False) -> dict:
+    """
+    Writes a local vector index: unit-normalized vectors as a .npy matrix (memory-mappable),
+    one JSON line per chunk ({"id", "content", "metadata"}) in the same row order, and a
+    manifest. The data files go into a directory named after the index version, and
+    replacing the manifest that points at it is the single switch to the new version,
+    so a reader never pairs files from two builds. The previous version's directory is
+    kept for readers that already hold the old manifest.
+    """
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Unsupported dtype '{dtype}'. Expected one of {SUPPORTED_DTYPES}.")
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim != 2 or vectors.shape[0] != len(chunks):
+        raise ValueError(f"Got {vectors.shape} vectors for {len(chunks)} chunks.")
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors = (vectors / norms).astype(dtype)
+
+    digest = hashlib.sha256(vectors.tobytes())
+    for chunk in chunks:
+        digest.update(chunk["id"].encode("utf-8"))
+    version = digest.hexdigest()[:16]
+
+    output_dir = Path(output_dir)
+    previous = {}
+    if (output_dir / MANIFEST_FILE).exists():
+        previous = json.loads((output_dir / MANIFEST_FILE).read_text())
+    data_dir_name = f"{_VERSION_DIR_PREFIX}{version}"
+    data_dir = output_dir / data_dir_name
+    data_dir.mkdir(parents=True, exist_ok=True)
+
+    def write_vectors(path):
+        with open(path, "wb") as f:
+            np.save(f, vectors)
+
+    def write_chunks(path):
+        with open(path, "w", encoding="utf-8") as f:
+            for chunk in chunks:
+                f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+
+    _atomic_write(data_dir / VECTORS_FILE, write_vectors)
+    _atomic_write(data_dir / CHUNKS_FILE, write_chunks)
+
+    has_hnsw = False
+    if build_hnsw:
+        if hnswlib is None:
+            logger.warning("hnswlib is not installed. Skipping the HNSW index; exact search will be used.")
+        else:
+            index = hnswlib.Index(space="ip", dim=vectors.shape[1])
+            index.init_index(max_elements=max(len(chunks), 1), ef_construction=200, M=16)
+            index.add_items(vectors.astype(np.float32), np.arange(len(chunks)))
+            _atomic_write(data_dir / HNSW_FILE, lambda path: index.save_index(str(path)))
+            has_hnsw = True
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "version": version,
+        "data_dir": data_dir_name,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "embedding_model": embedding_model,
+        "dimensions": int(vectors.shape[1]),
+        "count": len(chunks),
+        "dtype": dtype,
+        "hnsw": has_hnsw,
+    }
+    _atomic_write(output_dir / MANIFEST_FILE, lambda path: path.write_text(json.dumps(manifest, indent=2)))
+    _remove_old_versions(output_dir, {data_dir_name, previous.get("data_dir")})
+    return manifest
+
+
+def read_local_index(index_dir):
+    """Returns (float32 vectors, chunks) of an existing local index, or (None, []) if there is none."""
+    index_dir = Path(index_dir)
+    if not (index_dir / MANIFEST_FILE).exists():
+        return None, []
+    data_dir = _data_dir(index_dir, json.loads((index_dir / MANIFEST_FILE).read_text()))
+    vectors = np.load(data_dir / VECTORS_FILE).astype(np.float32)
+    with open(data_dir / CHUNKS_FILE, "r", encoding="utf-8") as f:
+        chunks = [json.loads(line) for line in f if line.strip()]
+    return vectors, chunks
+
+
+class _IndexState(NamedTuple):
+    manifest: dict
+    vectors: np.ndarray
+    chunks: list
+    hnsw_index: object
+
+
+class LocalVectorIndex:
+    """
+    In-process replacement for the Azure AI Search vector store.
+
+    Vectors are memory-mapped from `vectors.npy` and scored with one matrix-vector
+    product (exact cosine similarity, since rows are unit-normalized). If the index was
+    built with HNSW and hnswlib is installed, `use_hnsw` switches to approximate search
+    for larger corpora. `refresh` reloads the files when the manifest version changes.
+    """
+
+    def __init__(self, index_dir, embedding_function=None, use_hnsw: bool = True):
+        self.index_dir = Path(index_dir)
+        self.embedding_function = embedding_function
+        self.use_hnsw = use_hnsw
+        self._lock = threading.Lock()
+        self._load()
+
+    def _read_manifest(self) -> dict:
+        manifest_path = self.index_dir / MANIFEST_FILE
+        if not manifest_path.exists():
+            raise FileNotFoundError(f"No local vector index at {self.index_dir} (missing {MANIFEST_FILE}).")
+        manifest = json.loads(manifest_path.read_text())
+        if manifest.get("format_version") != FORMAT_VERSION:
+            raise RuntimeError(f"Unsupported local index format version {manifest.get('format_version')}.")
+        return manifest
+
+    def _load(self):
+        manifest = self._read_manifest()
+        data_dir = _data_dir(self.index_dir, manifest)
+        vectors = np.load(data_dir / VECTORS_FILE, mmap_mode="r")
+        with open(data_dir / CHUNKS_FILE, "r", encoding="utf-8") as f:
+            chunks = [json.loads(line) for line in f if line.strip()]
+        if not vectors.shape[0] == len(chunks) == manifest["count"]:
+            raise RuntimeError(f"Local index is inconsistent: {vectors.shape[0]} vectors, {len(chunks)} chunks, "
+                               f"{manifest['count']} in the manifest.")
+
+        hnsw_index = None
+        if self.use_hnsw and manifest.get("hnsw"):
+            if hnswlib is None:
+                logger.warning("Local index has an HNSW graph but hnswlib is not installed. Using exact search.")
+            else:
+                hnsw_index = hnswlib.Index(space="ip", dim=vectors.shape[1])
+                hnsw_index.load_index(str(data_dir / HNSW_FILE), max_elements=len(chunks))
+                hnsw_index.set_ef(64)
+
+        # Swapped as one object so concurrent searches never mix two index versions
+        self._state = _IndexState(manifest, vectors, chunks, hnsw_index)
+        logger.info(f"Loaded local vector index {manifest['version']} ({len(chunks)} chunks, "
+                    f"{manifest['dtype']}, {'hnsw' if hnsw_index is not None else 'exact'}).")
+
+    @property
+    def manifest(self) -> dict:
+        return self._state.manifest
+
+    @property
+    def version(self) -> str:
+        return self._state.manifest["version"]
+
+    def __len__(self) -> int:
+        return len(self._state.chunks)
+
+    def refresh(self) -> str:
+        """Reloads the index if it was rebuilt on disk and returns the current version."""
+        version = self._read_manifest()["version"]
+        if version != self.version:
+            with self._lock:
+                if version != self.version:
+                    self._load()
+        return self.version
+
+    @staticmethod
+    def _scores(vectors: np.ndarray, query_vec: np.ndarray) -> np.ndarray:
+        if vectors.dtype == np.float32:
+            return vectors @ query_vec
+        # NumPy has no BLAS path for float16, so upcast in blocks instead of the whole matrix
+        scores = np.empty(vectors.shape[0], dtype=np.float32)
+        for start in range(0, vectors.shape[0], _SCORE_BLOCK_ROWS):
+            block = vectors[start:start + _SCORE_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ query_vec
+        return scores
+
+    def search(self, embedding, k: int = 4) -> list:
+        """Returns [(chunk, cosine similarity)] for the top-k chunks, best first."""
+        state = self._state
+        query_vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query_vec)
+        if norm > 0:
+            query_vec = query_vec / norm
+        k = min(k, len(state.chunks))
+        if k <= 0:
+            return []
+
+        if state.hnsw_index is not None:
+            labels, distances = state.hnsw_index.knn_query(query_vec, k=k)
+            # hnswlib's "ip" distance is 1 - dot product
+            return [(state.chunks[int(row)], float(1.0 - dist)) for row, dist in zip(labels[0], distances[0])]
+
+        scores = self._scores(state.vectors, query_vec)
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(state.chunks[row], float(scores[row])) for row in top]
+
+    @staticmethod
+    def _to_document(chunk: dict) -> Document:
+        return Document(page_content=chunk["content"], metadata=chunk.get("metadata", {}), id=chunk["id"])
+
+    def similarity_search_by_vector(self, embedding, k: int = 4) -> list:
+        return [self._to_document(chunk) for chunk, _ in self.search(embedding, k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4) -> list:
+        if self.embedding_function is None:
+            raise ValueError("LocalVectorIndex needs an embedding_function to search by text.")
+        return [(self._to_document(chunk), score) for chunk, score in self.search(self.embedding_function(query), k)]
+
+    def similarity_search(self, query: str, k: int = 4) -> list:
+        """Same call shape as the LangChain vector stores used by RAGService."""
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
@@ -0,0 +1,242 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# Upper bounds (seconds) shared by request and stage latency histograms
+DEFAULT_LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}.")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> list:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> list:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+
+class Gauge(_Metric):
+    """
+    Point-in-time value per label set. Values can be set directly, or read from a
+    callback at scrape time (`set_function`), which suits queue depths owned elsewhere.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._functions = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = function
+
+    def samples(self) -> list:
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            try:
+                values[key] = float(function())
+            except Exception:
+                # A source that is gone or failing is left out of this scrape
+                continue
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    """
+    Fixed-bucket histogram per label set (count, sum and cumulative buckets on render).
+    Observing is a bisect and two additions under a lock.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # {labels: [per-bucket counts (last is +Inf), sum]}
+        self._series = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the wall-clock duration of the block, in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self, **labels) -> dict:
+        """{"count", "sum", "buckets": {upper bound: cumulative count}} for one label set."""
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            counts, total = (list(series[0]), series[1]) if series else ([0] * (len(self.buckets) + 1), 0.0)
+        cumulative, running = {}, 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            running += count
+            cumulative[bound] = running
+        return {"count": running, "sum": total, "buckets": cumulative}
+
+    def samples(self) -> list:
+        with self._lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+        lines = []
+        for key, (counts, total) in sorted(series.items()):
+            running = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                running += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {running}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {running}")
+        return lines
+
+
+class MetricsRegistry:
+    """Named metrics rendered together in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric_class, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_class(name, *args, **kwargs)
+            elif not isinstance(metric, metric_class):
+                raise ValueError(f"Metric '{name}' is already registered as a {metric.kind}.")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (),
+                  buckets: tuple = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+# Process-wide registry exposed at /metrics
+REGISTRY = MetricsRegistry()
+
+REQUEST_LATENCY = REGISTRY.histogram(
+    "api_request_duration_seconds", "HTTP request latency by route (time to response headers).",
+    ("method", "endpoint", "status"),
+)
+REQUESTS_IN_PROGRESS = REGISTRY.gauge(
+    "api_requests_in_progress", "HTTP requests currently being handled.",
+)
+WORKLOAD_IN_FLIGHT = REGISTRY.gauge(
+    "workload_in_flight", "Requests holding a concurrency slot, per workload.", ("workload",),
+)
+WORKLOAD_REJECTED = REGISTRY.gauge(
+    "workload_rejected", "Requests rejected because the workload was saturated, since startup.", ("workload",),
+)
+STAGE_LATENCY = REGISTRY.histogram(
+    "inference_stage_duration_seconds", "Time spent in each stage of a service call.", ("service", "stage"),
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "cache_requests_total", "Cache lookups by cache and result (hit kind or miss).", ("cache", "result"),
+)
+QUEUE_DEPTH = REGISTRY.gauge(
+    "queue_depth", "Items waiting in an in-process queue.", ("queue",),
+)
+
+
+def stage_timer(service: str, stage: str):
+    """Context manager recording one stage duration, e.g. `with stage_timer("vision", "forward"):`."""
+    return STAGE_LATENCY.time(service=service, stage=stage)
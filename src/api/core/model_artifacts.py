@@ -0,0 +1,85 @@
+import os
+import json
+import hashlib
+import logging
+from pathlib import Path
+import torch
+
+logger = logging.getLogger(__name__)
+
+# Name of the JSON metadata entry stored inside exported TorchScript archives
+METADATA_ENTRY = "metadata.json"
+# Sidecar remembering a file's SHA-256 along with the size and mtime it was computed for
+HASH_SIDECAR_SUFFIX = ".sha256.json"
+
+
+def file_sha256(path, chunk_size: int = 1024 * 1024) -> str:
+    """Hex SHA-256 of a file, read in chunks so large weights don't sit in memory."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cached_file_sha256(path) -> str:
+    """
+    `file_sha256` that reuses the digest stored in `<file>.sha256.json` while the file's
+    size and mtime are unchanged, so unchanged weights are not re-read on every start.
+    """
+    path = Path(path)
+    stat = path.stat()
+    sidecar = path.with_name(path.name + HASH_SIDECAR_SUFFIX)
+    try:
+        record = json.loads(sidecar.read_text())
+    except (OSError, ValueError):
+        record = {}
+    if record.get("sha256") and record.get("size") == stat.st_size and record.get("mtime_ns") == stat.st_mtime_ns:
+        return record["sha256"]
+
+    sha256 = file_sha256(path)
+    try:
+        tmp_path = sidecar.with_name(sidecar.name + ".tmp")
+        tmp_path.write_text(json.dumps({"sha256": sha256, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}))
+        os.replace(tmp_path, sidecar)
+    except OSError as e:
+        logger.warning(f"Could not record the hash of {path.name}: {e}")
+    return sha256
+
+
+def export_torchscript(model: torch.nn.Module, output_path, metadata: dict, channels_last: bool = True):
+    """
+    Traces an eval-mode model on a 224x224 example, freezes it (weights inlined as
+    constants, conv/bn folded) and saves it with `metadata` embedded in the archive.
+    """
+    example = torch.zeros(1, 3, 224, 224)
+    if channels_last:
+        example = example.contiguous(memory_format=torch.channels_last)
+
+    model.eval()
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+        frozen = torch.jit.freeze(traced)
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    extra_files = {METADATA_ENTRY: json.dumps(metadata)}
+    torch.jit.save(frozen, str(output_path), _extra_files=extra_files)
+    return output_path
+
+
+def load_torchscript(path, device: torch.device, optimize: bool = True):
+    """
+    Loads an exported TorchScript artifact and returns (model, metadata).
+
+    `optimize_for_inference` rewrites the graph to prepacked oneDNN ops, which cannot
+    be serialized, so it is applied here at load time rather than at export time.
+    """
+    extra_files = {METADATA_ENTRY: ""}
+    model = torch.jit.load(str(path), map_location=device, _extra_files=extra_files)
+    model.eval()
+    if optimize:
+        model = torch.jit.optimize_for_inference(model)
+    raw = extra_files[METADATA_ENTRY]
+    metadata = json.loads(raw) if raw else {}
+    return model, metadata
@@ -1,50 +1,168 @@
 import os
+import json
+import hashlib
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceModifiedError
 from azure.storage.blob import BlobServiceClient
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Sidecars next to each artifact: the blob version it was downloaded from, and of an unfinished download
+META_SUFFIX = ".meta.json"
+PART_SUFFIX = ".part"
+HASH_READ_SIZE = 1024 * 1024
+
+# Container and blob names shared with src/pipelines/upload_model_to_blob.py
+MODEL_CONTAINER_NAME = "ml-models"
+NO_SHOW_MODEL_BLOB = "ops/no_show_model.pkl"
+NO_SHOW_FEATURE_SCHEMA_BLOB = "ops/no_show_feature_schema.json"
+
+# Blob name -> local filename of the artifacts the API cannot start without
+REQUIRED_ARTIFACTS = {
+    "vision/vision_model.pth": "vision_model.pth",
+    NO_SHOW_MODEL_BLOB: "no_show_model.pkl"
+}
+
+# Artifacts the services can run without (they log a warning and degrade)
+OPTIONAL_ARTIFACTS = {
+    NO_SHOW_FEATURE_SCHEMA_BLOB: "no_show_feature_schema.json",
+    "vision/vision_model.ts": "vision_model.ts"
+}
+
+
+def _file_md5(path: Path, md5=None):
+    """MD5 of a file read in fixed-size blocks (memory stays flat for any size)."""
+    md5 = md5 or hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_READ_SIZE), b""):
+            md5.update(block)
+    return md5
+
+
+def _read_json(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json(path: Path, data: dict):
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(json.dumps(data))
+    os.replace(tmp_path, path)
+
+
 class AzureModelLoader:
     def __init__(self):
         self.storage_account_name = os.getenv("STORAGE_ACCOUNT_NAME", "clinicaldatalake25")
         self.sas_token = os.getenv("SAS_TOKEN")
-        self.container_name = "ml-models"
+        self.container_name = MODEL_CONTAINER_NAME
         # Models will be saved to 'src/api/models' to match Docker volume mount
-        self.models_dir = Path("src/api/models")
-        
+        self.models_dir = Path(os.getenv("MODELS_DIR", "src/api/models"))
+        # Artifacts downloaded in parallel, each as a stream of ranged reads of this size
+        self.max_workers = max(int(os.getenv("MODEL_DOWNLOAD_WORKERS", "4")), 1)
+        self.chunk_size = max(int(os.getenv("MODEL_DOWNLOAD_CHUNK_MB", "8")), 1) * 1024 * 1024
+
         self.account_url = f"https://{self.storage_account_name}.blob.core.windows.net"
 
-    def _download_file(self, blob_name: str, local_filename: str):
-        """Helper to download a single blob to a local file."""
+    def _create_container_client(self):
+        blob_service_client = BlobServiceClient(
+            account_url=self.account_url,
+            credential=self.sas_token,
+            max_single_get_size=self.chunk_size,
+            max_chunk_get_size=self.chunk_size
+        )
+        return blob_service_client.get_container_client(self.container_name)
+
+    def _is_current(self, target_path: Path, meta_path: Path, etag: str, md5: str) -> bool:
+        """Whether the local file is the blob version described by etag/md5."""
+        if not target_path.exists():
+            return False
+        if _read_json(meta_path).get("etag") == etag:
+            return True
+        # No record of where the file came from (e.g. downloaded by an older release): compare content
+        if md5 and _file_md5(target_path).hexdigest() == md5:
+            _write_json(meta_path, {"etag": etag, "md5": md5})
+            return True
+        return False
+
+    def _download_file(self, container_client, blob_name: str, local_filename: str):
+        """
+        Brings one blob up to date locally. Skips it when the local copy matches the blob's
+        ETag (or MD5); otherwise streams ranged reads into `<file>.part`, resuming a partial
+        download of the same blob version, checks the MD5 and atomically renames it into place.
+        """
         target_path = self.models_dir / local_filename
-        
-        if target_path.exists():
-            logger.info(f"Model '{local_filename}' already exists locally. Skipping download.")
-            return
+        meta_path = target_path.with_name(target_path.name + META_SUFFIX)
+        part_path = target_path.with_name(target_path.name + PART_SUFFIX)
+        part_meta_path = part_path.with_name(part_path.name + META_SUFFIX)
+        blob_client = container_client.get_blob_client(blob_name)
 
-        logger.info(f"Downloading '{blob_name}' from Azure to '{target_path}'...")
-        
         try:
-            blob_service_client = BlobServiceClient(account_url=self.account_url, credential=self.sas_token)
-            blob_client = blob_service_client.get_blob_client(container=self.container_name, blob=blob_name)
-            
-            target_path.parent.mkdir(parents=True, exist_ok=True)
-            
-            with open(target_path, "wb") as download_file:
-                download_file.write(blob_client.download_blob().readall())
-                
-            logger.info(f"Successfully downloaded '{local_filename}'.")
-            
+            properties = blob_client.get_blob_properties()
         except Exception as e:
-            logger.error(f"Failed to download '{blob_name}': {e}")
+            if target_path.exists():
+                logger.warning(f"Could not check '{blob_name}' for updates ({e}). Using local '{local_filename}'.")
+                return
             raise
 
+        etag, size = properties.etag, properties.size
+        content_md5 = properties.content_settings.content_md5
+        md5 = bytes(content_md5).hex() if content_md5 else None
+
+        if self._is_current(target_path, meta_path, etag, md5):
+            logger.info(f"Model '{local_filename}' is up to date. Skipping download.")
+            return
+
+        # Resume only a partial download of this exact blob version
+        offset = 0
+        if part_path.exists() and _read_json(part_meta_path).get("etag") == etag and part_path.stat().st_size <= size:
+            offset = part_path.stat().st_size
+        else:
+            part_path.unlink(missing_ok=True)
+            _write_json(part_meta_path, {"etag": etag})
+
+        action = f"Resuming '{blob_name}' at {offset}/{size} bytes" if offset else f"Downloading '{blob_name}' ({size} bytes)"
+        logger.info(f"{action} to '{target_path}'...")
+
+        digest = _file_md5(part_path) if offset else hashlib.md5()
+        try:
+            if offset < size:
+                # The ETag condition fails the read if the blob is replaced mid-download
+                downloader = blob_client.download_blob(
+                    offset=offset,
+                    etag=etag,
+                    match_condition=MatchConditions.IfNotModified,
+                    max_concurrency=1
+                )
+                with open(part_path, "ab") as part_file:
+                    for chunk in downloader.chunks():
+                        part_file.write(chunk)
+                        digest.update(chunk)
+        except ResourceModifiedError:
+            part_path.unlink(missing_ok=True)
+            part_meta_path.unlink(missing_ok=True)
+            raise RuntimeError(f"'{blob_name}' changed during download. It will be fetched again on the next start.")
+
+        if md5 and digest.hexdigest() != md5:
+            part_path.unlink(missing_ok=True)
+            part_meta_path.unlink(missing_ok=True)
+            raise ValueError(f"MD5 mismatch for '{blob_name}': expected {md5}, got {digest.hexdigest()}.")
+
+        os.replace(part_path, target_path)
+        _write_json(meta_path, {"etag": etag, "md5": md5})
+        part_meta_path.unlink(missing_ok=True)
+        logger.info(f"Successfully downloaded '{local_filename}'.")
+
     def download_models(self):
         """
-        Ensures required models are present locally. Downloads from Azure if missing.
+        Ensures required models are present and current locally, downloading all artifacts
+        from Azure in parallel.
         """
         if not self.sas_token:
             logger.warning("SAS_TOKEN not found. Models cannot be downloaded from Azure.")
@@ -53,11 +171,24 @@ class AzureModelLoader:
         # Ensure models directory exists
         self.models_dir.mkdir(parents=True, exist_ok=True)
 
-        # Define models to download (Blob Name -> Local Filename)
-        models_to_sync = {
-            "vision/vision_model.pth": "vision_model.pth",
-            "ops/no_show_model.pkl": "no_show_model.pkl"
-        }
+        container_client = self._create_container_client()
+        artifacts = {**REQUIRED_ARTIFACTS, **OPTIONAL_ARTIFACTS}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(artifacts))) as pool:
+            futures = {
+                blob_name: pool.submit(self._download_file, container_client, blob_name, local_name)
+                for blob_name, local_name in artifacts.items()
+            }
+
+        failed = []
+        for blob_name, future in futures.items():
+            error = future.exception()
+            if error is None:
+                continue
+            if blob_name in OPTIONAL_ARTIFACTS:
+                logger.warning(f"Optional artifact '{blob_name}' is unavailable. Continuing without it.")
+            else:
+                logger.error(f"Failed to download '{blob_name}': {error}")
+                failed.append(blob_name)
 
-        for blob_name, local_name in models_to_sync.items():
-            self._download_file(blob_name, local_name)
\ No newline at end of file
+        if failed:
+            raise RuntimeError(f"Required models could not be downloaded: {', '.join(failed)}")
@@ -0,0 +1,229 @@
+import os
+import re
+import sys
+import time
+import random
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+FOLDED_SUFFIX = ".folded"
+TORCH_STACKS_SUFFIX = ".torch.folded"
+TORCH_TRACE_SUFFIX = ".torch.json"
+
+_UNSAFE_TAG_RE = re.compile(r"[^A-Za-z0-9_-]+")
+
+
+def _tag(value) -> str:
+    """File-name-safe tag: "/predict/vision" -> "predict_vision"."""
+    return _UNSAFE_TAG_RE.sub("_", str(value or "")).strip("_") or "none"
+
+
+def _profile_stem(output_dir: Path, endpoint, model_version) -> Path:
+    """`<time>_<endpoint>_<model version>_<µs>`; the suffix keeps same-second files apart."""
+    return output_dir / (
+        f"{time.strftime('%Y%m%dT%H%M%S')}_{_tag(endpoint)}_{_tag(model_version)}_{time.time_ns() // 1000 % 10**6:06d}"
+    )
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class StackSampler:
+    """
+    Statistical profiler: a background thread snapshots every thread's Python stack with
+    `sys._current_frames()` at a fixed interval and counts identical stacks.
+
+    Output is the "folded" format (`thread;outer;...;inner count` per line) that
+    flamegraph.pl, speedscope and inferno read directly. Overhead is one stack walk per
+    thread per interval; nothing is traced between samples.
+    """
+
+    def __init__(self, interval_ms: float = 10.0):
+        self.interval = max(interval_ms, 1.0) / 1000.0
+        self.samples = 0
+        self.started_at = None
+        self._stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample_once(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own_ident = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            self._stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample_once()
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+
+class TorchForwardProfiler:
+    """
+    Arms torch.profiler for the next N forward passes. `record()` wraps a forward pass:
+    when armed it profiles that call and writes a Chrome trace plus folded stacks;
+    otherwise it costs one integer check.
+    """
+
+    def __init__(self, output_dir: Path, max_forwards: int = 50):
+        self.output_dir = Path(output_dir)
+        self.max_forwards = max_forwards
+        self._remaining = 0
+        self._lock = threading.Lock()
+
+    @property
+    def remaining(self) -> int:
+        return self._remaining
+
+    def arm(self, forwards: int) -> int:
+        with self._lock:
+            self._remaining = max(0, min(int(forwards), self.max_forwards))
+            return self._remaining
+
+    def _take(self) -> bool:
+        if not self._remaining:
+            return False
+        with self._lock:
+            if not self._remaining:
+                return False
+            self._remaining -= 1
+            return True
+
+    @contextmanager
+    def record(self, tag: str, model_version: str = None, use_cuda: bool = False):
+        if not self._take():
+            yield
+            return
+
+        from torch.profiler import ProfilerActivity, profile
+
+        activities = [ProfilerActivity.CPU] + ([ProfilerActivity.CUDA] if use_cuda else [])
+        with profile(activities=activities, record_shapes=True, with_stack=True) as prof:
+            yield
+        stem = _profile_stem(self.output_dir, tag, model_version)
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            prof.export_chrome_trace(str(stem) + TORCH_TRACE_SUFFIX)
+            metric = "self_cuda_time_total" if use_cuda else "self_cpu_time_total"
+            prof.export_stacks(str(stem) + TORCH_STACKS_SUFFIX, metric)
+            logger.info(f"Torch profile written to {stem}{TORCH_TRACE_SUFFIX}")
+        except Exception as e:
+            logger.error(f"Could not write torch profile: {e}")
+
+
+class ProfilingManager:
+    """
+    Admin-controlled profiling for a running worker:
+
+    - request sampling: a `sample_fraction` of requests run under a StackSampler
+      (one at a time, so overhead stays bounded), one folded file per request;
+    - on-demand capture: sample the whole process for N seconds;
+    - torch: profile the next N vision forward passes (see TorchForwardProfiler).
+
+    Files are named `<time>_<endpoint>_<model version>` and kept in `output_dir`.
+    """
+
+    def __init__(self, output_dir, sample_fraction: float = 0.0, interval_ms: float = 10.0):
+        self.output_dir = Path(output_dir)
+        self.sample_fraction = sample_fraction
+        self.interval_ms = interval_ms
+        self.torch = TorchForwardProfiler(self.output_dir)
+        self._request_lock = threading.Lock()
+        self._capture_lock = threading.Lock()
+
+    def set_sample_fraction(self, fraction: float) -> float:
+        self.sample_fraction = min(max(float(fraction), 0.0), 1.0)
+        logger.info(f"Request profiling sample fraction set to {self.sample_fraction}.")
+        return self.sample_fraction
+
+    def _write(self, sampler: StackSampler, endpoint: str, model_version: str, duration: float) -> Path:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        path = Path(f"{_profile_stem(self.output_dir, endpoint, model_version)}{FOLDED_SUFFIX}")
+        path.write_text(sampler.folded())
+        logger.info(f"Profile of {endpoint} ({sampler.samples} samples over {duration:.2f}s) written to {path}")
+        return path
+
+    def start_request_sample(self):
+        """Returns a running StackSampler if this request was picked for sampling, else None."""
+        if self.sample_fraction <= 0 or random.random() >= self.sample_fraction:
+            return None
+        if not self._request_lock.acquire(blocking=False):
+            return None
+        sampler = StackSampler(self.interval_ms)
+        sampler.start()
+        return sampler
+
+    def finish_request_sample(self, sampler: StackSampler, endpoint: str, model_version: str = None):
+        try:
+            sampler.stop()
+            if sampler.samples:
+                self._write(sampler, endpoint, model_version, time.perf_counter() - sampler.started_at)
+        except Exception as e:
+            logger.error(f"Could not write request profile: {e}")
+        finally:
+            self._request_lock.release()
+
+    def capture(self, seconds: float, tag: str = "capture", model_version: str = None) -> Path:
+        """Samples the whole process for `seconds` (blocking) and returns the folded file."""
+        if not self._capture_lock.acquire(blocking=False):
+            raise RuntimeError("A profile capture is already running.")
+        try:
+            sampler = StackSampler(self.interval_ms)
+            sampler.start()
+            time.sleep(seconds)
+            sampler.stop()
+            return self._write(sampler, tag, model_version, seconds)
+        finally:
+            self._capture_lock.release()
+
+    def list_files(self) -> list:
+        if not self.output_dir.exists():
+            return []
+        return sorted(
+            (path.name for path in self.output_dir.iterdir()
+             if path.name.endswith((FOLDED_SUFFIX, TORCH_TRACE_SUFFIX))),
+            reverse=True,
+        )
+
+    def resolve(self, name: str) -> Path:
+        """Path of a profile file in `output_dir`; rejects anything outside it."""
+        path = (self.output_dir / name).resolve()
+        if path.parent != self.output_dir.resolve() or not path.is_file():
+            raise FileNotFoundError(name)
+        return path
+
+    def stats(self) -> dict:
+        return {
+            "output_dir": str(self.output_dir),
+            "sample_fraction": self.sample_fraction,
+            "interval_ms": self.interval_ms,
+            "torch_forwards_remaining": self.torch.remaining,
+            "files": len(self.list_files()),
+        }
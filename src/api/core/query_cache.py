@@ -0,0 +1,132 @@
+import re
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_EDGE_PUNCTUATION = " ?!.,;:\"'"
+
+
+def index_build_stamp_blob(index_name: str) -> str:
+    """Blob (in the knowledge-base container) where build_vector_index.py publishes the Azure index version."""
+    return f"index-builds/{index_name}.json"
+
+
+def normalize_query(query: str) -> str:
+    """Case-, whitespace- and trailing-punctuation-insensitive form used for exact matches."""
+    return _WHITESPACE_RE.sub(" ", query).strip(_EDGE_PUNCTUATION).lower()
+
+
+class SemanticQueryCache:
+    """
+    Two-tier LRU cache for RAG answers.
+
+    Tier 1 is an exact match on the normalized query text. Tier 2 compares the query
+    embedding with the embeddings of cached queries (cosine similarity, one vectorized
+    matrix-vector product) and returns the closest entry above `similarity_threshold`.
+    Entries are tied to an index version; `ensure_version` drops everything when the
+    knowledge base is rebuilt.
+    """
+
+    def __init__(self, max_entries: int = 512, similarity_threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.index_version = None
+        self._lock = threading.Lock()
+        # normalized query -> (slot, value), in LRU order
+        self._entries = OrderedDict()
+        # Row `slot` holds the unit-norm embedding of the entry stored in that slot
+        self._matrix = None
+        self._slot_keys = [None] * max_entries
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def ensure_version(self, version):
+        """Invalidates the cache if the knowledge-base index version changed."""
+        with self._lock:
+            if version == self.index_version:
+                return
+            if self.index_version is not None:
+                logger.info(f"Knowledge base index changed ({self.index_version} -> {version}). Clearing query cache.")
+            self.index_version = version
+            self._clear()
+
+    def get_exact(self, query: str):
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry[1]
+
+    def get_similar(self, embedding):
+        """Closest cached answer with cosine similarity >= threshold, or None (counted as a miss)."""
+        query_vec = self._unit(embedding)
+        with self._lock:
+            if self._matrix is not None and self._entries:
+                scores = self._matrix @ query_vec
+                # Unused slots must never win
+                for slot in self._free_slots:
+                    scores[slot] = -np.inf
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    key = self._slot_keys[best]
+                    self._entries.move_to_end(key)
+                    self.semantic_hits += 1
+                    return self._entries[key][1]
+            self.misses += 1
+            return None
+
+    def put(self, query: str, embedding, value):
+        key = normalize_query(query)
+        query_vec = self._unit(embedding)
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, query_vec.shape[0]), dtype=np.float32)
+
+            if key in self._entries:
+                slot = self._entries[key][0]
+            else:
+                if not self._free_slots:
+                    _, (evicted_slot, _) = self._entries.popitem(last=False)
+                    self._slot_keys[evicted_slot] = None
+                    self._free_slots.append(evicted_slot)
+                slot = self._free_slots.pop()
+
+            self._matrix[slot] = query_vec
+            self._slot_keys[slot] = key
+            self._entries[key] = (slot, value)
+            self._entries.move_to_end(key)
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self._entries.clear()
+        self._slot_keys = [None] * self.max_entries
+        self._free_slots = list(range(self.max_entries - 1, -1, -1))
+
+    @staticmethod
+    def _unit(embedding) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "index_version": self.index_version,
+            }
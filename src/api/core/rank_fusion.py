@@ -0,0 +1,37 @@
+import hashlib
+
+# Rank constant from the original reciprocal-rank fusion paper (Cormack et al., 2009)
+DEFAULT_RRF_K = 60
+
+
+def content_key(text: str) -> str:
+    """Fusion key: the same chunk text from different retrievers counts as one result."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def reciprocal_rank_fusion(rankings: dict, weights: dict = None, k: int = DEFAULT_RRF_K, limit: int = None) -> list:
+    """
+    Fuses ranked Document lists ({retriever name: [Document, ...]}, best first) with
+    weighted reciprocal-rank fusion: score = sum(weight / (k + rank)), rank starting at 1.
+    Returns the fused Documents, best first; ties keep first-seen order.
+    """
+    weights = weights or {}
+    scores = {}
+    documents = {}
+    for name, ranking in rankings.items():
+        weight = weights.get(name, 1.0)
+        if weight <= 0:
+            continue
+        seen = set()
+        for rank, doc in enumerate(ranking, start=1):
+            key = content_key(doc.page_content)
+            if key in seen:
+                continue
+            seen.add(key)
+            documents.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + weight / (k + rank)
+
+    fused = sorted(scores, key=scores.get, reverse=True)
+    if limit is not None:
+        fused = fused[:limit]
+    return [documents[key] for key in fused]
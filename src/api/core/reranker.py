@@ -0,0 +1,102 @@
+import time
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RERANKER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+# Weight of the newest measurement in the per-pair latency estimate
+_LATENCY_SMOOTHING = 0.2
+# While re-ranking is being skipped, re-measure with a small probe at most this often
+_PROBE_INTERVAL_SECONDS = 30.0
+
+# Warm-up pairs shaped like real traffic: a question against passages about the
+# length of an indexed chunk (build_vector_index.CHUNK_SIZE), so the first estimate is realistic
+_WARMUP_QUERY = "What are the recommended first-line treatments for community-acquired pneumonia in adults?"
+_WARMUP_PASSAGE = (
+    "Community-acquired pneumonia is diagnosed from clinical signs, chest radiography and laboratory "
+    "findings. Empirical antibiotic therapy should start promptly and be reviewed once culture results "
+    "are available. Severity scores guide the choice between outpatient and inpatient management. "
+) * 8
+_WARMUP_PAIRS = 8
+
+
+class CrossEncoderReranker:
+    """
+    Re-orders retrieval candidates with a small CPU cross-encoder, scoring all
+    (query, chunk) pairs in one batched forward pass.
+
+    Per-pair latency is tracked as a moving average. Given a time budget, only as many
+    top candidates as fit are re-scored; if that is fewer than the k requested, the
+    retriever's own order is returned unchanged (counted as a fallback), except for a
+    periodic probe that re-scores the top k to refresh the estimate.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_RERANKER_MODEL, max_length: int = 512):
+        from sentence_transformers import CrossEncoder
+
+        self.model_name = model_name
+        self.model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+        self._lock = threading.Lock()
+        self.seconds_per_pair = None
+        self.reranked = 0
+        self.fallbacks = 0
+        self._last_measured = 0.0
+        # Loads the weights and seeds the latency estimate before the first request
+        self._score(_WARMUP_QUERY, [_WARMUP_PASSAGE] * _WARMUP_PAIRS)
+        logger.info(f"Cross-encoder reranker '{model_name}' ready ({self.seconds_per_pair * 1000:.1f} ms per pair).")
+
+    def _score(self, query: str, texts: list, reset: bool = False) -> np.ndarray:
+        start = time.perf_counter()
+        scores = self.model.predict([(query, text) for text in texts], batch_size=len(texts), show_progress_bar=False)
+        per_pair = (time.perf_counter() - start) / len(texts)
+        with self._lock:
+            self._last_measured = time.monotonic()
+            if self.seconds_per_pair is None or reset:
+                self.seconds_per_pair = per_pair
+            else:
+                self.seconds_per_pair += _LATENCY_SMOOTHING * (per_pair - self.seconds_per_pair)
+        return np.asarray(scores, dtype=np.float32)
+
+    def affordable_pairs(self, budget_ms: float) -> int:
+        """How many pairs the latency estimate says fit in `budget_ms`."""
+        if not self.seconds_per_pair:
+            return 0
+        return int(budget_ms / 1000.0 / self.seconds_per_pair)
+
+    def rerank(self, query: str, docs: list, k: int, budget_ms: float = None) -> list:
+        """Returns the top-k Documents, re-scored by the cross-encoder when the budget allows."""
+        if len(docs) <= 1:
+            return docs[:k]
+        candidates = len(docs)
+        if budget_ms is not None:
+            candidates = min(candidates, self.affordable_pairs(budget_ms))
+        reset = False
+        if candidates < min(k, len(docs)) or candidates < 2:
+            if time.monotonic() - self._last_measured < _PROBE_INTERVAL_SECONDS:
+                with self._lock:
+                    self.fallbacks += 1
+                logger.info(f"Rerank skipped: only {candidates} of {len(docs)} candidates fit the {budget_ms} ms budget.")
+                return docs[:k]
+            # Skipping never measures anything, so one slow call would disable re-ranking for good;
+            # periodically re-score just the top k and take that as the fresh estimate
+            candidates, reset = max(min(k, len(docs)), 2), True
+            logger.info(f"Rerank probe: re-measuring latency on {candidates} candidates.")
+
+        scores = self._score(query, [doc.page_content for doc in docs[:candidates]], reset=reset)
+        order = np.argsort(-scores, kind="stable")
+        with self._lock:
+            self.reranked += 1
+        # Candidates that did not fit the budget keep their retrieval order after the re-scored ones
+        return ([docs[i] for i in order] + docs[candidates:])[:k]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "model": self.model_name,
+                "ms_per_pair": self.seconds_per_pair * 1000 if self.seconds_per_pair else None,
+                "reranked": self.reranked,
+                "fallbacks": self.fallbacks,
+            }
@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Disk writes between sweeps that re-measure the directory and delete expired files
+_SWEEP_INTERVAL_WRITES = 1000
+# A sweep over the byte budget trims the oldest entries down to this fraction of it
+_SWEEP_TARGET_FRACTION = 0.9
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache of JSON-serializable results with a time-to-live.
+
+    With `disk_dir` set, entries are also written to `<disk_dir>/<key[:2]>/<key>.json`
+    so they survive restarts and can be shared by workers on the same volume. Memory
+    misses fall through to disk, and fresh disk hits are promoted back into memory.
+    The disk tier is kept under `max_disk_bytes` by a background sweep that deletes
+    expired files, then the oldest ones; expired files found on a read are deleted too.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600, disk_dir=None,
+                 max_disk_bytes: int = 1024 * 1024 * 1024):
+        self.max_entries = max_entries
+        # ttl_seconds <= 0 disables expiry
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        # max_disk_bytes <= 0 leaves the disk tier unbounded (expired files are still swept)
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Estimated size of the disk tier, re-measured by every sweep
+        self._disk_bytes = 0
+        self._writes_since_sweep = 0
+        self._sweeping = False
+
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            # Measures what earlier runs (or other workers) left behind
+            self._start_sweep()
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - created_at > self.ttl_seconds
+
+    def get(self, key: str):
+        """Returns the cached value for `key`, or None on a miss or an expired entry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if not self._expired(created_at):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        entry = self._read_disk(key)
+        if entry is not None and self._expired(entry[0]):
+            self._delete_disk(key)
+            entry = None
+        with self._lock:
+            if entry is not None:
+                self._store(key, entry)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value):
+        entry = (time.time(), value)
+        with self._lock:
+            self._store(key, entry)
+        self._write_disk(key, entry)
+
+    def _store(self, key: str, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "disk_bytes": self._disk_bytes if self.disk_dir is not None else None,
+            }
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _read_disk(self, key: str):
+        if self.disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r") as f:
+                payload = json.load(f)
+            return payload["created_at"], payload["value"]
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache entry {path}: {e}")
+            return None
+
+    def _write_disk(self, key: str, entry):
+        if self.disk_dir is None:
+            return
+        path = self._disk_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write then rename, so readers never see a half-written entry
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump({"created_at": entry[0], "value": entry[1]}, f)
+                size = f.tell()
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Could not write cache entry {path}: {e}")
+            return
+
+        with self._lock:
+            self._disk_bytes += size
+            self._writes_since_sweep += 1
+            due = (self._writes_since_sweep >= _SWEEP_INTERVAL_WRITES
+                   or 0 < self.max_disk_bytes < self._disk_bytes)
+        if due:
+            self._start_sweep()
+
+    def _delete_disk(self, key: str):
+        try:
+            self._disk_path(key).unlink()
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Could not delete expired cache entry for {key}: {e}")
+
+    def _start_sweep(self):
+        """Runs `sweep` on a background thread unless one is already running."""
+        with self._lock:
+            if self._sweeping:
+                return
+            self._sweeping = True
+            self._writes_since_sweep = 0
+        threading.Thread(target=self.sweep, name="result-cache-sweep", daemon=True).start()
+
+    def sweep(self):
+        """
+        Deletes expired (and abandoned temporary) files from the disk tier, then the
+        oldest entries while it is over `max_disk_bytes`. File mtimes stand in for the
+        entries' creation times, so no entry has to be opened.
+        """
+        try:
+            now = time.time()
+            files, removed = [], 0
+            for path in self.disk_dir.glob("*/*"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                age = now - stat.st_mtime
+                stale_tmp = path.suffix == ".tmp" and age > 3600
+                if stale_tmp or (path.suffix == ".json" and self._expired(stat.st_mtime)):
+                    path.unlink(missing_ok=True)
+                    removed += 1
+                elif path.suffix == ".json":
+                    files.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in files)
+            if 0 < self.max_disk_bytes < total:
+                target = self.max_disk_bytes * _SWEEP_TARGET_FRACTION
+                files.sort()
+                for _, size, path in files:
+                    if total <= target:
+                        break
+                    path.unlink(missing_ok=True)
+                    total -= size
+                    removed += 1
+
+            with self._lock:
+                self._disk_bytes = total
+            if removed:
+                logger.info(f"Result cache sweep removed {removed} files; {total / 1e6:.1f} MB on disk.")
+        except Exception as e:
+            logger.warning(f"Result cache sweep of {self.disk_dir} failed: {e}")
+        finally:
+            with self._lock:
+                self._sweeping = False
@@ -0,0 +1,238 @@
+import logging
+import math
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# LightGBM's missing-value handling for numerical splits
+MISSING_NONE = 0
+MISSING_ZERO = 1
+MISSING_NAN = 2
+_MISSING_TYPES = {"None": MISSING_NONE, "Zero": MISSING_ZERO, "NaN": MISSING_NAN}
+
+# Values with |x| <= kZeroThreshold count as zero in LightGBM (a C++ float: 1e-35f, not 1e-35)
+K_ZERO_THRESHOLD = float(np.float32(1e-35))
+
+# The generated scorer nests one block per tree level; Python allows 100 indentation levels
+MAX_TREE_DEPTH = 90
+
+
+class CompiledTreeEnsemble:
+    """
+    Flat, array-based copy of a LightGBM booster for low-latency single-row scoring.
+
+    Split nodes of all trees live in parallel arrays (feature, threshold, left/right
+    child, missing-value handling) with leaves encoded as `~leaf_index`. At load time
+    the arrays are turned into one generated Python function of nested comparisons,
+    so scoring a single patient costs a few hundred float comparisons instead of
+    LightGBM's per-call input conversion. Multi-row inputs go to the booster itself,
+    whose threaded C++ path is faster on rosters than anything NumPy can do per split.
+    Exposes the same `predict(X)` call as a Booster.
+    """
+
+    def __init__(self, booster, feature, threshold, left_child, right_child, missing_type,
+                 default_right, leaf_value, roots, num_features,
+                 transform="identity", sigmoid=1.0, average_output=False):
+        self.booster = booster
+        self.feature = feature
+        self.threshold = threshold
+        # Child index, or ~leaf_index for leaves (as in LightGBM's own model format)
+        self.left_child = left_child
+        self.right_child = right_child
+        self.missing_type = missing_type
+        # Side taken by missing values (NaN, or zero under missing_type 'Zero')
+        self.default_right = default_right
+        self.leaf_value = leaf_value
+        # Root of each tree: a node index, or ~leaf_index for single-leaf trees
+        self.roots = roots
+        self.num_features = num_features
+        self.num_trees = len(roots)
+        self.transform = transform
+        self.sigmoid = sigmoid
+        self.average_output = average_output
+        self.source = self._generate_source()
+        namespace = {}
+        exec(compile(self.source, "<compiled tree ensemble>", "exec"), namespace)
+        self._score_row = namespace["score_row"]
+
+    @classmethod
+    def from_booster(cls, booster):
+        """Converts a trained single-output LightGBM Booster with numerical splits."""
+        dump = booster.dump_model()
+
+        if dump.get("num_class", 1) != 1 or dump.get("num_tree_per_iteration", 1) != 1:
+            raise NotImplementedError("Only single-output boosters can be compiled.")
+
+        transform, sigmoid = cls._parse_objective(dump.get("objective", ""))
+
+        nodes = {"feature": [], "threshold": [], "left_child": [], "right_child": [],
+                 "missing_type": [], "default_right": []}
+        leaf_value, roots = [], []
+        for tree in dump["tree_info"]:
+            roots.append(cls._flatten_node(tree["tree_structure"], nodes, leaf_value, depth=0))
+
+        return cls(
+            booster=booster,
+            feature=np.asarray(nodes["feature"], dtype=np.int32),
+            threshold=np.asarray(nodes["threshold"], dtype=np.float64),
+            left_child=np.asarray(nodes["left_child"], dtype=np.int32),
+            right_child=np.asarray(nodes["right_child"], dtype=np.int32),
+            missing_type=np.asarray(nodes["missing_type"], dtype=np.int8),
+            default_right=np.asarray(nodes["default_right"], dtype=bool),
+            leaf_value=np.asarray(leaf_value, dtype=np.float64),
+            roots=np.asarray(roots, dtype=np.int32),
+            num_features=dump.get("max_feature_idx", 0) + 1,
+            transform=transform,
+            sigmoid=sigmoid,
+            average_output=bool(dump.get("average_output", False)),
+        )
+
+    @staticmethod
+    def _flatten_node(node, nodes: dict, leaf_value: list, depth: int) -> int:
+        """Appends `node`'s subtree to the flat arrays; returns its index (~leaf for leaves)."""
+        if "leaf_value" in node:
+            leaf_value.append(node["leaf_value"])
+            return ~(len(leaf_value) - 1)
+
+        if node.get("decision_type", "<=") != "<=":
+            raise NotImplementedError("Categorical splits are not supported by the compiled backend.")
+        if depth >= MAX_TREE_DEPTH:
+            raise NotImplementedError(f"Trees deeper than {MAX_TREE_DEPTH} levels are not supported.")
+
+        idx = len(nodes["feature"])
+        nodes["feature"].append(node["split_feature"])
+        nodes["threshold"].append(node["threshold"])
+        nodes["missing_type"].append(_MISSING_TYPES[node.get("missing_type", "None")])
+        nodes["default_right"].append(not node.get("default_left", True))
+        nodes["left_child"].append(0)
+        nodes["right_child"].append(0)
+        nodes["left_child"][idx] = CompiledTreeEnsemble._flatten_node(node["left_child"], nodes, leaf_value, depth + 1)
+        nodes["right_child"][idx] = CompiledTreeEnsemble._flatten_node(node["right_child"], nodes, leaf_value, depth + 1)
+        return idx
+
+    @staticmethod
+    def _parse_objective(objective: str):
+        """Maps LightGBM's objective string (e.g. 'binary sigmoid:1') to an output transform."""
+        parts = objective.split()
+        name = parts[0] if parts else "regression"
+        params = dict(p.split(":", 1) for p in parts[1:] if ":" in p)
+
+        if name in ("binary", "cross_entropy", "xentropy"):
+            return "sigmoid", float(params.get("sigmoid", 1.0))
+        if name in ("regression", "regression_l2", "regression_l1", "huber", "fair", "quantile", "mape"):
+            return "identity", 1.0
+        raise NotImplementedError(f"Objective '{name}' is not supported by the compiled backend.")
+
+    def _goes_right(self, idx: int) -> str:
+        """
+        Python condition for taking the right branch of split `idx` on row `x`, with inputs
+        already passed through LightGBM's zero threshold. `NaN <= t` and `NaN > t` are both
+        False, so the form of the comparison decides where NaN goes.
+        """
+        value = f"x[{self.feature[idx]}]"
+        threshold = repr(float(self.threshold[idx]))
+        missing_type = self.missing_type[idx]
+        default_right = bool(self.default_right[idx])
+
+        if missing_type == MISSING_ZERO:
+            # Zero and NaN (read as zero) are missing and take the default side
+            if default_right:
+                return f"not ({value} <= {threshold} and {value} != 0.0)"
+            return f"{value} > {threshold} and {value} != 0.0"
+        # 'NaN' splits learned a direction; under 'None', NaN is read as 0.0 and compared
+        nan_right = default_right if missing_type == MISSING_NAN else 0.0 > self.threshold[idx]
+        return f"not {value} <= {threshold}" if nan_right else f"{value} > {threshold}"
+
+    def _generate_source(self) -> str:
+        lines = ["def score_row(x):", "    total = 0.0"]
+
+        def emit(node: int, indent: str):
+            if node < 0:
+                lines.append(f"{indent}total += {float(self.leaf_value[~node])!r}")
+                return
+            lines.append(f"{indent}if {self._goes_right(node)}:")
+            emit(int(self.right_child[node]), indent + "    ")
+            lines.append(f"{indent}else:")
+            emit(int(self.left_child[node]), indent + "    ")
+
+        for root in self.roots:
+            emit(int(root), "    ")
+        lines.append("    return total")
+        return "\n".join(lines) + "\n"
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.feature, self.threshold, self.left_child, self.right_child, self.missing_type,
+                  self.default_right, self.leaf_value, self.roots]
+        return sum(a.nbytes for a in arrays)
+
+    def _raw_row(self, row) -> float:
+        # LightGBM reads |x| <= kZeroThreshold as exactly 0.0 before comparing against any split
+        x = [0.0 if -K_ZERO_THRESHOLD <= v <= K_ZERO_THRESHOLD else v for v in row.tolist()]
+        raw = self._score_row(x)
+        if self.average_output and self.num_trees:
+            raw /= self.num_trees
+        return raw
+
+    def predict(self, X, **kwargs) -> np.ndarray:
+        """Same output as `Booster.predict(X)`: probabilities for binary objectives."""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] < self.num_features:
+            raise ValueError(f"Expected a 2-D array with {self.num_features} features, got shape {X.shape}.")
+        if X.shape[0] != 1:
+            return self.booster.predict(X, **kwargs)
+
+        raw = self._raw_row(X[0])
+        if self.transform == "sigmoid":
+            return np.array([1.0 / (1.0 + math.exp(-self.sigmoid * raw))])
+        return np.array([raw])
+
+    def parity_error(self, n_samples: int = 512, seed: int = 0) -> float:
+        """
+        Max absolute difference against `booster.predict` on probe rows that straddle
+        the learned split thresholds, so every branch direction gets exercised, with
+        NaN, exact zeros and values inside LightGBM's zero threshold mixed in.
+        """
+        rng = np.random.default_rng(seed)
+        X = np.zeros((n_samples, self.num_features), dtype=np.float64)
+        for f in range(self.num_features):
+            cuts = self.threshold[self.feature == f]
+            if cuts.size == 0:
+                continue
+            X[:, f] = rng.choice(cuts, size=n_samples) + rng.choice([-0.5, 0.0, 0.5], size=n_samples)
+        special = rng.choice([np.nan, 0.0, -1e-36, 1e-36], size=X.shape)
+        replace = rng.random(X.shape) < 0.08
+        X[replace] = special[replace]
+
+        expected = np.asarray(self.booster.predict(X), dtype=np.float64)
+        actual = np.concatenate([self.predict(X[i:i + 1]) for i in range(n_samples)])
+        return float(np.max(np.abs(actual - expected)))
+
+
+def compile_models(models: dict, tolerance: float = 1e-9) -> dict:
+    """
+    Replaces every booster in `models` with a CompiledTreeEnsemble that matches its
+    output within `tolerance`. Boosters that cannot be compiled or fail the parity
+    check are kept as-is.
+    """
+    compiled = {}
+    for name, booster in models.items():
+        try:
+            ensemble = CompiledTreeEnsemble.from_booster(booster)
+            error = ensemble.parity_error()
+        except Exception as e:
+            logger.warning(f"Could not compile '{name}', keeping LightGBM predictor: {e}")
+            compiled[name] = booster
+            continue
+
+        if not math.isfinite(error) or error > tolerance:
+            logger.error(f"Compiled '{name}' deviates from LightGBM by {error:.3g}. Keeping LightGBM predictor.")
+            compiled[name] = booster
+            continue
+
+        logger.info(
+            f"Compiled '{name}': {ensemble.num_trees} trees, {ensemble.nbytes / 1024:.1f} KiB of node arrays, "
+            f"max parity error {error:.3g}."
+        )
+        compiled[name] = ensemble
+    return compiled
@@ -0,0 +1,104 @@
+import logging
+import torch
+import torch.nn as nn
+from torchvision import models
+from torchvision.models import quantization as quantizable_models
+
+logger = logging.getLogger(__name__)
+
+# Supported inference precisions for the ResNet50 vision model
+PRECISION_MODES = ("fp32", "int8_dynamic", "int8_static", "bf16")
+
+
+def bf16_supported() -> bool:
+    """True when the CPU has native bfloat16 kernels (AVX512-BF16 / AMX) available to oneDNN."""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except Exception:
+        return False
+
+
+def quantized_engine() -> str:
+    """Picks the best available quantized kernel backend for this CPU."""
+    for engine in ("x86", "fbgemm", "qnnpack"):
+        if engine in torch.backends.quantized.supported_engines:
+            return engine
+    raise RuntimeError("No quantized engine is available in this PyTorch build.")
+
+
+def resolve_precision(precision: str, device: torch.device) -> str:
+    """Validates the requested mode and downgrades it to FP32 when the hardware can't run it."""
+    precision = (precision or "fp32").lower()
+    if precision not in PRECISION_MODES:
+        logger.warning(f"Unknown vision precision '{precision}'. Using fp32.")
+        return "fp32"
+    if precision.startswith("int8") and device.type != "cpu":
+        logger.warning("INT8 quantized kernels are CPU-only. Using fp32.")
+        return "fp32"
+    if precision == "bf16" and device.type == "cpu" and not bf16_supported():
+        logger.warning("This CPU has no native bfloat16 support. Using fp32.")
+        return "fp32"
+    return precision
+
+
+def build_resnet50(num_labels: int, quantizable: bool = False) -> nn.Module:
+    """ResNet50 with a `num_labels` head; the quantizable variant has the same state_dict keys."""
+    if quantizable:
+        model = quantizable_models.resnet50(weights=None, quantize=False)
+    else:
+        model = models.resnet50(weights=None)
+    model.fc = nn.Linear(model.fc.in_features, num_labels)
+    return model
+
+
+def prepare_model(state_dict: dict, num_labels: int, precision: str, device: torch.device,
+                  channels_last: bool = True, calibration_batches=None) -> nn.Module:
+    """
+    Builds an eval-mode ResNet50 for the given precision.
+
+    - fp32: the trained weights as-is.
+    - int8_dynamic: dynamic quantization. For ResNet50 this only covers the final Linear
+      layer, since PyTorch has no dynamic path for convolutions.
+    - int8_static: conv/bn/relu fused and quantized, with activation ranges observed on
+      `calibration_batches` (an iterable of NCHW tensors).
+    - bf16: FP32 weights; the caller runs the forward pass under bfloat16 autocast.
+    """
+    if precision == "int8_static":
+        engine = quantized_engine()
+        torch.backends.quantized.engine = engine
+
+        model = build_resnet50(num_labels, quantizable=True)
+        model.load_state_dict(state_dict)
+        model.eval()
+        model.fuse_model(is_qat=False)
+        model.qconfig = torch.ao.quantization.get_default_qconfig(engine)
+        if channels_last:
+            model = model.to(memory_format=torch.channels_last)
+        torch.ao.quantization.prepare(model, inplace=True)
+
+        n_batches = 0
+        with torch.no_grad():
+            for batch in calibration_batches or []:
+                if channels_last:
+                    batch = batch.contiguous(memory_format=torch.channels_last)
+                model(batch)
+                n_batches += 1
+        if n_batches == 0:
+            raise ValueError("Static INT8 quantization needs at least one calibration batch.")
+
+        torch.ao.quantization.convert(model, inplace=True)
+        logger.info(f"Vision model statically quantized ({engine}) with {n_batches} calibration batches.")
+        return model
+
+    model = build_resnet50(num_labels)
+    model.load_state_dict(state_dict)
+    model.eval()
+
+    if precision == "int8_dynamic":
+        torch.backends.quantized.engine = quantized_engine()
+        model = torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+    model.to(device)
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+    return model
@@ -1,11 +1,23 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import Depends, FastAPI, UploadFile, File, Header, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager
 import logging
+import hmac
+import asyncio
+import json
+import os
+import time
 
 # Import core services
 from .core.model_loader import AzureModelLoader
+from .core.batching import MicroBatcher
+from .core.executors import WorkloadSaturated, configure_torch_threads, create_workloads
+from .core.profiling import ProfilingManager
+from .core.metrics import (
+    QUEUE_DEPTH, REGISTRY, REQUEST_LATENCY, REQUESTS_IN_PROGRESS, WORKLOAD_IN_FLIGHT, WORKLOAD_REJECTED
+)
 from .services.vision_service import VisionService
 from .services.operations_service import OperationsService
 from .services.rag_service import RAGService
@@ -19,8 +31,18 @@ load_dotenv()
 
 # Global service instances
 vision_service = None
+vision_batcher = None
 operations_service = None
 rag_service = None
+# Per-endpoint thread pools and concurrency limits (see core/executors.py)
+workloads = {}
+# Admin-only profiling (see core/profiling.py); the endpoints are hidden unless a token is set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+profiler = ProfilingManager(
+    os.getenv("PROFILING_OUTPUT_DIR", "profiles"),
+    sample_fraction=float(os.getenv("PROFILING_SAMPLE_FRACTION", "0")),
+    interval_ms=float(os.getenv("PROFILING_INTERVAL_MS", "10")),
+)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -28,9 +50,13 @@ async def lifespan(app: FastAPI):
     Lifespan events: Startup and Shutdown.
     Ensures models are downloaded and loaded into memory before serving requests.
     """
-    global vision_service, operations_service, rag_service
+    global vision_service, vision_batcher, operations_service, rag_service, workloads
     
     logger.info("API startup")
+    workloads = create_workloads()
+    for name, workload in workloads.items():
+        WORKLOAD_IN_FLIGHT.set_function(lambda workload=workload: workload.in_flight, workload=name)
+        WORKLOAD_REJECTED.set_function(lambda workload=workload: workload.rejected, workload=name)
     
     # 1. Download Models from Azure
     try:
@@ -41,12 +67,29 @@ async def lifespan(app: FastAPI):
         # We might choose to continue if models exist locally, but let's log strictly.
 
     # 2. Initialize Inference Services
+    # Torch thread pools must be sized before the first forward pass
+    configure_torch_threads(
+        int(os.getenv("TORCH_INTRA_OP_THREADS", "0")),
+        int(os.getenv("TORCH_INTER_OP_THREADS", "0"))
+    )
     try:
         vision_service = VisionService()
+        vision_service.torch_profiler = profiler.torch
         logger.info("Vision Service initialized.")
     except Exception as e:
         logger.error(f"Failed to initialize Vision Service: {e}")
 
+    # Concurrent uploads are grouped into a single forward pass
+    if vision_service is not None and vision_service.model is not None:
+        vision_batcher = MicroBatcher(
+            vision_service.predict_batch,
+            max_batch_size=vision_service.max_batch_size,
+            max_wait_ms=float(os.getenv("VISION_MAX_WAIT_MS", "10")),
+            executor=workloads["vision"].executor,
+        )
+        await vision_batcher.start()
+        QUEUE_DEPTH.set_function(lambda: vision_batcher.queue_depth, queue="vision_batcher")
+
     try:
         operations_service = OperationsService()
         logger.info("Operations Service initialized.")
@@ -54,7 +97,7 @@ async def lifespan(app: FastAPI):
         logger.error(f"Failed to initialize Operations Service: {e}")
 
     try:
-        rag_service = RAGService()
+        rag_service = RAGService(executor=workloads["rag"].executor)
         logger.info("RAG Service initialized.")
     except Exception as e:
         logger.error(f"Failed to initialize RAG Service: {e}")
@@ -62,7 +105,10 @@ async def lifespan(app: FastAPI):
     yield
     
     logger.info("API shutdown")
-    # Clean up resources if needed
+    if vision_batcher is not None:
+        await vision_batcher.stop()
+    for workload in workloads.values():
+        workload.shutdown()
 
 app = FastAPI(
     title="Clinical Intelligence Platform API",
@@ -71,6 +117,31 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Request latency per route template (not raw path, which would explode label cardinality)."""
+    REQUESTS_IN_PROGRESS.inc()
+    # A sampled request is profiled until its response headers are ready
+    sampler = profiler.start_request_sample()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        REQUESTS_IN_PROGRESS.dec()
+        route = request.scope.get("route")
+        endpoint = route.path if route is not None else "unmatched"
+        REQUEST_LATENCY.observe(time.perf_counter() - start, method=request.method, endpoint=endpoint, status=status)
+        if sampler is not None:
+            # Stopping joins the sampler thread and writes the file; keep both off the loop
+            await asyncio.to_thread(profiler.finish_request_sample, sampler, endpoint, _model_version(endpoint))
+
+@app.exception_handler(WorkloadSaturated)
+async def workload_saturated_handler(request, exc: WorkloadSaturated):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
 @app.get("/health")
 async def health_check():
     return {
@@ -79,9 +150,89 @@ async def health_check():
         "models_loaded": {
             "vision": vision_service is not None and vision_service.model is not None,
             "operations": operations_service is not None and operations_service.models is not None
-        }
+        },
+        "vision_cache": vision_service.result_cache.stats()
+            if vision_service is not None and vision_service.result_cache is not None else None,
+        "rag_cache": rag_service.query_cache.stats()
+            if rag_service is not None and rag_service.query_cache is not None else None,
+        "embedding_cache": rag_service.embeddings.stats() if rag_service is not None else None,
+        "reranker": rag_service.reranker.stats()
+            if rag_service is not None and rag_service.reranker is not None else None,
+        "workloads": {name: workload.stats() for name, workload in workloads.items()}
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Prometheus text exposition: request latency, per-stage service timings, cache hits and queue depths.
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+# Admin endpoints
+
+def _model_version(endpoint: str):
+    """Model version used to tag profiles of `endpoint` (None where no versioned model is involved)."""
+    if endpoint.startswith("/predict/vision") and vision_service is not None:
+        return vision_service.model_version
+    return None
+
+def require_admin(x_admin_token: str = Header(default="")):
+    """Admin endpoints answer 404 unless ADMIN_TOKEN is set, and 403 for a wrong token."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token.")
+
+class SamplingRequest(BaseModel):
+    fraction: float
+
+class CaptureRequest(BaseModel):
+    seconds: float = 10.0
+
+class TorchProfileRequest(BaseModel):
+    forwards: int = 5
+
+@app.get("/admin/profiling", dependencies=[Depends(require_admin)])
+async def profiling_status():
+    return {**profiler.stats(), "recent_files": profiler.list_files()[:50]}
+
+@app.post("/admin/profiling/sampling", dependencies=[Depends(require_admin)])
+async def set_profiling_sampling(request: SamplingRequest):
+    """
+    Profiles this fraction of requests (0 disables) with the statistical stack sampler.
+    """
+    return {"sample_fraction": profiler.set_sample_fraction(request.fraction)}
+
+@app.post("/admin/profiling/capture", dependencies=[Depends(require_admin)])
+async def capture_profile(request: CaptureRequest):
+    """
+    Samples every thread of this worker for `seconds` and returns the folded-stack file name.
+    """
+    if not 0 < request.seconds <= 120:
+        raise HTTPException(status_code=400, detail="seconds must be between 0 and 120.")
+    try:
+        model_version = vision_service.model_version if vision_service is not None else None
+        path = await asyncio.to_thread(profiler.capture, request.seconds, "capture", model_version)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"file": path.name}
+
+@app.post("/admin/profiling/torch", dependencies=[Depends(require_admin)])
+async def profile_vision_forwards(request: TorchProfileRequest):
+    """
+    Runs torch.profiler on the next `forwards` vision forward passes (0 disarms).
+    """
+    if not vision_service or not vision_service.model:
+        raise HTTPException(status_code=503, detail="Vision model is not available.")
+    return {"forwards_remaining": profiler.torch.arm(request.forwards)}
+
+@app.get("/admin/profiling/files/{name}", dependencies=[Depends(require_admin)])
+async def download_profile(name: str):
+    try:
+        return FileResponse(profiler.resolve(name), media_type="text/plain", filename=name)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+
 # Vision endpoints
 
 @app.post("/predict/vision")
@@ -89,19 +240,29 @@ async def predict_vision(file: UploadFile = File(...)):
     """
     Analyzes a chest X-ray image and returns predicted pathologies.
     """
-    if not vision_service or not vision_service.model:
+    if not vision_service or not vision_service.model or not vision_batcher:
         raise HTTPException(status_code=503, detail="Vision model is not available.")
     
     if file.content_type not in ["image/jpeg", "image/png"]:
         raise HTTPException(status_code=400, detail="Invalid file type. Only JPEG and PNG are supported.")
 
-    try:
-        contents = await file.read()
-        predictions = vision_service.predict(contents)
-        return {"filename": file.filename, "predictions": predictions}
-    except Exception as e:
-        logger.error(f"Prediction failed: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    async with workloads["vision"].slot():
+        try:
+            contents = await file.read()
+            # Identical bytes under the same model version skip decoding and inference.
+            # Hashing and the disk tier block, so they run off the loop, but on the default
+            # executor: the vision executor's worker would make them queue behind a forward pass.
+            cache_key, predictions = await asyncio.to_thread(vision_service.lookup, contents)
+            if predictions is None:
+                # Decoding and the forward pass run on the vision workload's executor
+                predictions = await vision_batcher.submit(contents)
+                await asyncio.to_thread(vision_service.remember, cache_key, predictions)
+            return {"filename": file.filename, "predictions": predictions}
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            logger.error(f"Prediction failed: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
 
 # Operations endpoints
 
@@ -126,15 +287,37 @@ async def predict_no_show(patient: PatientData):
     if not operations_service or not operations_service.models:
         raise HTTPException(status_code=503, detail="Operations model is not available.")
 
-    try:
-        # Convert Pydantic model to dict
-        data_dict = patient.model_dump()
-        
-        result = operations_service.predict(data_dict)
-        return result
-    except Exception as e:
-        logger.error(f"Prediction failed: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    async with workloads["operations"].slot():
+        try:
+            # Convert Pydantic model to dict
+            data_dict = patient.model_dump()
+            
+            result = await workloads["operations"].run(operations_service.predict, data_dict)
+            return result
+        except Exception as e:
+            logger.error(f"Prediction failed: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+class PatientBatch(BaseModel):
+    patients: list[PatientData]
+
+@app.post("/predict/no-show/batch")
+async def predict_no_show_batch(batch: PatientBatch):
+    """
+    Predicts no-show probabilities for a whole roster of appointments in one call.
+    Results are returned in the same order as the submitted patients.
+    """
+    if not operations_service or not operations_service.models:
+        raise HTTPException(status_code=503, detail="Operations model is not available.")
+
+    async with workloads["operations"].slot():
+        try:
+            records = [patient.model_dump() for patient in batch.patients]
+            predictions = await workloads["operations"].run(operations_service.predict_batch, records)
+            return {"count": len(predictions), "predictions": predictions}
+        except Exception as e:
+            logger.error(f"Batch prediction failed: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
 
 # Chatbot endpoints (placeholder for RAG)
 
@@ -152,12 +335,44 @@ async def predict_chat(request: ChatRequest):
 
     logger.info(f"Chat request received: {request.message}")
     
-    try:
-        result = rag_service.process_query(request.message)
-        return result
-    except Exception as e:
-        logger.error(f"Chat processing failed: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    async with workloads["rag"].slot():
+        try:
+            result = await rag_service.aprocess_query(request.message)
+            return result
+        except Exception as e:
+            logger.error(f"Chat processing failed: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/predict/chat/stream")
+async def predict_chat_stream(request: ChatRequest):
+    """
+    Streaming variant of /predict/chat (server-sent events).
+    Emits a `sources` event as soon as retrieval finishes, then `token` events as the
+    LLM produces them, then `done`. Failures after the stream has started arrive as an `error` event.
+    """
+    if not rag_service:
+         raise HTTPException(status_code=503, detail="RAG service is not available.")
+
+    logger.info(f"Streaming chat request received: {request.message}")
+
+    async def event_stream():
+        # The slot is held for the whole stream; once headers are sent, saturation is an `error` event
+        try:
+            async with workloads["rag"].slot():
+                async for event, data in rag_service.astream_query(request.message):
+                    yield _sse_event(event, data)
+        except Exception as e:
+            logger.error(f"Streaming chat failed: {e}")
+            yield _sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 if __name__ == "__main__":
     import uvicorn
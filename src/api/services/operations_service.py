@@ -1,20 +1,59 @@
+import os
+import json
 import pickle
+import numpy as np
 import pandas as pd
 import logging
+import threading
+from datetime import datetime
 from pathlib import Path
-from sklearn.preprocessing import LabelEncoder
+from ..core.tree_ensemble import compile_models
+from ..core.metrics import stage_timer
 
 logger = logging.getLogger(__name__)
 
+# Feature schema layouts this service knows how to read
+SUPPORTED_SCHEMA_VERSIONS = {1}
+
+# Column order the boosters were trained on
+FEATURE_COLS = [
+    'gender', 'age', 'neighbourhood', 'scholarship', 'hipertension', 
+    'diabetes', 'alcoholism', 'handcap', 'sms_received',
+    'scheduled_year', 'scheduled_month', 'scheduled_day', 'scheduled_weekday', 'lead_days'
+]
+
 class OperationsService:
     def __init__(self):
-        self.model_path = Path("src/api/models/no_show_model.pkl")
+        self.models_dir = Path(os.getenv("MODELS_DIR", "src/api/models"))
+        self.model_path = self.models_dir / "no_show_model.pkl"
+        self.schema_path = self.models_dir / "no_show_feature_schema.json"
         self.models = self._load_models()
-        # Note: In a production system, you should load the fitted LabelEncoders
-        # saved during training to ensure consistent encoding.
-        # For this MVP, we will re-fit locally or assume categorical codes if the model handles it,
-        # but LightGBM with 'gbdt' often expects specific integer mappings.
-        # Based on training script: ['neighbourhood'] was label encoded.
+
+        # 'lightgbm' (default) or 'compiled': single patients scored by code generated from the trees, parity-checked at load
+        self.backend = os.getenv("OPERATIONS_BACKEND", "lightgbm").lower()
+        if self.backend == "compiled":
+            if self.models is not None:
+                self.models = compile_models(self.models)
+        elif self.backend != "lightgbm":
+            logger.warning(f"Unknown OPERATIONS_BACKEND '{self.backend}'. Using LightGBM.")
+            self.backend = "lightgbm"
+
+        # Encoders fitted during training, loaded once as plain lookup tables
+        self.feature_schema = self._load_feature_schema()
+        self.neighbourhood_codes = {}
+        self.same_day_max_lead_days = 0
+        if self.feature_schema is not None:
+            mapping = self.feature_schema.get("categorical_mappings", {}).get("neighbourhood", {})
+            self.neighbourhood_codes = {self._normalize_category(k): int(v) for k, v in mapping.items()}
+            split = self.feature_schema.get("lead_day_split", {})
+            self.same_day_max_lead_days = int(split.get("same_day_max_lead_days", 0))
+
+        # Threads LightGBM uses per predict call; kept small since the API runs several calls in parallel
+        num_threads = int(os.getenv("OPERATIONS_NUM_THREADS", "0"))
+        self.predict_kwargs = {"num_threads": num_threads} if num_threads > 0 else {}
+
+        # Per-thread feature row reused across single-patient predictions
+        self._local = threading.local()
 
     def _load_models(self):
         """Loads the dictionary of LightGBM models."""
@@ -39,75 +78,108 @@ class OperationsService:
             logger.error(f"Failed to load Operations Model: {e}")
             raise RuntimeError("Operations Model could not be loaded.")
 
+    def _load_feature_schema(self):
+        """Loads the feature schema written next to the model by the training script."""
+        if not self.schema_path.exists():
+            logger.warning(
+                f"Feature schema not found at {self.schema_path}. "
+                "String neighbourhoods will be encoded to 0 (Unknown)."
+            )
+            return None
+
+        with open(self.schema_path, 'r') as f:
+            schema = json.load(f)
+
+        version = schema.get("schema_version")
+        if version not in SUPPORTED_SCHEMA_VERSIONS:
+            raise RuntimeError(f"Unsupported feature schema version: {version}")
+        if schema.get("features") != FEATURE_COLS:
+            raise RuntimeError("Feature schema column order does not match this service's feature builder.")
+
+        n_codes = len(schema.get("categorical_mappings", {}).get("neighbourhood", {}))
+        logger.info(f"Feature schema v{version} loaded ({n_codes} neighbourhoods).")
+        return schema
+
+    @staticmethod
+    def _normalize_category(value) -> str:
+        return str(value).strip().upper()
+
+    def _encode_neighbourhood(self, value) -> int:
+        """Maps a neighbourhood name to its training code; integer codes pass through."""
+        if not isinstance(value, str):
+            return value
+        code = self.neighbourhood_codes.get(self._normalize_category(value))
+        if code is None:
+            # No unknown bucket was fitted in training, so keep the previous fallback
+            logger.warning(f"Unknown neighbourhood '{value}'. Encoding to 0.")
+            return 0
+        return code
+
+    def _parse_date(self, value) -> datetime:
+        """Parses an ISO date string once, falling back to pandas for formats the stdlib rejects."""
+        if isinstance(value, datetime):
+            return value
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            # e.g. a trailing 'Z' on Python < 3.11
+            return pd.Timestamp(value).to_pydatetime()
+
+    def _build_feature_vector(self, patient_data: dict) -> np.ndarray:
+        """
+        Builds the (1, 14) float feature row for a single patient without pandas.
+        Mirrors `_engineer_features` exactly; the row buffer is preallocated per thread.
+        """
+        row = getattr(self._local, 'row', None)
+        if row is None:
+            row = self._local.row = np.empty((1, len(FEATURE_COLS)), dtype=np.float64)
+        x = row[0]
+
+        scheduled = self._parse_date(patient_data['scheduledday'])
+        appointment = self._parse_date(patient_data['appointmentday'])
+
+        neighbourhood = self._encode_neighbourhood(patient_data['neighbourhood'])
+
+        x[0] = 1 if patient_data['gender'] == 'M' else 0
+        x[1] = patient_data['age']
+        x[2] = neighbourhood
+        x[3] = patient_data['scholarship']
+        x[4] = patient_data['hipertension']
+        x[5] = patient_data['diabetes']
+        x[6] = patient_data['alcoholism']
+        x[7] = patient_data['handcap']
+        x[8] = patient_data['sms_received']
+        x[9] = scheduled.year
+        x[10] = scheduled.month
+        x[11] = scheduled.day
+        x[12] = scheduled.weekday()
+        # Lead Days on normalized (midnight) dates, clipped at 0 to match training logic
+        x[13] = max(0, (appointment.date() - scheduled.date()).days)
+        return row
+
     def predict(self, patient_data: dict):
         """
         Predicts no-show probability from patient data dictionary.
-        Returns: {"probability": float, "prediction": int}
+        Returns: {"no_show_probability": float, "risk_level": str}
         """
         if self.models is None:
              raise RuntimeError("Operations model is not loaded.")
 
         try:
-            # Convert dict to DataFrame
-            df = pd.DataFrame([patient_data])
-            
-            # Preprocessing must mirror the training logic
-            # Training features: ['gender', 'age', 'neighbourhood', 'scholarship', 'hipertension',
-            # 'diabetes', 'alcoholism', 'handcap', 'sms_received', 'scheduled_year',
-            # 'scheduled_month', 'scheduled_day', 'scheduled_weekday']
-            
-            # 1. Feature Engineering from Dates
-            if 'scheduledday' in df.columns and 'appointmentday' in df.columns:
-                 df['scheduledday'] = pd.to_datetime(df['scheduledday'])
-                 df['appointmentday'] = pd.to_datetime(df['appointmentday'])
-                 
-                 df['scheduled_year'] = df['scheduledday'].dt.year
-                 df['scheduled_month'] = df['scheduledday'].dt.month
-                 df['scheduled_day'] = df['scheduledday'].dt.day
-                 df['scheduled_weekday'] = df['scheduledday'].dt.dayofweek
-                 
-                 # Calculate Lead Days to match training logic
-                 df['lead_days'] = (df['appointmentday'].dt.normalize() - df['scheduledday'].dt.normalize()).dt.days
-                 df['lead_days'] = df['lead_days'].apply(lambda x: max(0, x))
-            
-            # 2. Encode Gender (M=1, F=0)
-            if 'gender' in df.columns:
-                df['gender'] = df['gender'].apply(lambda x: 1 if x == 'M' else 0)
-            
-            # 3. Encode Neighbourhood
-            # Ideally, load the saved LabelEncoder. For now, we do a simple hash or map if possible.
-            # Warning: This is a potential drift point if not using the exact same encoder.
-            # Ideally we should accept 'neighbourhood' as an integer from the frontend or load the encoder.
-            # For resilience in this MVP, we will handle if it's a string.
-            if 'neighbourhood' in df.columns and df['neighbourhood'].dtype == 'object':
-                 # Fallback: we can't perfectly match the training encoder without the pickle file.
-                 # We will default to 0 to prevent crashing, or assumes the frontend sends the ID.
-                 # TODO: Save LabelEncoder in training pipeline!
-                 logger.warning("Received string for 'neighbourhood'. Encoding to 0 (Unknown) as LabelEncoder is missing.")
-                 df['neighbourhood'] = 0 
-
-            # Ensure column order matches training
-            feature_cols = [
-                'gender', 'age', 'neighbourhood', 'scholarship', 'hipertension', 
-                'diabetes', 'alcoholism', 'handcap', 'sms_received',
-                'scheduled_year', 'scheduled_month', 'scheduled_day', 'scheduled_weekday', 'lead_days'
-            ]
-            
-            # Filter/Reorder
-            X = df[feature_cols]
-            
-            # Predict based on Lead Days
-            lead_days = df['lead_days'].iloc[0]
-            
-            if "legacy_model" in self.models:
-                 # Fallback for old model file
-                 prob = self.models["legacy_model"].predict(X)[0]
-            elif lead_days == 0:
-                # Use Same-Day Model
-                prob = self.models["same_day_model"].predict(X)[0]
-            else:
-                # Use Future Model
-                prob = self.models["future_model"].predict(X)[0]
+            with stage_timer("operations", "features"):
+                X = self._build_feature_vector(patient_data)
+            lead_days = X[0, 13]
+
+            with stage_timer("operations", "booster"):
+                if "legacy_model" in self.models:
+                     # Fallback for old model file
+                     prob = self.models["legacy_model"].predict(X, **self.predict_kwargs)[0]
+                elif lead_days <= self.same_day_max_lead_days:
+                    # Use Same-Day Model
+                    prob = self.models["same_day_model"].predict(X, **self.predict_kwargs)[0]
+                else:
+                    # Use Future Model
+                    prob = self.models["future_model"].predict(X, **self.predict_kwargs)[0]
             
             return {
                 "no_show_probability": float(prob),
@@ -117,3 +189,85 @@ class OperationsService:
         except Exception as e:
             logger.error(f"Error during operations prediction: {e}")
             raise
+
+    def _parse_date_column(self, values: pd.Series) -> pd.Series:
+        """Parses a column of ISO dates in one pass, keeping each value's own wall-clock time."""
+        try:
+            # One explicit format for the whole column instead of per-element inference
+            return pd.to_datetime(values, format='ISO8601')
+        except ValueError:
+            # Rosters mixing offsets (or aware and naive values) can't share one dtype
+            parsed = [self._parse_date(v).replace(tzinfo=None) for v in values]
+            return pd.Series(pd.to_datetime(parsed), index=values.index)
+
+    def _engineer_features(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Vectorized feature engineering for many rows; `_build_feature_vector` is the single-row equivalent.
+        Every step is a whole-column operation, so cost grows with rows, not Python calls.
+        """
+        scheduled = self._parse_date_column(df['scheduledday'])
+        appointment = self._parse_date_column(df['appointmentday'])
+
+        features = pd.DataFrame(index=df.index)
+        features['gender'] = (df['gender'] == 'M').astype(np.int64)
+        features['age'] = df['age']
+
+        if not pd.api.types.is_numeric_dtype(df['neighbourhood']):
+            names = df['neighbourhood'].astype(str).str.strip().str.upper()
+            codes = names.map(self.neighbourhood_codes)
+            unknown = codes.isna()
+            if unknown.any():
+                logger.warning(f"{int(unknown.sum())} rows with unknown neighbourhood. Encoding to 0.")
+            features['neighbourhood'] = codes.fillna(0).astype(np.int64)
+        else:
+            features['neighbourhood'] = df['neighbourhood']
+
+        for col in ['scholarship', 'hipertension', 'diabetes', 'alcoholism', 'handcap', 'sms_received']:
+            features[col] = df[col]
+
+        features['scheduled_year'] = scheduled.dt.year
+        features['scheduled_month'] = scheduled.dt.month
+        features['scheduled_day'] = scheduled.dt.day
+        features['scheduled_weekday'] = scheduled.dt.dayofweek
+
+        lead_days = (appointment.dt.normalize() - scheduled.dt.normalize()).dt.days
+        features['lead_days'] = lead_days.clip(lower=0)
+
+        return features[FEATURE_COLS]
+
+    def predict_batch(self, patients: list) -> list:
+        """
+        Scores many appointments at once.
+        Rows are routed to the same-day or future booster with a boolean mask, so each
+        booster is called at most once per batch.
+        Returns a list of {"no_show_probability": float, "risk_level": str} in input order.
+        """
+        if self.models is None:
+             raise RuntimeError("Operations model is not loaded.")
+
+        if not patients:
+            return []
+
+        try:
+            with stage_timer("operations", "batch_features"):
+                X = self._engineer_features(pd.DataFrame(patients))
+            probs = np.empty(len(X), dtype=np.float64)
+
+            with stage_timer("operations", "batch_booster"):
+                if "legacy_model" in self.models:
+                    probs[:] = self.models["legacy_model"].predict(X, **self.predict_kwargs)
+                else:
+                    same_day = (X['lead_days'] <= self.same_day_max_lead_days).to_numpy()
+                    if same_day.any():
+                        probs[same_day] = self.models["same_day_model"].predict(X[same_day], **self.predict_kwargs)
+                    if (~same_day).any():
+                        probs[~same_day] = self.models["future_model"].predict(X[~same_day], **self.predict_kwargs)
+
+            return [
+                {"no_show_probability": float(prob), "risk_level": "High" if prob > 0.5 else "Low"}
+                for prob in probs
+            ]
+
+        except Exception as e:
+            logger.error(f"Error during batch operations prediction: {e}")
+            raise
@@ -1,92 +1,530 @@
 import os
+import json
+import time
+import asyncio
+import threading
+from functools import partial
+from pathlib import Path
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import AzureSearch
+from langchain_community.vectorstores.azuresearch import _aresults_to_documents, _results_to_documents
 from langchain_openai import AzureChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
+from azure.core.credentials import AzureKeyCredential
+from azure.search.documents.indexes import SearchIndexClient
+from azure.storage.blob import BlobClient
 import logging
+from ..core.query_cache import SemanticQueryCache, index_build_stamp_blob
+from ..core.local_vector_index import LocalVectorIndex
+from ..core.embedding_cache import CachedEmbeddings
+from ..core.lexical_index import LexicalIndex
+from ..core.rank_fusion import DEFAULT_RRF_K, reciprocal_rank_fusion
+from ..core.reranker import CrossEncoderReranker
+from ..core.context_packer import DEFAULT_ENCODING, ContextPacker
+from ..core.metrics import CACHE_REQUESTS, STAGE_LATENCY, stage_timer
 
 logger = logging.getLogger(__name__)
 
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+NO_CONTEXT_MESSAGE = "I couldn't find any relevant medical guidelines in the knowledge base to answer your question."
+GENERATION_ERROR_MESSAGE = "I encountered an error while generating the answer. Please check system logs."
+
 class RAGService:
-    def __init__(self):
-        self.embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-        
-        self.vector_store = AzureSearch(
-            azure_search_endpoint=os.getenv("AZURE_SEARCH_ENDPOINT"),
-            azure_search_key=os.getenv("AZURE_SEARCH_KEY"),
-            index_name=os.getenv("AZURE_SEARCH_INDEX_NAME"),
-            embedding_function=self.embeddings.embed_query
+    def __init__(self, executor=None, embeddings=None, vector_store=None, llm=None):
+        """
+        `embeddings`, `vector_store` and `llm` replace the configured MiniLM model, search
+        backend and Azure OpenAI client (e.g. offline stand-ins for benchmarks). An injected
+        vector store needs similarity_search/asimilarity_search and a `refresh()` returning its version.
+        """
+        # Thread pool for the CPU-bound steps of the async path (None uses the loop's default)
+        self.executor = executor
+        # Repeated questions skip the MiniLM forward pass (cache shared with the indexer if the path is)
+        # Injected embeddings get their own cache namespace, so they never mix with MiniLM vectors
+        self.embeddings = CachedEmbeddings(
+            embeddings if embeddings is not None else HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME),
+            EMBEDDING_MODEL_NAME if embeddings is None else type(embeddings).__name__,
+            cache_path=os.getenv("EMBEDDING_CACHE_PATH") or None,
+            max_memory_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+        )
+        self.search_endpoint = os.getenv("AZURE_SEARCH_ENDPOINT")
+        self.search_key = os.getenv("AZURE_SEARCH_KEY")
+        self.index_name = os.getenv("AZURE_SEARCH_INDEX_NAME")
+        models_dir = Path(os.getenv("MODELS_DIR", "src/api/models"))
+
+        # "azure" queries Azure AI Search; "local" searches an in-process index built by build_vector_index.py
+        self.retriever_backend = os.getenv("RAG_RETRIEVER_BACKEND", "azure").lower()
+        if vector_store is not None:
+            self.retriever_backend = "injected"
+            self.vector_store = vector_store
+        elif self.retriever_backend == "local":
+            index_dir = os.getenv("RAG_LOCAL_INDEX_DIR") or str(models_dir / "knowledge_index")
+            self.vector_store = LocalVectorIndex(
+                index_dir,
+                embedding_function=self.embeddings.embed_query,
+                use_hnsw=os.getenv("RAG_LOCAL_INDEX_USE_HNSW", "true").lower() == "true"
+            )
+        else:
+            if self.retriever_backend != "azure":
+                logger.warning(f"Unknown RAG_RETRIEVER_BACKEND '{self.retriever_backend}'. Using Azure AI Search.")
+                self.retriever_backend = "azure"
+            self.vector_store = AzureSearch(
+                azure_search_endpoint=self.search_endpoint,
+                azure_search_key=self.search_key,
+                index_name=self.index_name,
+                embedding_function=self.embeddings.embed_query
+            )
+
+        # "dense" uses the vector store only; "hybrid" fuses it with a local BM25 index (reciprocal-rank fusion)
+        self.retrieval_k = int(os.getenv("RAG_RETRIEVAL_K", "1"))
+        self.retrieval_mode = os.getenv("RAG_RETRIEVAL_MODE", "dense").lower()
+        self.hybrid_candidates = int(os.getenv("RAG_HYBRID_CANDIDATES", "20"))
+        self.rrf_k = int(os.getenv("RAG_RRF_K", str(DEFAULT_RRF_K)))
+        self.rrf_weights = {
+            "dense": float(os.getenv("RAG_RRF_DENSE_WEIGHT", "1.0")),
+            "lexical": float(os.getenv("RAG_RRF_LEXICAL_WEIGHT", "1.0")),
+        }
+        self.lexical_index = None
+        if self.retrieval_mode == "hybrid":
+            try:
+                self.lexical_index = LexicalIndex(os.getenv("RAG_LEXICAL_INDEX_DIR") or str(models_dir / "lexical_index"))
+            except Exception as e:
+                logger.warning(f"Lexical index not available ({e}). Using dense retrieval only.")
+                self.retrieval_mode = "dense"
+        elif self.retrieval_mode != "dense":
+            logger.warning(f"Unknown RAG_RETRIEVAL_MODE '{self.retrieval_mode}'. Using dense retrieval.")
+            self.retrieval_mode = "dense"
+
+        # Optional cross-encoder: fetch RAG_RERANK_CANDIDATES, keep the best RAG_RETRIEVAL_K within the budget
+        self.reranker = None
+        self.rerank_candidates = int(os.getenv("RAG_RERANK_CANDIDATES", "20"))
+        self.rerank_budget_ms = float(os.getenv("RAG_RERANK_BUDGET_MS", "150"))
+        reranker_model = os.getenv("RAG_RERANKER_MODEL", "")
+        if reranker_model:
+            try:
+                self.reranker = CrossEncoderReranker(reranker_model)
+            except Exception as e:
+                logger.warning(f"Reranker '{reranker_model}' could not be loaded: {e}")
+
+        # Keeps the prompt context within a token budget however deep retrieval goes
+        self.context_packer = ContextPacker(
+            token_budget=int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "1500")),
+            encoding=os.getenv("RAG_TOKENIZER_ENCODING", DEFAULT_ENCODING)
         )
-        
+
         # Initialize Azure OpenAI if credentials exist
+        self.llm = llm if llm is not None else self._create_azure_llm()
+
+        # Answer cache: exact match on normalized text, then MiniLM embedding similarity
+        cache_size = int(os.getenv("RAG_CACHE_SIZE", "512"))
+        self.query_cache = None
+        if cache_size > 0:
+            self.query_cache = SemanticQueryCache(
+                max_entries=cache_size,
+                similarity_threshold=float(os.getenv("RAG_CACHE_SIMILARITY_THRESHOLD", "0.95"))
+            )
+        # Content version published by build_vector_index.py; Azure's own ETag and count miss in-place updates
+        self.build_stamp_client = None
+        sas_token = os.getenv("SAS_TOKEN")
+        if self.retriever_backend == "azure" and sas_token and self.index_name:
+            self.build_stamp_client = BlobClient(
+                account_url=f"https://{os.getenv('STORAGE_ACCOUNT_NAME', 'clinicaldatalake25')}.blob.core.windows.net",
+                container_name=os.getenv("KNOWLEDGE_BASE_CONTAINER_NAME", "knowledge-base"),
+                blob_name=index_build_stamp_blob(self.index_name),
+                credential=sas_token
+            )
+        self.version_check_seconds = float(os.getenv("RAG_CACHE_VERSION_CHECK_SECONDS", "60"))
+        self._version_checked_at = 0.0
+        self._version_lock = threading.Lock()
+
+    def _create_azure_llm(self):
         try:
-            self.llm = AzureChatOpenAI(
+            llm = AzureChatOpenAI(
                 azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
                 api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2023-05-15"),
                 azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
                 api_key=os.getenv("AZURE_OPENAI_API_KEY"),
                 temperature=0
             )
-            logger.info("RAG Service initialized with Azure AI Search and Azure OpenAI.")
+            logger.info(f"RAG Service initialized with the {self.retriever_backend} retriever and Azure OpenAI.")
+            return llm
         except Exception as e:
-            self.llm = None
             logger.warning(f"Azure OpenAI not configured properly: {e}")
+            return None
+
+    def _read_build_stamp(self):
+        if self.build_stamp_client is None:
+            return None
+        try:
+            return json.loads(self.build_stamp_client.download_blob().readall())["version"]
+        except Exception as e:
+            logger.debug(f"No index build stamp available ({e}). Using index ETag and document count.")
+            return None
 
-    def retrieve(self, query: str, k: int = 1) -> list:
+    def index_version(self):
+        """
+        Identifies the current content of the knowledge-base index, so cached answers can be
+        dropped after a rebuild: the build stamp the indexer publishes for Azure AI Search
+        (falling back to index ETag plus document count), or the local index version.
+        Local indexes reload themselves here when their files were rebuilt.
+        """
+        if self.retriever_backend != "azure":
+            version = self.vector_store.refresh()
+        elif (stamp := self._read_build_stamp()) is not None:
+            version = f"build:{stamp}"
+        else:
+            index_client = SearchIndexClient(self.search_endpoint, AzureKeyCredential(self.search_key))
+            index = index_client.get_index(self.index_name)
+            document_count = self.vector_store.client.get_document_count()
+            version = f"{index.e_tag}:{document_count}"
+        if self.lexical_index is not None:
+            version = f"{version}:{self.lexical_index.refresh()}"
+        return version
+
+    def _check_index_version(self):
+        """Polls the index version at most every `version_check_seconds`."""
+        now = time.monotonic()
+        with self._version_lock:
+            if self._version_checked_at and now - self._version_checked_at < self.version_check_seconds:
+                return
+            self._version_checked_at = now
+        try:
+            version = self.index_version()
+            if self.query_cache is not None:
+                self.query_cache.ensure_version(version)
+        except Exception as e:
+            # Keep serving the current index and cache; the next poll retries
+            logger.warning(f"Could not check knowledge base index version: {e}")
+
+    async def _run(self, func, *args, **kwargs):
+        """Runs a blocking step on the service's executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    def _dense_search(self, query: str, k: int, query_embedding=None) -> list:
+        # Reuse the query embedding instead of letting the store embed the query again
+        if query_embedding is None:
+            return self.vector_store.similarity_search(query, k=k)
+        if isinstance(self.vector_store, AzureSearch):
+            # AzureSearch has no public search-by-vector; this is the request similarity_search makes
+            results = self.vector_store._simple_search(list(query_embedding), "", k)
+            return [doc for doc, _ in _results_to_documents(results)]
+        return self.vector_store.similarity_search_by_vector(query_embedding, k=k)
+
+    async def _adense_search(self, query: str, k: int, query_embedding=None) -> list:
+        if self.retriever_backend == "local":
+            return await self._run(self._dense_search, query, k, query_embedding)
+        # LangChain's async search calls the sync embedding function on the event loop,
+        # so the query is embedded on the executor and the store only gets the vector
+        if query_embedding is None:
+            query_embedding = await self._run(self.embeddings.embed_query, query)
+        if isinstance(self.vector_store, AzureSearch):
+            results = await self.vector_store._asimple_search(list(query_embedding), "", k)
+            return [doc for doc, _ in await _aresults_to_documents(results)]
+        return await self.vector_store.asimilarity_search_by_vector(query_embedding, k=k)
+
+    def _hybrid_search(self, query: str, k: int, query_embedding=None) -> list:
+        """Dense and BM25 candidates fused by reciprocal rank; either leg alone still answers."""
+        rankings = {"lexical": self.lexical_index.similarity_search(query, k=self.hybrid_candidates)}
+        try:
+            rankings["dense"] = self._dense_search(query, self.hybrid_candidates, query_embedding)
+        except Exception as e:
+            logger.warning(f"Dense retrieval failed, using lexical results only: {e}")
+        return reciprocal_rank_fusion(rankings, weights=self.rrf_weights, k=self.rrf_k, limit=k)
+
+    async def _ahybrid_search(self, query: str, k: int, query_embedding=None) -> list:
+        """Async _hybrid_search: the BM25 and dense legs run concurrently."""
+        lexical, dense = await asyncio.gather(
+            self._run(self.lexical_index.similarity_search, query, k=self.hybrid_candidates),
+            self._adense_search(query, self.hybrid_candidates, query_embedding),
+            return_exceptions=True
+        )
+        if isinstance(lexical, BaseException):
+            raise lexical
+        rankings = {"lexical": lexical}
+        if isinstance(dense, BaseException):
+            logger.warning(f"Dense retrieval failed, using lexical results only: {dense}")
+        else:
+            rankings["dense"] = dense
+        return reciprocal_rank_fusion(rankings, weights=self.rrf_weights, k=self.rrf_k, limit=k)
+
+    def retrieve(self, query: str, k: int = None, query_embedding=None) -> list:
         """
         Retrieve relevant documents from the knowledge base.
         """
+        k = k or self.retrieval_k
+        depth = max(k, self.rerank_candidates) if self.reranker is not None else k
         try:
-            # Perform similarity search
-            docs = self.vector_store.similarity_search(query, k=k)
+            with stage_timer("rag", "search"):
+                if self.retrieval_mode == "hybrid":
+                    docs = self._hybrid_search(query, depth, query_embedding)
+                else:
+                    # Perform similarity search
+                    docs = self._dense_search(query, depth, query_embedding)
+            if self.reranker is not None:
+                with stage_timer("rag", "rerank"):
+                    docs = self.reranker.rerank(query, docs, k, budget_ms=self.rerank_budget_ms)
             return [doc.page_content for doc in docs]
         except Exception as e:
             logger.error(f"Error retrieving documents: {e}")
             return []
 
-    def generate_answer(self, query: str, context: list) -> str:
+    async def aretrieve(self, query: str, k: int = None, query_embedding=None) -> list:
         """
-        Generate an answer using an LLM.
+        Async retrieve: Azure AI Search through its async client, CPU-bound steps on the executor.
         """
-        if not context:
-            return "I couldn't find any relevant medical guidelines in the knowledge base to answer your question."
-            
-        if not self.llm:
-            # Fallback if LLM is not configured
-            context_str = "\n\n".join(context[:2])
-            return (
-                f"**Based on the medical knowledge base, here is some relevant information:**\n\n"
-                f"{context_str}\n\n"
-                f"*(Note: Azure OpenAI credentials are required to generate a synthesized answer. "
-                f"Currently showing raw retrieval results.)*"
-            )
+        k = k or self.retrieval_k
+        depth = max(k, self.rerank_candidates) if self.reranker is not None else k
+        try:
+            with stage_timer("rag", "search"):
+                if self.retrieval_mode == "hybrid":
+                    docs = await self._ahybrid_search(query, depth, query_embedding)
+                else:
+                    docs = await self._adense_search(query, depth, query_embedding)
+            if self.reranker is not None:
+                with stage_timer("rag", "rerank"):
+                    docs = await self._run(self.reranker.rerank, query, docs, k, budget_ms=self.rerank_budget_ms)
+            return [doc.page_content for doc in docs]
+        except Exception as e:
+            logger.error(f"Error retrieving documents: {e}")
+            return []
+
+    def _fallback_answer(self, context: list) -> str:
+        # Fallback if LLM is not configured
+        context_str = "\n\n".join(context[:2])
+        return (
+            f"**Based on the medical knowledge base, here is some relevant information:**\n\n"
+            f"{context_str}\n\n"
+            f"*(Note: Azure OpenAI credentials are required to generate a synthesized answer. "
+            f"Currently showing raw retrieval results.)*"
+        )
 
+    def _build_messages(self, query: str, context: list) -> list:
         # Prepare the prompt
         context_str = "\n\n".join(context)
-        
+
         system_prompt = """You are a clinical assistant. Use the provided context to answer the doctor's question accurately.
         If the answer is not in the context, say you don't know. Keep answers concise."""
-        
+
         user_prompt = f"Context:\n{context_str}\n\nQuestion: {query}"
-        
+
+        return [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=user_prompt)
+        ]
+
+    def generate_answer(self, query: str, context: list) -> str:
+        """
+        Generate an answer using an LLM.
+        """
+        if not context:
+            return NO_CONTEXT_MESSAGE
+
+        if not self.llm:
+            return self._fallback_answer(context)
+
+        try:
+            with stage_timer("rag", "llm"):
+                response = self.llm.invoke(self._build_messages(query, context))
+            return response.content
+        except Exception as e:
+            logger.error(f"LLM generation error: {e}")
+            return GENERATION_ERROR_MESSAGE
+
+    def stream_answer(self, query: str, context: list):
+        """
+        Yields the answer in pieces as the LLM produces them.
+        Messages that are not generated (no context, no LLM, errors) are yielded whole.
+        """
+        if not context:
+            yield NO_CONTEXT_MESSAGE
+            return
+
+        if not self.llm:
+            yield self._fallback_answer(context)
+            return
+
+        streamed = False
+        start = time.perf_counter()
         try:
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=user_prompt)
-            ]
-            response = self.llm.invoke(messages)
+            for chunk in self.llm.stream(self._build_messages(query, context)):
+                if chunk.content:
+                    if not streamed:
+                        STAGE_LATENCY.observe(time.perf_counter() - start, service="rag", stage="llm_first_token")
+                    streamed = True
+                    yield chunk.content
+        except Exception as e:
+            logger.error(f"LLM streaming error: {e}")
+            # Tokens already sent cannot be withdrawn; the error message follows them
+            yield ("\n\n" if streamed else "") + GENERATION_ERROR_MESSAGE
+        finally:
+            STAGE_LATENCY.observe(time.perf_counter() - start, service="rag", stage="llm")
+
+    async def agenerate_answer(self, query: str, context: list) -> str:
+        """
+        Async generate_answer.
+        """
+        if not context:
+            return NO_CONTEXT_MESSAGE
+
+        if not self.llm:
+            return self._fallback_answer(context)
+
+        try:
+            with stage_timer("rag", "llm"):
+                response = await self.llm.ainvoke(self._build_messages(query, context))
             return response.content
         except Exception as e:
             logger.error(f"LLM generation error: {e}")
-            return "I encountered an error while generating the answer. Please check system logs."
+            return GENERATION_ERROR_MESSAGE
+
+    async def astream_answer(self, query: str, context: list):
+        """
+        Async stream_answer.
+        """
+        if not context:
+            yield NO_CONTEXT_MESSAGE
+            return
+
+        if not self.llm:
+            yield self._fallback_answer(context)
+            return
+
+        streamed = False
+        start = time.perf_counter()
+        try:
+            async for chunk in self.llm.astream(self._build_messages(query, context)):
+                if chunk.content:
+                    if not streamed:
+                        STAGE_LATENCY.observe(time.perf_counter() - start, service="rag", stage="llm_first_token")
+                    streamed = True
+                    yield chunk.content
+        except Exception as e:
+            logger.error(f"LLM streaming error: {e}")
+            yield ("\n\n" if streamed else "") + GENERATION_ERROR_MESSAGE
+        finally:
+            STAGE_LATENCY.observe(time.perf_counter() - start, service="rag", stage="llm")
+
+    def _cached_result(self, query: str):
+        """Returns (cached result or None, query embedding or None)."""
+        self._check_index_version()
+        if self.query_cache is not None:
+            cached = self.query_cache.get_exact(query)
+            if cached is not None:
+                CACHE_REQUESTS.inc(cache="rag", result="exact_hit")
+                return dict(cached), None
+
+        with stage_timer("rag", "embed"):
+            query_embedding = self.embeddings.embed_query(query)
+        if self.query_cache is not None:
+            cached = self.query_cache.get_similar(query_embedding)
+            if cached is not None:
+                CACHE_REQUESTS.inc(cache="rag", result="similar_hit")
+                return dict(cached), query_embedding
+            CACHE_REQUESTS.inc(cache="rag", result="miss")
+        return None, query_embedding
+
+    def _pack(self, context: list):
+        with stage_timer("rag", "pack"):
+            packed = self.context_packer.pack(context)
+        if packed.truncated:
+            logger.info(f"Context trimmed to {packed.tokens} tokens ({packed.dropped} chunks dropped).")
+        return packed
+
+    def _remember(self, query: str, query_embedding, result: dict):
+        # Only real answers are cached; retrieval misses and LLM failures are retried next time
+        if (self.query_cache is not None and result["source_documents"] and self.llm
+                and GENERATION_ERROR_MESSAGE not in result["response"]):
+            self.query_cache.put(query, query_embedding, result)
 
     def process_query(self, query: str) -> dict:
         """
-        End-to-end RAG pipeline: Retrieve -> Generate
+        End-to-end RAG pipeline: Cache -> Retrieve -> Generate
+        """
+        cached, query_embedding = self._cached_result(query)
+        if cached is not None:
+            return cached
+
+        context = self.retrieve(query, query_embedding=query_embedding)
+        packed = self._pack(context)
+        answer = self.generate_answer(query, packed.chunks)
+        result = {
+            "response": answer,
+            "source_documents": context,
+            "context_tokens": packed.tokens
+        }
+        self._remember(query, query_embedding, result)
+        return result
+
+    def stream_query(self, query: str):
+        """
+        Streaming variant of process_query, yielding (event, data) pairs:
+        ("sources", {...}) once retrieval finishes, ("token", {"text"}) per LLM chunk,
+        then ("done", {"context_tokens", "cached"}). Cached answers arrive as a single token.
+        """
+        cached, query_embedding = self._cached_result(query)
+        if cached is not None:
+            yield "sources", {"source_documents": cached["source_documents"]}
+            yield "token", {"text": cached["response"]}
+            yield "done", {"context_tokens": cached.get("context_tokens"), "cached": True}
+            return
+
+        context = self.retrieve(query, query_embedding=query_embedding)
+        packed = self._pack(context)
+        yield "sources", {"source_documents": context}
+
+        pieces = []
+        for piece in self.stream_answer(query, packed.chunks):
+            pieces.append(piece)
+            yield "token", {"text": piece}
+        self._remember(query, query_embedding, {
+            "response": "".join(pieces),
+            "source_documents": context,
+            "context_tokens": packed.tokens
+        })
+        yield "done", {"context_tokens": packed.tokens, "cached": False}
+
+    async def aprocess_query(self, query: str) -> dict:
+        """
+        Async process_query: Azure Search and Azure OpenAI through their async clients,
+        embedding, local retrieval and packing on the executor.
         """
-        context = self.retrieve(query)
-        answer = self.generate_answer(query, context)
-        return {
+        cached, query_embedding = await self._run(self._cached_result, query)
+        if cached is not None:
+            return cached
+
+        context = await self.aretrieve(query, query_embedding=query_embedding)
+        packed = await self._run(self._pack, context)
+        answer = await self.agenerate_answer(query, packed.chunks)
+        result = {
             "response": answer,
-            "source_documents": context
-        }
\ No newline at end of file
+            "source_documents": context,
+            "context_tokens": packed.tokens
+        }
+        self._remember(query, query_embedding, result)
+        return result
+
+    async def astream_query(self, query: str):
+        """
+        Async stream_query, yielding the same (event, data) pairs.
+        """
+        cached, query_embedding = await self._run(self._cached_result, query)
+        if cached is not None:
+            yield "sources", {"source_documents": cached["source_documents"]}
+            yield "token", {"text": cached["response"]}
+            yield "done", {"context_tokens": cached.get("context_tokens"), "cached": True}
+            return
+
+        context = await self.aretrieve(query, query_embedding=query_embedding)
+        packed = await self._run(self._pack, context)
+        yield "sources", {"source_documents": context}
+
+        pieces = []
+        async for piece in self.astream_answer(query, packed.chunks):
+            pieces.append(piece)
+            yield "token", {"text": piece}
+        self._remember(query, query_embedding, {
+            "response": "".join(pieces),
+            "source_documents": context,
+            "context_tokens": packed.tokens
+        })
+        yield "done", {"context_tokens": packed.tokens, "cached": False}
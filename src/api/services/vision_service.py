@@ -1,52 +1,152 @@
+import os
+import hashlib
+import threading
 import torch
-import torch.nn as nn
-from torchvision import models, transforms
+from torchvision import transforms
 from PIL import Image
 import io
 import logging
+from contextlib import nullcontext
 from pathlib import Path
+from ..core.vision_precision import prepare_model, resolve_precision
+from ..core.model_artifacts import cached_file_sha256, load_torchscript
+from ..core.image_preprocessing import FusedPreprocessor
+from ..core.result_cache import ResultCache
+from ..core.metrics import CACHE_REQUESTS, stage_timer
+
+# File types picked up from the calibration folder
+CALIBRATION_EXTENSIONS = {".png", ".jpg", ".jpeg"}
 
 logger = logging.getLogger(__name__)
 
 class VisionService:
     def __init__(self):
-        self.model_path = Path("src/api/models/vision_model.pth")
+        self.models_dir = Path(os.getenv("MODELS_DIR", "src/api/models"))
+        self.model_path = self.models_dir / "vision_model.pth"
+        # Frozen TorchScript written by src/pipelines/export_vision_model.py, preferred when compatible
+        self.exported_model_path = self.models_dir / "vision_model.ts"
+        self.use_exported = os.getenv("VISION_USE_EXPORTED", "true").lower() == "true"
+        # Short hash of the trained weights the loaded model came from
+        self.model_version = None
+        self._weights_sha256 = None
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.labels = [
             'Atelectasis', 'Cardiomegaly', 'Consolidation', 'Edema', 'Effusion', 
             'Emphysema', 'Fibrosis', 'Hernia', 'Infiltration', 'Mass', 
             'No Finding', 'Nodule', 'Pleural_Thickening', 'Pneumonia', 'Pneumothorax'
         ]
-        self.model = self._load_model()
+        # Inference precision: fp32 | int8_dynamic | int8_static | bf16 (see core/vision_precision.py)
+        self.precision = resolve_precision(os.getenv("VISION_PRECISION", "fp32"), self.device)
+        self.channels_last = os.getenv("VISION_CHANNELS_LAST", "true").lower() == "true"
+        self.calibration_dir = os.getenv("VISION_CALIBRATION_DIR")
+        self.calibration_max_images = int(os.getenv("VISION_CALIBRATION_MAX_IMAGES", "64"))
+
+        # Largest batch per forward pass; also sizes the micro-batcher in main.py
+        self.max_batch_size = int(os.getenv("VISION_MAX_BATCH_SIZE", "8"))
         self.transform = self._get_transforms()
+        # Fused decode/resize/normalize into a preallocated batch buffer (see core/image_preprocessing.py).
+        # Opt-in: its resampling differs from the training transforms, so scores shift slightly
+        self.preprocessor = None
+        if os.getenv("VISION_FAST_PREPROCESS", "false").lower() == "true":
+            self.preprocessor = FusedPreprocessor(
+                max_batch_size=self.max_batch_size,
+                pin_memory=self.device.type == "cuda",
+                channels_last=self.channels_last,
+            )
+        # Set by the API to profile upcoming forward passes on demand (core/profiling.py)
+        self.torch_profiler = None
+        # The batch buffer is shared, so preprocessing + forward run one batch at a time
+        self._inference_lock = threading.Lock()
+
+        self.model = self._load_model()
+
+        # Content-addressed cache of predictions, keyed by image bytes + model version
+        self.result_cache = None
+        cache_size = int(os.getenv("VISION_CACHE_SIZE", "1024"))
+        if cache_size > 0:
+            self.result_cache = ResultCache(
+                max_entries=cache_size,
+                ttl_seconds=float(os.getenv("VISION_CACHE_TTL_SECONDS", "86400")),
+                disk_dir=os.getenv("VISION_CACHE_DIR") or None,
+                max_disk_bytes=int(float(os.getenv("VISION_CACHE_DISK_MAX_MB", "1024")) * 1024 * 1024),
+            )
 
     def _load_model(self):
-        """Loads the ResNet50 model architecture and weights."""
+        """Loads the ResNet50 weights and builds the model for the configured precision."""
         try:
+            if self.use_exported and self.exported_model_path.exists():
+                try:
+                    model = self._load_exported_model()
+                    if model is not None:
+                        return model
+                except Exception as e:
+                    logger.warning(f"Exported Vision Model could not be loaded, rebuilding from weights: {e}")
+
             logger.info(f"Loading Vision Model from {self.model_path}...")
             
-            # Define Architecture (ResNet50)
-            model = models.resnet50(weights=None) # We load custom weights
-            num_ftrs = model.fc.in_features
-            model.fc = nn.Linear(num_ftrs, len(self.labels))
-            
             # Load Weights
             if not self.model_path.exists():
                 logger.warning(f"Model file not found at {self.model_path}. Predictions will fail.")
                 return None
 
-            state_dict = torch.load(self.model_path, map_location=self.device)
-            model.load_state_dict(state_dict)
-            
-            model.to(self.device)
-            model.eval() # Set to evaluation mode
+            self.model_version = self._weights_hash()[:12]
+            state_dict = torch.load(self.model_path, map_location="cpu")
+
+            calibration_batches = None
+            if self.precision == "int8_static":
+                calibration_batches = list(self._calibration_batches())
+                if not calibration_batches:
+                    logger.warning("No calibration images found (VISION_CALIBRATION_DIR). Using int8_dynamic.")
+                    self.precision = "int8_dynamic"
+
+            model = prepare_model(
+                state_dict,
+                num_labels=len(self.labels),
+                precision=self.precision,
+                device=self.device,
+                channels_last=self.channels_last,
+                calibration_batches=calibration_batches,
+            )
             
-            logger.info("Vision Model loaded successfully.")
+            logger.info(f"Vision Model loaded successfully (precision={self.precision}, channels_last={self.channels_last}).")
             return model
         except Exception as e:
             logger.error(f"Failed to load Vision Model: {e}")
             raise RuntimeError("Vision Model could not be loaded.")
 
+    def _weights_hash(self) -> str:
+        """SHA-256 of the .pth weights, computed at most once per process."""
+        if self._weights_sha256 is None:
+            self._weights_sha256 = cached_file_sha256(self.model_path)
+        return self._weights_sha256
+
+    def _load_exported_model(self):
+        """
+        Loads the exported TorchScript artifact if it matches this deployment
+        (precision, device, labels, and the .pth it was exported from). Returns None otherwise.
+        """
+        logger.info(f"Loading exported Vision Model from {self.exported_model_path}...")
+        model, metadata = load_torchscript(self.exported_model_path, self.device)
+
+        mismatches = []
+        if metadata.get("precision") != self.precision:
+            mismatches.append(f"precision {metadata.get('precision')} != {self.precision}")
+        if metadata.get("device") != self.device.type:
+            mismatches.append(f"device {metadata.get('device')} != {self.device.type}")
+        if metadata.get("labels") != self.labels:
+            mismatches.append("label set differs")
+        if self.model_path.exists() and metadata.get("source_sha256") != self._weights_hash():
+            mismatches.append(f"stale export of {self.model_path.name}")
+
+        if mismatches:
+            logger.warning(f"Ignoring exported Vision Model ({'; '.join(mismatches)}).")
+            return None
+
+        self.channels_last = bool(metadata.get("channels_last", self.channels_last))
+        self.model_version = metadata.get("source_sha256", "")[:12] or None
+        logger.info(f"Exported Vision Model loaded successfully (precision={self.precision}).")
+        return model
+
     def _get_transforms(self):
         """Returns the image preprocessing pipeline."""
         return transforms.Compose([
@@ -56,33 +156,150 @@ class VisionService:
             transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
         ])
 
-    def predict(self, image_bytes):
+    def _calibration_batches(self, batch_size: int = 8):
+        """Yields preprocessed batches of sample X-rays used to calibrate static INT8 ranges."""
+        if not self.calibration_dir or not Path(self.calibration_dir).is_dir():
+            return
+
+        paths = sorted(
+            p for p in Path(self.calibration_dir).iterdir()
+            if p.suffix.lower() in CALIBRATION_EXTENSIONS
+        )[:self.calibration_max_images]
+
+        for start in range(0, len(paths), batch_size):
+            tensors = [self._preprocess(p.read_bytes()) for p in paths[start:start + batch_size]]
+            yield torch.stack(tensors)
+
+    def _forward(self, batch: torch.Tensor) -> torch.Tensor:
+        """Runs the model on an NCHW batch and returns per-label probabilities on the CPU."""
+        batch = batch.to(self.device, non_blocking=True)
+        if self.channels_last:
+            batch = batch.contiguous(memory_format=torch.channels_last)
+
+        profiler = self.torch_profiler
+        recorder = (profiler.record("vision_forward", self.model_version, use_cuda=self.device.type == "cuda")
+                    if profiler is not None else nullcontext())
+        with torch.no_grad(), recorder:
+            if self.precision == "bf16":
+                with torch.autocast(device_type=self.device.type, dtype=torch.bfloat16):
+                    outputs = self.model(batch)
+            else:
+                outputs = self.model(batch)
+            # Use Sigmoid for multi-label classification
+            return torch.sigmoid(outputs.float()).cpu()
+
+    def _preprocess(self, image_bytes):
+        """Decodes an image byte stream into a normalized (3, 224, 224) tensor."""
+        if self.preprocessor is not None:
+            # Decode, resize and normalize are one step here, so they get a stage of their own
+            with stage_timer("vision", "fused_preprocess"):
+                return self.preprocessor.to_tensor(image_bytes)
+        with stage_timer("vision", "decode"):
+            image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+        with stage_timer("vision", "preprocess"):
+            return self.transform(image)
+
+    def _postprocess(self, probs):
+        """Maps a vector of per-label probabilities to a {label: probability} dict, highest first."""
+        results = {}
+        for i, prob in enumerate(probs):
+            results[self.labels[i]] = float(prob)
+
+        # Sort by probability descending
+        return dict(sorted(results.items(), key=lambda item: item[1], reverse=True))
+
+    def predict_batch(self, images: list) -> list:
         """
-        Predicts pathologies from an image byte stream.
-        Returns a dictionary of {label: probability} for pathologies.
+        Predicts pathologies for several image byte streams, up to `max_batch_size` per forward pass.
+        Returns one {label: probability} dict per input, in input order. Inputs that
+        cannot be decoded get their Exception in place of a result.
         """
         if self.model is None:
             raise RuntimeError("Vision model is not loaded.")
 
-        try:
-            image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-            image_tensor = self.transform(image).unsqueeze(0) # Add batch dimension
-            image_tensor = image_tensor.to(self.device)
+        results = [None] * len(images)
+        with self._inference_lock:
+            for start in range(0, len(images), self.max_batch_size):
+                self._predict_chunk(images[start:start + self.max_batch_size], start, results)
+        return results
 
-            with torch.no_grad():
-                outputs = self.model(image_tensor)
-                # Use Sigmoid for multi-label classification
-                probs = torch.sigmoid(outputs).squeeze()
+    def _predict_chunk(self, images: list, offset: int, results: list):
+        """Preprocesses and scores up to `max_batch_size` images, writing into `results[offset:]`."""
+        positions, tensors = [], []
+        for i, image_bytes in enumerate(images, start=offset):
+            try:
+                if self.preprocessor is not None:
+                    with stage_timer("vision", "fused_preprocess"):
+                        self.preprocessor.fill(len(positions), image_bytes)
+                else:
+                    tensors.append(self._preprocess(image_bytes))
+                positions.append(i)
+            except Exception as e:
+                logger.error(f"Error decoding image for vision prediction: {e}")
+                results[i] = ValueError(f"Could not decode image: {e}")
 
-            results = {}
-            for i, prob in enumerate(probs):
-                results[self.labels[i]] = float(prob)
-            
-            # Sort by probability descending
-            sorted_results = dict(sorted(results.items(), key=lambda item: item[1], reverse=True))
-            
-            return sorted_results
+        if not positions:
+            return
+
+        try:
+            if self.preprocessor is not None:
+                # Already normalized in place; this is a view of the filled slots
+                batch = self.preprocessor.batch(len(positions))
+            else:
+                with stage_timer("vision", "preprocess"):
+                    batch = torch.stack(tensors)
+            with stage_timer("vision", "forward"):
+                probs = self._forward(batch)
+
+            with stage_timer("vision", "postprocess"):
+                for row, i in enumerate(positions):
+                    results[i] = self._postprocess(probs[row].tolist())
 
         except Exception as e:
             logger.error(f"Error during vision prediction: {e}")
-            raise
\ No newline at end of file
+            raise
+
+    def cache_key(self, image_bytes):
+        """
+        SHA-256 over the model version, inference settings and raw image bytes.
+        Returns None when caching is disabled or the model version is unknown.
+        """
+        if self.result_cache is None or not self.model_version:
+            return None
+        digest = hashlib.sha256(
+            f"{self.model_version}:{self.precision}:{self.preprocessor is not None}\0".encode()
+        )
+        digest.update(image_bytes)
+        return digest.hexdigest()
+
+    def get_cached(self, key):
+        """Cached {label: probability} dict for `key`, or None. No decoding or inference happens here."""
+        if key is None:
+            return None
+        result = self.result_cache.get(key)
+        CACHE_REQUESTS.inc(cache="vision", result="miss" if result is None else "hit")
+        return dict(result) if result is not None else None
+
+    def lookup(self, image_bytes):
+        """(cache key, cached result or None): hashes the bytes and checks memory, then disk."""
+        key = self.cache_key(image_bytes)
+        return key, self.get_cached(key)
+
+    def remember(self, key, result: dict):
+        if key is not None:
+            self.result_cache.put(key, result)
+
+    def predict(self, image_bytes):
+        """
+        Predicts pathologies from an image byte stream.
+        Returns a dictionary of {label: probability} for pathologies.
+        """
+        key, cached = self.lookup(image_bytes)
+        if cached is not None:
+            return cached
+
+        result = self.predict_batch([image_bytes])[0]
+        if isinstance(result, Exception):
+            raise result
+        self.remember(key, result)
+        return result
@@ -2,10 +2,25 @@ import streamlit as st
 import requests
 from PIL import Image
 import os
+import json
 
 # API Configuration
 API_URL = os.getenv("API_URL", "http://localhost:8085")
 
+
+def iter_sse(response):
+    """Yields (event, data) pairs from a server-sent events response."""
+    event, data = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
 st.set_page_config(
     page_title="Clinical Intelligence Co-Pilot",
     page_icon="🩺",
@@ -372,19 +387,32 @@ with col2:
                     st.markdown(prompt)
                 
                 with st.chat_message("assistant"):
-                    with st.spinner("Accessing Knowledge Base..."):
-                        try:
-                            payload = {"message": prompt}
-                            response = requests.post(f"{API_URL}/predict/chat", json=payload)
-                            
-                            if response.status_code == 200:
-                                full_response = response.json()["response"]
-                            else:
-                                full_response = f"Error: {response.text}"
-                        except Exception as e:
-                             full_response = f"Connection Error: {e}"
-                        
-                        st.markdown(full_response)
+                    placeholder = st.empty()
+                    full_response = ""
+                    try:
+                        payload = {"message": prompt}
+                        # Tokens are rendered as they arrive; the spinner only covers retrieval
+                        with st.spinner("Accessing Knowledge Base..."):
+                            response = requests.post(f"{API_URL}/predict/chat/stream", json=payload, stream=True)
+                            events = iter_sse(response) if response.status_code == 200 else iter(())
+                            for event, data in events:
+                                if event == "sources":
+                                    break
+                                if event == "error":
+                                    full_response = f"Error: {data['detail']}"
+
+                        if response.status_code != 200:
+                            full_response = f"Error: {response.text}"
+                        for event, data in events:
+                            if event == "token":
+                                full_response += data["text"]
+                                placeholder.markdown(full_response + "▌")
+                            elif event == "error":
+                                full_response += f"\n\nError: {data['detail']}"
+                    except Exception as e:
+                         full_response = f"Connection Error: {e}"
+
+                    placeholder.markdown(full_response)
             
             st.session_state.messages.append({"role": "assistant", "content": full_response})
     
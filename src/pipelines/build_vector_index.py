@@ -1,15 +1,22 @@
 import os
+import re
+import sys
+import time
+import argparse
+import hashlib
 from pathlib import Path
 from dotenv import load_dotenv
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import AzureSearch
 from azure.storage.blob import BlobServiceClient
-import uuid
 import json
+import random
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 # from azure.identity import DefaultAzureCredential # Removed in favor of SAS Token
 from azure.core.credentials import AzureKeyCredential
+from azure.search.documents import SearchClient
 from azure.search.documents.indexes import SearchIndexClient
 from azure.search.documents.indexes.models import (
     SearchIndex,
@@ -25,6 +32,9 @@ from azure.search.documents.indexes.models import (
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 load_dotenv(dotenv_path=str(PROJECT_ROOT / ".env"), override=True)
 
+# Add project root to path so the API package can be imported
+sys.path.append(str(PROJECT_ROOT))
+
 # Azure configuration
 STORAGE_ACCOUNT_NAME = os.getenv("STORAGE_ACCOUNT_NAME", "clinicaldatalake25")
 KNOWLEDGE_BASE_CONTAINER_NAME = os.getenv("KNOWLEDGE_BASE_CONTAINER_NAME", "knowledge-base")
@@ -37,7 +47,31 @@ INDEX_NAME = os.getenv("AZURE_SEARCH_INDEX_NAME", "clinical-knowledge-index-v2")
 
 # Embedding model configuration
 EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
-BATCH_SIZE = 4  # Smaller batches avoid Search API size limits
+EMBED_BATCH_SIZE = 256  # Chunks per embed_documents call (the encoder runs its own mini-batches inside)
+
+# Upload configuration: requests are packed by JSON payload size, well under the 16 MB Search API limit
+UPLOAD_MAX_BYTES = 4 * 1024 * 1024
+UPLOAD_MAX_DOCUMENTS = 1000  # Search API limit per request
+UPLOAD_WORKERS = 4
+UPLOAD_MAX_RETRIES = 5
+
+# Chunking configuration (part of the manifest: changing it forces a full rebuild)
+CHUNK_SIZE = 2200
+CHUNK_OVERLAP = 500
+# Matches whitespace runs (newlines, tabs, spaces) collapsed to a single space during cleaning
+WHITESPACE_RE = re.compile(r"\s+")
+
+# Local index configuration (read by RAGService when RAG_RETRIEVER_BACKEND=local)
+DEFAULT_LOCAL_INDEX_DIR = PROJECT_ROOT / "src" / "api" / "models" / "knowledge_index"
+# BM25 index over chunk content (read by RAGService when RAG_RETRIEVAL_MODE=hybrid)
+DEFAULT_LEXICAL_INDEX_DIR = PROJECT_ROOT / "src" / "api" / "models" / "lexical_index"
+
+# Incremental indexing state: downloaded PDFs, embedding cache and one manifest per index
+PDF_CACHE_DIR = PROJECT_ROOT / "temp_pdfs"
+DEFAULT_EMBEDDING_CACHE_PATH = PDF_CACHE_DIR / "embeddings.sqlite"
+AZURE_MANIFEST_PATH = PDF_CACHE_DIR / f"{INDEX_NAME}.manifest.json"
+LOCAL_MANIFEST_FILE = "sources.json"
+MANIFEST_VERSION = 1
 
 def require(value: str, name: str) -> str:
     """Ensures required configuration values exist before running the pipeline."""
@@ -46,15 +80,53 @@ def require(value: str, name: str) -> str:
     return value
 
 
-def download_pdfs_from_blob():
-    """Downloads all PDFs from blob storage to a local temporary directory."""
-    local_pdf_dir = "temp_pdfs"
-    os.makedirs(local_pdf_dir, exist_ok=True)
-    
-    print("Connecting to Blob Storage...")
+def sha256_file(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def new_manifest() -> dict:
+    return {
+        "manifest_version": MANIFEST_VERSION,
+        "embedding_model": EMBEDDING_MODEL_NAME,
+        "chunking": {"chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP},
+        # PDF name -> {"sha256", "etag", "chunk_ids"}; chunk IDs are content hashes
+        "documents": {},
+    }
+
+
+def load_manifest(path: Path):
+    """
+    Returns the manifest of a previous build, or None when the index has to be rebuilt
+    from scratch (no manifest, or built with another embedding model or chunking).
+    """
+    if not path.exists():
+        print(f"No manifest at {path}. Running a full rebuild.")
+        return None
+    manifest = json.loads(path.read_text())
+    expected = new_manifest()
+    for key in ("manifest_version", "embedding_model", "chunking"):
+        if manifest.get(key) != expected[key]:
+            print(f"Manifest {key} changed ({manifest.get(key)} -> {expected[key]}). Running a full rebuild.")
+            return None
+    return manifest
+
+
+def save_manifest(path: Path, manifest: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    manifest["updated_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp_path, path)
+
+
+def get_knowledge_base_container():
     storage_account = require(STORAGE_ACCOUNT_NAME, "STORAGE_ACCOUNT_NAME")
     sas_token = require(SAS_TOKEN, "SAS_TOKEN")
-    
+
     # Determine if SAS token already has the leading '?' or not
     if not sas_token.startswith("?"):
         sas_token = f"?{sas_token}"
@@ -62,74 +134,169 @@ def download_pdfs_from_blob():
     storage_account_url = f"https://{storage_account}.blob.core.windows.net"
     # Use SAS Token for authentication
     blob_service_client = BlobServiceClient(account_url=storage_account_url, credential=sas_token)
-    container_client = blob_service_client.get_container_client(KNOWLEDGE_BASE_CONTAINER_NAME)
+    return blob_service_client.get_container_client(KNOWLEDGE_BASE_CONTAINER_NAME)
+
 
-    print(f"Downloading PDFs from container '{KNOWLEDGE_BASE_CONTAINER_NAME}'...")
+def publish_build_stamp(manifest: dict):
+    """
+    Uploads the Azure index's content version (a hash of every live chunk ID, which are
+    content-hashed) next to the PDFs. RAGService keys its answer cache on it, since
+    merge-or-upload changes neither the index ETag nor, often, the document count.
+    """
+    from src.api.core.query_cache import index_build_stamp_blob
+
+    chunk_ids = sorted(chunk_id for doc in manifest["documents"].values() for chunk_id in doc["chunk_ids"])
+    digest = hashlib.sha256()
+    for chunk_id in chunk_ids:
+        digest.update(chunk_id.encode("utf-8"))
+    stamp = {
+        "index": INDEX_NAME,
+        "version": digest.hexdigest()[:16],
+        "documents": len(manifest["documents"]),
+        "chunks": len(chunk_ids),
+        "updated_at": manifest.get("updated_at"),
+    }
+    blob_name = index_build_stamp_blob(INDEX_NAME)
+    try:
+        get_knowledge_base_container().upload_blob(blob_name, json.dumps(stamp), overwrite=True)
+        print(f"Published index version {stamp['version']} to '{KNOWLEDGE_BASE_CONTAINER_NAME}/{blob_name}'.")
+    except Exception as e:
+        print(f"WARNING: could not publish the index version ({e}). "
+              f"API answer caches will only refresh when the document count changes.")
+
+
+def download_pdfs_from_blob(known_etags: dict):
+    """
+    Lists PDFs in blob storage and downloads the ones whose ETag differs from the last
+    build. Returns {name: {"path", "etag", "sha256"}}; skipped PDFs have no local path.
+    """
+    local_pdf_dir = PDF_CACHE_DIR
+    os.makedirs(local_pdf_dir, exist_ok=True)
+
+    print("Connecting to Blob Storage...")
+    container_client = get_knowledge_base_container()
+
+    print(f"Downloading new or changed PDFs from container '{KNOWLEDGE_BASE_CONTAINER_NAME}'...")
     blob_list = container_client.list_blobs()
-    downloaded_files = []
+    sources = {}
     for blob in blob_list:
         if blob.name.lower().endswith(".pdf"):
-            local_file_path = os.path.join(local_pdf_dir, os.path.basename(blob.name))
+            name = os.path.basename(blob.name)
+            known = known_etags.get(name)
+            if known is not None and known["etag"] == blob.etag:
+                sources[name] = {"path": None, "etag": blob.etag, "sha256": known["sha256"]}
+                continue
+            local_file_path = os.path.join(local_pdf_dir, name)
             with open(local_file_path, "wb") as download_file:
                 download_file.write(container_client.download_blob(blob.name).readall())
-            downloaded_files.append(local_file_path)
+            sources[name] = {"path": local_file_path, "etag": blob.etag, "sha256": sha256_file(local_file_path)}
             print(f"  Downloaded: {blob.name}")
-    return downloaded_files, local_pdf_dir
+    print(f"{len(sources)} PDFs in the container, {sum(s['path'] is not None for s in sources.values())} downloaded.")
+    return sources
 
-def main():
+
+def list_local_pdfs(pdf_dir: str):
+    """Lists PDFs in a local folder (offline builds skip the Blob Storage download)."""
+    sources = {}
+    for path in sorted(Path(pdf_dir).iterdir()):
+        if path.suffix.lower() == ".pdf":
+            sources[path.name] = {"path": str(path), "etag": None, "sha256": sha256_file(path)}
+    print(f"Found {len(sources)} PDFs in '{pdf_dir}'.")
+    return sources
+
+
+def sanitize_metadata(data):
+    """Recursively sanitizes metadata to ensure all values are primitive types."""
+    if isinstance(data, dict):
+        return {k: sanitize_metadata(v) for k, v in data.items()}
+    elif isinstance(data, list):
+        return [sanitize_metadata(i) for i in data]
+    elif not isinstance(data, (str, int, float, bool, type(None))):
+        return str(data)
+    return data
+
+
+def chunk_ids_for(name: str, chunks) -> list:
     """
-    Main function to build and populate the Azure AI Search vector index.
+    Deterministic chunk IDs: a hash of the PDF name and chunk text, so re-indexing the
+    same content produces the same IDs and uploads are idempotent upserts.
     """
-    # 1. Download PDFs from Blob Storage
-    pdf_files, pdf_dir = download_pdfs_from_blob()
-    if not pdf_files:
-        print("No PDF files found. Exiting.")
-        return
+    ids = []
+    seen = {}
+    for doc in chunks:
+        chunk_id = hashlib.sha256(f"{name}\n{doc.page_content}".encode("utf-8")).hexdigest()[:40]
+        # Identical chunks within one PDF still need distinct keys
+        occurrence = seen.get(chunk_id, 0)
+        seen[chunk_id] = occurrence + 1
+        ids.append(chunk_id if occurrence == 0 else f"{chunk_id}-{occurrence}")
+    return ids
 
-    # 2. Load and Chunk Documents
-    print("\nLoading and chunking documents...")
-    all_docs = []
-    for pdf_file in pdf_files:
-        loader = PyPDFLoader(pdf_file)
-        documents = loader.load()
-        
-        # CLEANING STEP: Remove excessive whitespace
-        import re
-        for doc in documents:
-            content = doc.page_content
-            # Regex to replace all whitespace (newlines, tabs, spaces) sequences with a single space
-            cleaned_content = re.sub(r'\s+', ' ', content).strip()
-            doc.page_content = cleaned_content
-            
-        all_docs.extend(documents)
-
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=2200, chunk_overlap=500)
-    chunked_docs = text_splitter.split_documents(all_docs)
-    print(f"Total documents chunked into {len(chunked_docs)} pieces.")
-
-    # Sanitize metadata to ensure all values are primitive types
-    def sanitize_metadata(data):
-        """Recursively sanitizes metadata to ensure all values are primitive types."""
-        if isinstance(data, dict):
-            return {k: sanitize_metadata(v) for k, v in data.items()}
-        elif isinstance(data, list):
-            return [sanitize_metadata(i) for i in data]
-        elif not isinstance(data, (str, int, float, bool, type(None))):
-            return str(data)
-        return data
+
+def load_and_chunk(pdf_file: str):
+    """
+    Loads one PDF, normalizes whitespace and splits the pages into chunks. Runs in a
+    worker process, so it returns (chunks, stats) with its own timings.
+    """
+    start = time.perf_counter()
+    loader = PyPDFLoader(pdf_file)
+    documents = loader.load()
+    loaded = time.perf_counter()
+
+    # CLEANING STEP: Remove excessive whitespace
+    for doc in documents:
+        doc.page_content = WHITESPACE_RE.sub(" ", doc.page_content).strip()
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    chunked_docs = text_splitter.split_documents(documents)
 
     for doc in chunked_docs:
         doc.metadata = sanitize_metadata(doc.metadata)
+    stats = {
+        "pages": len(documents),
+        "load_seconds": loaded - start,
+        "chunk_seconds": time.perf_counter() - loaded,
+    }
+    return chunked_docs, stats
+
+
+def parse_pdfs(pdf_paths: dict, workers: int):
+    """
+    Parses PDFs in a process pool and yields (name, chunks, stats, error) as each file
+    finishes, so downstream stages can start before the slowest PDF is done.
+    """
+    if workers <= 1 or len(pdf_paths) <= 1:
+        for name, path in pdf_paths.items():
+            try:
+                yield (name, *load_and_chunk(path), None)
+            except Exception as e:
+                yield name, [], {}, e
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(load_and_chunk, path): name for name, path in pdf_paths.items()}
+        for future in as_completed(futures):
+            try:
+                yield (futures[future], *future.result(), None)
+            except Exception as e:
+                yield futures[future], [], {}, e
+
+
+def plan_changes(manifest: dict, sources: dict):
+    """Splits the current PDFs into changed (new or different content) and removed ones."""
+    documents = manifest["documents"]
+    changed = [name for name, source in sources.items()
+               if documents.get(name, {}).get("sha256") != source["sha256"]]
+    removed = [name for name in documents if name not in sources]
+    return changed, removed
 
-    # 3. Create Embeddings
-    print(f"\nInitializing embedding model: '{EMBEDDING_MODEL_NAME}'...")
-    # This will download the model from Hugging Face the first time you run it
-    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
-    print("Embedding model loaded.")
 
-    # 4. Initialize and Populate Azure AI Search Vector Store
-    print(f"\nPopulating Azure AI Search index '{INDEX_NAME}' in batches of {BATCH_SIZE} chunks...")
+def get_index_client():
     azure_search_key = require(AZURE_SEARCH_KEY, "AZURE_SEARCH_KEY")
+    return SearchIndexClient(endpoint=AZURE_SEARCH_ENDPOINT, credential=AzureKeyCredential(azure_search_key))
+
+
+def create_azure_index(recreate: bool):
+    """Creates the Azure AI Search index, deleting the existing one first on a full rebuild."""
     # Define Azure AI Search index schema
     fields = [
         SimpleField(name="id", type=SearchFieldDataType.String, key=True),
@@ -147,65 +314,347 @@ def main():
     )
 
     index = SearchIndex(name=INDEX_NAME, fields=fields, vector_search=vector_search)
-    
-    # Create or update the index
-    print(f"Creating or updating index '{INDEX_NAME}'...")
-    credential = AzureKeyCredential(azure_search_key)
-    index_client = SearchIndexClient(endpoint=AZURE_SEARCH_ENDPOINT, credential=credential)
-    
-    # DELETE EXISTING INDEX to ensure we don't have duplicate dirty data
-    try:
-        print(f"Deleting existing index '{INDEX_NAME}' to ensure clean slate...")
-        index_client.delete_index(INDEX_NAME)
-        print("Index deleted.")
-    except Exception:
-        print("Index did not exist or could not be deleted.")
+    index_client = get_index_client()
 
+    # DELETE EXISTING INDEX on full rebuilds so documents from earlier builds don't linger
+    if recreate:
+        try:
+            print(f"Deleting existing index '{INDEX_NAME}' to ensure clean slate...")
+            index_client.delete_index(INDEX_NAME)
+            print("Index deleted.")
+        except Exception:
+            print("Index did not exist or could not be deleted.")
+
+    print(f"Creating or updating index '{INDEX_NAME}'...")
     index_client.create_or_update_index(index)
-    print("Index created successfully.")
+    print("Index ready.")
 
-    vector_store = AzureSearch(
-        azure_search_endpoint=AZURE_SEARCH_ENDPOINT,
-        azure_search_key=azure_search_key,
-        index_name=INDEX_NAME,
-        embedding_function=embeddings.embed_documents
-    )
-    
-    # 5. Manually prepare and upload data in batches
-    total_chunks = len(chunked_docs)
-    for start in range(0, total_chunks, BATCH_SIZE):
-        end = min(start + BATCH_SIZE, total_chunks)
-        batch = chunked_docs[start:end]
-
-        # Generate embeddings for the entire batch in one call to avoid repeated model invocations
-        batch_contents = [doc.page_content for doc in batch]
-        batch_embeddings = embeddings.embed_documents(batch_contents)
-
-        # Manually create the payload for Azure AI Search
-        documents_to_upload = []
-        for doc, content_vector in zip(batch, batch_embeddings):
-            documents_to_upload.append({
-                "id": str(uuid.uuid4()),
-                "content": doc.page_content,
-                "content_vector": content_vector,
-                "metadata": json.dumps(sanitize_metadata(doc.metadata)),
-                "source": doc.metadata.get("source", ""),
-                "page": str(doc.metadata.get("page", ""))
-            })
-
-        print(f"  -> Uploading chunks {start + 1}-{end} of {total_chunks}...")
-        search_client = vector_store.client
-        search_client.upload_documents(documents=documents_to_upload)
+
+def get_search_client() -> SearchClient:
+    azure_search_key = require(AZURE_SEARCH_KEY, "AZURE_SEARCH_KEY")
+    return SearchClient(endpoint=AZURE_SEARCH_ENDPOINT, index_name=INDEX_NAME,
+                        credential=AzureKeyCredential(azure_search_key))
+
+
+def to_search_document(chunk_id: str, doc, content_vector) -> dict:
+    """Payload for one chunk in the Azure AI Search index schema."""
+    return {
+        "id": chunk_id,
+        "content": doc.page_content,
+        "content_vector": list(content_vector),
+        "metadata": json.dumps(sanitize_metadata(doc.metadata)),
+        "source": doc.metadata.get("source", ""),
+        "page": str(doc.metadata.get("page", ""))
+    }
+
+
+class AzureUploader:
+    """
+    Uploads documents to Azure AI Search from a bounded pool of threads while the caller
+    keeps embedding. Documents are packed into requests by serialized size, failed
+    requests and failed documents are retried with exponential backoff, and `add` blocks
+    once `workers * 2` requests are in flight so memory stays bounded.
+    """
+
+    def __init__(self, search_client: SearchClient, workers: int = UPLOAD_WORKERS,
+                 max_batch_bytes: int = UPLOAD_MAX_BYTES, max_retries: int = UPLOAD_MAX_RETRIES):
+        self.search_client = search_client
+        self.max_batch_bytes = max_batch_bytes
+        self.max_retries = max_retries
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="uploader")
+        self.in_flight = threading.BoundedSemaphore(workers * 2)
+        self.futures = []
+        self.batch = []
+        self.batch_bytes = 0
+        self.uploaded = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def add(self, document: dict):
+        size = len(json.dumps(document))
+        if self.batch and (self.batch_bytes + size > self.max_batch_bytes or len(self.batch) >= UPLOAD_MAX_DOCUMENTS):
+            self.flush()
+        self.batch.append(document)
+        self.batch_bytes += size
+
+    def flush(self):
+        if not self.batch:
+            return
+        batch, self.batch, self.batch_bytes = self.batch, [], 0
+        self.in_flight.acquire()
+        future = self.pool.submit(self._send, batch)
+        future.add_done_callback(lambda _: self.in_flight.release())
+        self.futures.append(future)
+
+    def _send(self, batch: list):
+        for attempt in range(self.max_retries + 1):
+            try:
+                results = self.search_client.merge_or_upload_documents(documents=batch)
+                failed_keys = {result.key for result in results if not result.succeeded}
+                error = f"{len(failed_keys)} documents were rejected"
+            except Exception as e:
+                failed_keys = {document["id"] for document in batch}
+                error = str(e)
+
+            with self._lock:
+                self.requests += 1
+                self.uploaded += len(batch) - len(failed_keys)
+            if not failed_keys:
+                return
+            if attempt == self.max_retries:
+                raise RuntimeError(f"Upload of {len(failed_keys)} documents failed after {attempt + 1} attempts: {error}")
+
+            batch = [document for document in batch if document["id"] in failed_keys]
+            delay = min(30.0, 2 ** attempt) * (0.5 + random.random())
+            print(f"  -> Upload of {len(batch)} documents failed ({error}). Retrying in {delay:.1f}s...")
+            time.sleep(delay)
+
+    def close(self):
+        """Sends the last partial request and waits for all uploads; re-raises the first failure."""
+        self.flush()
+        try:
+            for future in self.futures:
+                future.result()
+        finally:
+            self.pool.shutdown(wait=True)
+
+
+def delete_azure_chunks(search_client: SearchClient, delete_ids):
+    delete_ids = list(delete_ids)
+    for start in range(0, len(delete_ids), UPLOAD_MAX_DOCUMENTS):
+        batch = delete_ids[start:start + UPLOAD_MAX_DOCUMENTS]
+        print(f"  -> Deleting {len(batch)} stale chunks...")
+        search_client.delete_documents(documents=[{"id": chunk_id} for chunk_id in batch])
+
+
+def update_lexical_index(index_dir, live_ids: set, upload_chunks):
+    """Rewrites the BM25 index from the still-live chunks plus the new ones (no embeddings needed)."""
+    from src.api.core.lexical_index import read_lexical_chunks, write_lexical_index
+
+    existing_chunks = read_lexical_chunks(index_dir)
+    upload_ids = {chunk_id for chunk_id, _ in upload_chunks}
+    chunks = [chunk for chunk in existing_chunks if chunk["id"] in live_ids and chunk["id"] not in upload_ids]
+    reused = len(chunks)
+    chunks.extend({"id": chunk_id, "content": doc.page_content, "metadata": doc.metadata}
+                  for chunk_id, doc in upload_chunks)
+
+    print(f"\nWriting BM25 lexical index to '{index_dir}': "
+          f"{reused} reused, {len(upload_chunks)} new, {len(existing_chunks) - reused} removed chunks...")
+    manifest = write_lexical_index(index_dir, chunks)
+    print(f"Lexical index version {manifest['version']}: {manifest['count']} chunks, {manifest['terms']} terms.")
+
+
+def update_local_index(index_dir, live_ids: set, upload_chunks, chunk_vectors, dtype: str, build_hnsw: bool):
+    """Rewrites the local index: rows of still-live chunks are reused, new chunks appended."""
+    import numpy as np
+    from src.api.core.local_vector_index import read_local_index, write_local_index
+
+    existing_vectors, existing_chunks = read_local_index(index_dir)
+    upload_ids = {chunk_id for chunk_id, _ in upload_chunks}
+    keep = [row for row, chunk in enumerate(existing_chunks)
+            if chunk["id"] in live_ids and chunk["id"] not in upload_ids]
+    chunks = [existing_chunks[row] for row in keep]
+    vectors = [existing_vectors[keep]] if keep else []
+
+    if upload_chunks:
+        chunks.extend({"id": chunk_id, "content": doc.page_content, "metadata": doc.metadata}
+                      for chunk_id, doc in upload_chunks)
+        vectors.append(np.asarray([chunk_vectors[chunk_id] for chunk_id, _ in upload_chunks], dtype=np.float32))
+
+    print(f"\nWriting local vector index to '{index_dir}' ({dtype}): "
+          f"{len(keep)} reused, {len(upload_chunks)} new, {len(existing_chunks) - len(keep)} removed chunks...")
+    matrix = np.concatenate(vectors) if vectors else np.zeros((0, 384), dtype=np.float32)
+    manifest = write_local_index(index_dir, matrix, chunks, EMBEDDING_MODEL_NAME,
+                                 dtype=dtype, build_hnsw=build_hnsw)
+    print(f"Local index version {manifest['version']}: {manifest['count']} chunks, "
+          f"{'HNSW + exact' if manifest['hnsw'] else 'exact'} search.")
+
+
+def main():
+    """
+    Main function to build or incrementally update the Azure AI Search vector index and/or the local index.
+    """
+    from src.api.core.embedding_cache import CachedEmbeddings
+
+    parser = argparse.ArgumentParser(description="Build the clinical knowledge-base vector index.")
+    parser.add_argument("--target", default="azure", choices=("azure", "local", "both"),
+                        help="Populate Azure AI Search, write a local index, or both.")
+    parser.add_argument("--full", action="store_true",
+                        help="Ignore the manifest and rebuild from scratch (default: only re-index changed PDFs).")
+    parser.add_argument("--pdf-dir", help="Read PDFs from this folder instead of downloading them from Blob Storage.")
+    parser.add_argument("--local-index-dir", default=str(DEFAULT_LOCAL_INDEX_DIR))
+    parser.add_argument("--lexical-index-dir", default=str(DEFAULT_LEXICAL_INDEX_DIR),
+                        help="Where the BM25 index used by hybrid retrieval is written.")
+    parser.add_argument("--skip-lexical", action="store_true", help="Do not build or update the BM25 index.")
+    parser.add_argument("--local-dtype", default="float32", choices=("float32", "float16"),
+                        help="Storage precision of the local vectors (float16 halves memory).")
+    parser.add_argument("--hnsw", action="store_true", help="Also build an HNSW graph for the local index (needs hnswlib).")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="Processes used to parse and chunk PDFs (the main process embeds).")
+    parser.add_argument("--embedding-cache", default=str(DEFAULT_EMBEDDING_CACHE_PATH),
+                        help="SQLite cache of chunk embeddings keyed by text hash ('' disables it).")
+    parser.add_argument("--embed-batch-size", type=int, default=EMBED_BATCH_SIZE,
+                        help="Chunks collected before each embedding call.")
+    parser.add_argument("--upload-workers", type=int, default=UPLOAD_WORKERS,
+                        help="Concurrent upload requests to Azure AI Search.")
+    parser.add_argument("--upload-batch-bytes", type=int, default=UPLOAD_MAX_BYTES,
+                        help="Maximum JSON payload size of one upload request.")
+    args = parser.parse_args()
+
+    # 1. Load the manifest of each target; None means a full rebuild
+    manifest_paths = {}
+    if args.target in ("azure", "both"):
+        manifest_paths["azure"] = AZURE_MANIFEST_PATH
+    if args.target in ("local", "both"):
+        manifest_paths["local"] = Path(args.local_index_dir) / LOCAL_MANIFEST_FILE
+    if not args.skip_lexical:
+        manifest_paths["lexical"] = Path(args.lexical_index_dir) / LOCAL_MANIFEST_FILE
+    previous = {target: None if args.full else load_manifest(path) for target, path in manifest_paths.items()}
+    manifests = {target: manifest if manifest is not None else new_manifest() for target, manifest in previous.items()}
+
+    # 2. Find PDFs (blobs whose ETag every target has already indexed are not downloaded)
+    if args.pdf_dir:
+        sources = list_local_pdfs(args.pdf_dir)
+    else:
+        known_etags = None
+        for manifest in manifests.values():
+            documents = manifest["documents"]
+            known = {name: doc for name, doc in documents.items() if doc.get("etag")}
+            if known_etags is None:
+                known_etags = known
+            else:
+                known_etags = {name: doc for name, doc in known_etags.items()
+                               if known.get(name, {}).get("etag") == doc["etag"]}
+        sources = download_pdfs_from_blob(known_etags or {})
+
+    # 3. Work out what changed for each target
+    plans = {target: plan_changes(manifest, sources) for target, manifest in manifests.items()}
+    to_parse = sorted({name for changed, _ in plans.values() for name in changed})
+    for target, (changed, removed) in plans.items():
+        print(f"[{target}] {len(changed)} new or changed PDFs, {len(removed)} removed, "
+              f"{len(sources) - len(changed)} unchanged.")
+
+    # Azure uploads start as soon as the first chunks are embedded, so the index must exist upfront
+    uploader = None
+    azure_upload_ids = set()
+    if "azure" in plans and (previous["azure"] is None or any(plans["azure"])):
+        print(f"\nPreparing Azure AI Search index '{INDEX_NAME}'...")
+        create_azure_index(recreate=previous["azure"] is None)
+        uploader = AzureUploader(get_search_client(), workers=args.upload_workers,
+                                 max_batch_bytes=args.upload_batch_bytes)
+
+    # 4. Parse and chunk the new or changed PDFs in parallel; deletions of removed PDFs are known upfront
+    updates = {target: ([], set()) for target in plans}
+    for target, (_, removed) in plans.items():
+        for name in removed:
+            updates[target][1].update(manifests[target]["documents"].pop(name)["chunk_ids"])
+
+    embeddings = None
+    chunk_vectors = {}
+    embed_queue = {}
+    embed_seconds = 0.0
+
+    def embed_queued_chunks():
+        """Embeds the queued chunks in one large batch and hands them to the uploaders."""
+        nonlocal embeddings, embed_seconds
+        if not embed_queue:
+            return
+        if embeddings is None:
+            print(f"\nInitializing embedding model: '{EMBEDDING_MODEL_NAME}'...")
+            # This will download the model from Hugging Face the first time you run it
+            embeddings = CachedEmbeddings(HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME),
+                                          EMBEDDING_MODEL_NAME, cache_path=args.embedding_cache or None)
+            print("Embedding model loaded.")
+        start = time.perf_counter()
+        queued_ids = list(embed_queue)
+        vectors = embeddings.embed_documents([embed_queue[chunk_id].page_content for chunk_id in queued_ids])
+        embed_seconds += time.perf_counter() - start
+        print(f"  Embedded {len(queued_ids)} chunks in {time.perf_counter() - start:.2f}s")
+        for chunk_id, vector in zip(queued_ids, vectors):
+            chunk_vectors[chunk_id] = vector
+            if uploader is not None and chunk_id in azure_upload_ids:
+                uploader.add(to_search_document(chunk_id, embed_queue[chunk_id], vector))
+        embed_queue.clear()
+
+    print(f"\nLoading and chunking {len(to_parse)} documents with {args.workers} worker processes...")
+    failed = set()
+    total_chunks = 0
+    parse_start = time.perf_counter()
+    for name, chunks, stats, error in parse_pdfs({name: sources[name]["path"] for name in to_parse}, args.workers):
+        if error is not None:
+            # Left out of the manifest, so the next run retries it
+            print(f"  FAILED {name}: {error}")
+            failed.add(name)
+            continue
+        print(f"  {name}: {stats['pages']} pages -> {len(chunks)} chunks "
+              f"(load {stats['load_seconds']:.2f}s, chunk {stats['chunk_seconds']:.2f}s)")
+        total_chunks += len(chunks)
+        chunk_ids = chunk_ids_for(name, chunks)
+
+        # 5. Diff chunk IDs per target: upload IDs not indexed yet, delete IDs no longer produced
+        for target, (changed, _) in plans.items():
+            if name not in changed:
+                continue
+            documents = manifests[target]["documents"]
+            old_ids = set(documents.get(name, {}).get("chunk_ids", []))
+            upload_chunks = [(chunk_id, doc) for chunk_id, doc in zip(chunk_ids, chunks) if chunk_id not in old_ids]
+            updates[target][0].extend(upload_chunks)
+            updates[target][1].update(old_ids - set(chunk_ids))
+            if target == "azure":
+                azure_upload_ids.update(chunk_id for chunk_id, _ in upload_chunks)
+            if target != "lexical":
+                embed_queue.update((chunk_id, doc) for chunk_id, doc in upload_chunks if chunk_id not in chunk_vectors)
+            # Record the new state; it is saved once the target has been updated
+            documents[name] = {"sha256": sources[name]["sha256"], "etag": sources[name]["etag"],
+                               "chunk_ids": chunk_ids}
+
+        # 6. Create Embeddings in large batches while the workers keep parsing and the uploaders send
+        if len(embed_queue) >= args.embed_batch_size:
+            embed_queued_chunks()
+    embed_queued_chunks()
+
+    print(f"Parsed {len(to_parse) - len(failed)} documents into {total_chunks} chunks "
+          f"in {time.perf_counter() - parse_start:.2f}s ({len(failed)} failed, {embed_seconds:.2f}s embedding).")
+    if embeddings is not None:
+        cache_stats = embeddings.stats()
+        print(f"Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} computed.")
+    for manifest in manifests.values():
+        documents = manifest["documents"]
+        for name, source in sources.items():
+            # PDFs re-uploaded without content changes get a new ETag
+            if name in documents and name not in failed:
+                documents[name]["etag"] = source["etag"]
+    for target, (upload_chunks, delete_ids) in updates.items():
+        print(f"[{target}] {len(upload_chunks)} chunks to upload, {len(delete_ids)} to delete.")
+
+    # 7. Finish applying the changes, then save each target's manifest
+    if uploader is not None:
+        print(f"\nWaiting for uploads to '{INDEX_NAME}'...")
+        uploader.close()
+        print(f"Uploaded {uploader.uploaded} chunks in {uploader.requests} requests.")
+    for target, (upload_chunks, delete_ids) in updates.items():
+        if previous[target] is not None and not upload_chunks and not delete_ids:
+            print(f"\n[{target}] Index is up to date.")
+        elif target == "azure":
+            delete_azure_chunks(uploader.search_client, delete_ids)
+        else:
+            live_ids = {chunk_id for doc in manifests[target]["documents"].values() for chunk_id in doc["chunk_ids"]}
+            if previous[target] is None:
+                # Full rebuild: nothing from an earlier local index is reused
+                live_ids = set()
+            if target == "lexical":
+                update_lexical_index(args.lexical_index_dir, live_ids, upload_chunks)
+            else:
+                update_local_index(args.local_index_dir, live_ids, upload_chunks, chunk_vectors,
+                                   args.local_dtype, args.hnsw)
+        save_manifest(manifest_paths[target], manifests[target])
+        if target == "azure":
+            publish_build_stamp(manifests[target])
 
     print("\n-------------------------------------")
     print("Vector index build process completed successfully!")
     print("Your knowledge base is now indexed and searchable.")
     print("-------------------------------------")
-    
-    # Optional: Clean up downloaded files
-    # for pdf in pdf_files:
-    #     os.remove(pdf)
-    # os.rmdir(pdf_dir)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,134 @@
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+from dotenv import load_dotenv
+import torch
+from azure.storage.blob import BlobServiceClient
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+load_dotenv(dotenv_path=str(PROJECT_ROOT / ".env"), override=True)
+
+# Add project root to path so the API package can be imported
+sys.path.append(str(PROJECT_ROOT))
+
+# Configuration
+STORAGE_ACCOUNT_NAME = os.getenv("STORAGE_ACCOUNT_NAME", "clinicaldatalake25")
+SAS_TOKEN = os.getenv("SAS_TOKEN")
+MODEL_CONTAINER_NAME = "ml-models"
+EXPORTED_BLOB_NAME = "vision/vision_model.ts"
+DEFAULT_MODELS_DIR = PROJECT_ROOT / "src" / "api" / "models"
+
+# Precisions that can be baked into a frozen graph (bf16 relies on runtime autocast)
+EXPORTABLE_PRECISIONS = ("fp32", "int8_dynamic", "int8_static")
+# Largest probability difference allowed between the exported graph and the eager model
+DEFAULT_MAX_DIFF = 1e-3
+
+
+def require(value: str, name: str) -> str:
+    """Ensures required configuration values are present."""
+    if not value:
+        raise ValueError(f"Environment variable '{name}' is not set.")
+    return value
+
+
+def build_source_model(models_dir: Path, precision: str, calibration_dir: str):
+    """Builds the model exactly as VisionService would from the trained .pth weights."""
+    os.environ["MODELS_DIR"] = str(models_dir)
+    os.environ["VISION_PRECISION"] = precision
+    os.environ["VISION_USE_EXPORTED"] = "false"
+    if calibration_dir:
+        os.environ["VISION_CALIBRATION_DIR"] = calibration_dir
+
+    from src.api.services.vision_service import VisionService
+    service = VisionService()
+    if service.model is None:
+        raise FileNotFoundError(f"Trained weights not found at {service.model_path}.")
+    if service.device.type != "cpu":
+        raise RuntimeError("Export targets CPU inference. Run it on a CPU-only machine or hide the GPU.")
+    if service.precision != precision:
+        raise RuntimeError(f"Precision '{precision}' is not available here (fell back to '{service.precision}').")
+    return service
+
+
+def upload_artifact(local_path: Path):
+    """Uploads the exported artifact to the container AzureModelLoader syncs from."""
+    storage_account = require(STORAGE_ACCOUNT_NAME, "STORAGE_ACCOUNT_NAME")
+    sas_token = require(SAS_TOKEN, "SAS_TOKEN")
+
+    account_url = f"https://{storage_account}.blob.core.windows.net"
+    blob_service_client = BlobServiceClient(account_url=account_url, credential=sas_token)
+    blob_client = blob_service_client.get_blob_client(container=MODEL_CONTAINER_NAME, blob=EXPORTED_BLOB_NAME)
+
+    print(f"Uploading {local_path} to {MODEL_CONTAINER_NAME}/{EXPORTED_BLOB_NAME}...")
+    with open(local_path, "rb") as data:
+        blob_client.upload_blob(data, overwrite=True)
+    print("Upload complete.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the vision model as an inference-optimized TorchScript artifact.")
+    parser.add_argument("--models-dir", default=str(DEFAULT_MODELS_DIR), help="Folder containing vision_model.pth.")
+    parser.add_argument("--precision", default="fp32", choices=EXPORTABLE_PRECISIONS)
+    parser.add_argument("--calibration-dir", help="Sample X-rays for int8_static calibration.")
+    parser.add_argument("--no-channels-last", action="store_true", help="Export with contiguous (NCHW) layout.")
+    parser.add_argument("--max-diff", type=float, default=DEFAULT_MAX_DIFF,
+                        help="Fail the export if any probability differs from the eager model by more than this.")
+    parser.add_argument("--upload", action="store_true", help="Upload the artifact to Azure Blob Storage.")
+    args = parser.parse_args()
+
+    from src.api.core.model_artifacts import cached_file_sha256, export_torchscript, load_torchscript
+
+    models_dir = Path(args.models_dir)
+    channels_last = not args.no_channels_last
+    os.environ["VISION_CHANNELS_LAST"] = "true" if channels_last else "false"
+
+    print(f"Building {args.precision} vision model from {models_dir / 'vision_model.pth'}...")
+    service = build_source_model(models_dir, args.precision, args.calibration_dir)
+
+    output_path = models_dir / "vision_model.ts"
+    metadata = {
+        "format": "torchscript",
+        "precision": args.precision,
+        "device": "cpu",
+        "channels_last": channels_last,
+        "labels": service.labels,
+        "source_sha256": cached_file_sha256(service.model_path),
+        "torch_version": torch.__version__,
+        "exported_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+    # Exported next to the target and only moved into place once it passes the parity check
+    staged_path = output_path.with_name(output_path.name + ".tmp")
+    print(f"Tracing, freezing and optimizing -> {output_path}...")
+    export_torchscript(service.model, staged_path, metadata, channels_last=channels_last)
+
+    # The exported graph must agree with the eager model it came from
+    exported, _ = load_torchscript(staged_path, torch.device("cpu"))
+    example = torch.rand(2, 3, 224, 224)
+    if channels_last:
+        example = example.contiguous(memory_format=torch.channels_last)
+    with torch.no_grad():
+        max_diff = (torch.sigmoid(exported(example)) - torch.sigmoid(service.model(example))).abs().max().item()
+    print(f"Max probability difference vs eager model: {max_diff:.2e}")
+    if not max_diff <= args.max_diff:
+        staged_path.unlink(missing_ok=True)
+        print(f"Error: exported model deviates by more than {args.max_diff:.0e}. Nothing was written.")
+        sys.exit(1)
+    os.replace(staged_path, output_path)
+
+    start = time.perf_counter()
+    load_torchscript(output_path, torch.device("cpu"))
+    print(f"Artifact load time: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    if args.upload:
+        upload_artifact(output_path)
+
+    print("\n-------------------------------------")
+    print("Vision model export completed.")
+    print("-------------------------------------")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 from dotenv import load_dotenv
 from azure.identity import DefaultAzureCredential
@@ -7,15 +8,26 @@ from azure.storage.blob import BlobServiceClient
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
 load_dotenv(dotenv_path=str(PROJECT_ROOT / ".env"), override=True)
 
+# Add project root to path so the loader's blob names can be imported
+sys.path.append(str(PROJECT_ROOT))
+
+from src.api.core.model_loader import MODEL_CONTAINER_NAME, NO_SHOW_FEATURE_SCHEMA_BLOB, NO_SHOW_MODEL_BLOB
+
 # Configuration
 STORAGE_ACCOUNT_NAME = os.getenv("STORAGE_ACCOUNT_NAME", "clinicaldatalake25")
-MODEL_CONTAINER_NAME = "models"
 LOCAL_MODEL_PATH = os.path.join(PROJECT_ROOT, "notebooks", "no_show_model.pkl")
+LOCAL_FEATURE_SCHEMA_PATH = os.path.join(PROJECT_ROOT, "notebooks", "no_show_feature_schema.json")
 
+# Local file -> blob name, at the paths AzureModelLoader syncs from
+UPLOADS = {
+    LOCAL_MODEL_PATH: NO_SHOW_MODEL_BLOB,
+    LOCAL_FEATURE_SCHEMA_PATH: NO_SHOW_FEATURE_SCHEMA_BLOB,
+}
 
-def upload_model_to_blob(blob_service_client, container_name, local_file_path):
+
+def upload_model_to_blob(blob_service_client, container_name, local_file_path, blob_name=None):
     """
-    Uploads a single file to a specified blob container.
+    Uploads a single file to a specified blob container, as `blob_name` (default: the file name).
     """
     try:
         container_client = blob_service_client.create_container(container_name)
@@ -24,9 +36,10 @@ def upload_model_to_blob(blob_service_client, container_name, local_file_path):
         container_client = blob_service_client.get_container_client(container_name)
         print(f"Container '{container_name}' already exists.")
 
-    blob_client = container_client.get_blob_client(os.path.basename(local_file_path))
+    blob_name = blob_name or os.path.basename(local_file_path)
+    blob_client = container_client.get_blob_client(blob_name)
 
-    print(f"Uploading {local_file_path} to container {container_name}...")
+    print(f"Uploading {local_file_path} to {container_name}/{blob_name}...")
     with open(local_file_path, "rb") as data:
         blob_client.upload_blob(data, overwrite=True)
     print(f"{local_file_path} uploaded successfully.")
@@ -49,7 +62,14 @@ if __name__ == "__main__":
 
     blob_service_client = BlobServiceClient(account_url=storage_account_url, credential=credential)
 
-    upload_model_to_blob(blob_service_client, MODEL_CONTAINER_NAME, LOCAL_MODEL_PATH)
+    upload_model_to_blob(blob_service_client, MODEL_CONTAINER_NAME, LOCAL_MODEL_PATH, UPLOADS[LOCAL_MODEL_PATH])
+
+    # The feature schema must travel with the model it was fitted alongside
+    if os.path.exists(LOCAL_FEATURE_SCHEMA_PATH):
+        upload_model_to_blob(blob_service_client, MODEL_CONTAINER_NAME, LOCAL_FEATURE_SCHEMA_PATH,
+                             UPLOADS[LOCAL_FEATURE_SCHEMA_PATH])
+    else:
+        print(f"Feature schema not found at {LOCAL_FEATURE_SCHEMA_PATH}. Re-run training to generate it.")
 
     print("\n-------------------------------------")
     print("Model upload process completed.")
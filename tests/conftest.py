@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+# Add project root to path so the API package can be imported
+sys.path.append(str(PROJECT_ROOT))
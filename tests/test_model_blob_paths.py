@@ -0,0 +1,48 @@
+import os
+from src.api.core.model_loader import AzureModelLoader, OPTIONAL_ARTIFACTS, REQUIRED_ARTIFACTS
+from src.pipelines import upload_model_to_blob as uploader
+
+
+class FakeContainerClient:
+    def __init__(self, name):
+        self.name = name
+        self.uploaded = []
+
+    def get_blob_client(self, blob_name):
+        container = self
+
+        class FakeBlobClient:
+            def upload_blob(self, data, overwrite=False):
+                container.uploaded.append(blob_name)
+
+        return FakeBlobClient()
+
+
+class FakeBlobServiceClient:
+    def __init__(self):
+        self.containers = {}
+
+    def create_container(self, name):
+        raise RuntimeError("exists")
+
+    def get_container_client(self, name):
+        return self.containers.setdefault(name, FakeContainerClient(name))
+
+
+def test_uploads_land_where_the_loader_downloads():
+    synced = {**REQUIRED_ARTIFACTS, **OPTIONAL_ARTIFACTS}
+    assert uploader.MODEL_CONTAINER_NAME == AzureModelLoader().container_name
+    for local_path, blob_name in uploader.UPLOADS.items():
+        assert blob_name in synced
+        assert synced[blob_name] == os.path.basename(local_path)
+
+
+def test_upload_uses_the_given_blob_name(tmp_path):
+    local_file = tmp_path / "no_show_feature_schema.json"
+    local_file.write_text("{}")
+    client = FakeBlobServiceClient()
+
+    uploader.upload_model_to_blob(client, uploader.MODEL_CONTAINER_NAME, str(local_file),
+                                  uploader.UPLOADS[uploader.LOCAL_FEATURE_SCHEMA_PATH])
+
+    assert client.containers["ml-models"].uploaded == ["ops/no_show_feature_schema.json"]
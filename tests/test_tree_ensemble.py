@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+lgb = pytest.importorskip("lightgbm")
+
+from src.api.core.tree_ensemble import CompiledTreeEnsemble, compile_models
+
+
+def train_booster(params: dict, seed: int = 0):
+    """Booster on data with negatives, exact zeros and NaN, so splits land around 0 and ±kZeroThreshold."""
+    rng = np.random.default_rng(seed)
+    n = 4000
+    X = rng.normal(size=(n, 6))
+    X[:, 1] = np.where(rng.random(n) < 0.4, 0.0, X[:, 1])
+    X[:, 2] = rng.integers(-3, 3, n)
+    X[rng.random(X.shape) < 0.1] = np.nan
+    y = ((np.nan_to_num(X[:, 0]) > 0) ^ (X[:, 1] == 0) ^ (X[:, 2] < 0)).astype(int)
+    booster = lgb.train(
+        {"objective": "binary", "num_leaves": 31, "min_data_in_leaf": 5, "verbose": -1, **params},
+        lgb.Dataset(X, y),
+        num_boost_round=30,
+    )
+    return booster, X
+
+
+@pytest.mark.parametrize("params", [{}, {"zero_as_missing": True}, {"use_missing": False}])
+def test_single_rows_match_lightgbm(params):
+    booster, X = train_booster(params)
+    ensemble = CompiledTreeEnsemble.from_booster(booster)
+
+    assert ensemble.parity_error() <= 1e-9
+    rows = np.vstack([X[:300], [[0.0, -1e-36, 1e-36, -1.0000000180025095e-35, np.nan, -0.5]]])
+    actual = np.concatenate([ensemble.predict(row[None, :]) for row in rows])
+    np.testing.assert_allclose(actual, booster.predict(rows), rtol=0, atol=1e-12)
+
+
+def test_batches_use_lightgbm():
+    booster, X = train_booster({})
+    ensemble = CompiledTreeEnsemble.from_booster(booster)
+
+    np.testing.assert_array_equal(ensemble.predict(X[:50]), booster.predict(X[:50]))
+
+
+def test_compile_models_keeps_boosters_it_cannot_compile():
+    booster, _ = train_booster({})
+    rng = np.random.default_rng(1)
+    multiclass = lgb.train({"objective": "multiclass", "num_class": 3, "verbose": -1},
+                           lgb.Dataset(rng.normal(size=(300, 3)), rng.integers(0, 3, 300)), num_boost_round=3)
+
+    compiled = compile_models({"binary": booster, "multiclass": multiclass})
+
+    assert isinstance(compiled["binary"], CompiledTreeEnsemble)
+    assert compiled["multiclass"] is multiclass